@@ -0,0 +1,53 @@
+"""
+Compares two benchmark result files written by the benchmark scripts.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 10]
+
+Benchmarks whose p50 or p99 got slower, or whose throughput dropped, by more than the threshold percentage are
+marked as regressions, and the exit status is 1 if there are any.
+"""
+
+import argparse
+import json
+import sys
+
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main(baseline_path: str, candidate_path: str, threshold: float) -> int:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(candidate_path) as f:
+        candidate = json.load(f)
+    print(
+        f"{baseline.get('git_commit')} -> {candidate.get('git_commit')} "
+        f"({baseline['suite']})"
+    )
+    regressions = 0
+    for name, new in candidate["results"].items():
+        old = baseline["results"].get(name)
+        if not old or not old.get("count") or not new.get("count"):
+            print(f"{name:44} not comparable")
+            continue
+        p50 = change(old["p50_ms"], new["p50_ms"])
+        p99 = change(old["p99_ms"], new["p99_ms"])
+        throughput = change(old["throughput_rps"], new["throughput_rps"])
+        regressed = p50 > threshold or p99 > threshold or throughput < -threshold
+        regressions += regressed
+        print(
+            f"{name:44} p50 {p50:+7.1f}%  p99 {p99:+7.1f}%  "
+            f"throughput {throughput:+7.1f}%{'  REGRESSION' if regressed else ''}"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+    sys.exit(main(args.baseline, args.candidate, args.threshold))
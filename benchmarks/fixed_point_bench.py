@@ -0,0 +1,114 @@
+"""
+Compares the vectorized fixed-point amount conversion with a per-item Decimal baseline, and checks that both
+produce the same minor-unit amounts.
+
+Usage:
+    python -m benchmarks.fixed_point_bench --items 200000 --rounding half_even
+"""
+
+import argparse
+import random
+import time
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal, localcontext
+from typing import List
+
+import numpy as np
+
+from project.fixed_point import convert_minor, minor_units, scale_rates
+
+DECIMAL_ROUNDING = {
+    "half_even": ROUND_HALF_EVEN,
+    "half_up": ROUND_HALF_UP,
+    "down": ROUND_DOWN,
+}
+CURRENCIES = {
+    "USD": 1.0,
+    "EUR": 0.92,
+    "GBP": 0.79,
+    "JPY": 151.37,
+    "KRW": 1364.2,
+    "KWD": 0.3075,
+    "BHD": 0.377,
+    "CLF": 0.0342,
+    "VND": 25240.0,
+}
+
+
+def decimal_convert(
+    amounts: List[int],
+    rates: List[int],
+    scales: List[int],
+    base_exponents: List[int],
+    target_exponents: List[int],
+    rounding: str,
+) -> List[int]:
+    mode = DECIMAL_ROUNDING[rounding]
+    one = Decimal(1)
+    with localcontext() as context:
+        context.prec = 60
+        return [
+            int(
+                (Decimal(amount) * Decimal(rate))
+                .scaleb(target - base - scale)
+                .quantize(one, rounding=mode)
+            )
+            for amount, rate, scale, base, target in zip(
+                amounts, rates, scales, base_exponents, target_exponents
+            )
+        ]
+
+
+def main(items: int, rounding: str, seed: int) -> None:
+    rng = random.Random(seed)
+    codes = list(CURRENCIES)
+    bases = [rng.choice(codes) for _ in range(items)]
+    targets = [rng.choice(codes) for _ in range(items)]
+    amounts = np.array(
+        [rng.randint(-(10**12), 10**12) for _ in range(items)], dtype=np.int64
+    )
+    float_rates = np.array(
+        [CURRENCIES[target] / CURRENCIES[base] for base, target in zip(bases, targets)]
+    )
+    base_exponents = np.array([minor_units(code) for code in bases])
+    target_exponents = np.array([minor_units(code) for code in targets])
+
+    started = time.perf_counter()
+    rates, scales = scale_rates(float_rates, base_exponents, target_exponents)
+    fixed, fits = convert_minor(
+        amounts, rates, scales, base_exponents, target_exponents, rounding
+    )
+    fixed_elapsed = time.perf_counter() - started
+
+    args = [
+        values.tolist()
+        for values in (amounts, rates, scales, base_exponents, target_exponents)
+    ]
+    started = time.perf_counter()
+    expected = decimal_convert(*args, rounding)
+    decimal_elapsed = time.perf_counter() - started
+
+    mismatches = sum(
+        1
+        for got, want, ok in zip(fixed.tolist(), expected, fits.tolist())
+        if not ok or got != want
+    )
+    for name, elapsed in (("fixed_point", fixed_elapsed), ("decimal", decimal_elapsed)):
+        print(
+            f"{name:12} {elapsed * 1000:9.1f} ms  {items / elapsed:13,.0f} items/s  "
+            f"{elapsed / items * 1e9:8.1f} ns/item"
+        )
+    print(
+        f"speedup {decimal_elapsed / fixed_elapsed:.1f}x, "
+        f"{mismatches} of {items} results differ from Decimal ({rounding})"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument(
+        "--rounding", choices=list(DECIMAL_ROUNDING), default="half_even"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    main(args.items, args.rounding, args.seed)
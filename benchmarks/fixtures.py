@@ -0,0 +1,145 @@
+"""
+Shared setup for the service micro-benchmarks and the HTTP load test.
+
+The project reads its configuration from the environment when its modules are imported, so start_environment()
+must run before anything under project/ is imported: it starts the stub rate provider and points the service at
+it, and puts the rate history store in a scratch directory.
+"""
+
+import argparse
+import os
+import secrets
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import bcrypt
+import prisma
+import prisma.enums
+import prisma.models
+import uvicorn
+
+from benchmarks.stub_upstream import (
+    STUB_RATES,
+    StubRateProvider,
+    free_port,
+    start_stub_server,
+)
+
+BENCH_PASSWORD = "correct horse battery staple"
+
+
+def add_environment_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--db",
+        choices=("memory", "postgres"),
+        default="memory",
+        help="in-memory Prisma stand-in, or the real client against DATABASE_URL (use a scratch database)",
+    )
+    parser.add_argument("--upstream-latency", type=float, default=0.0)
+    parser.add_argument("--upstream-jitter", type=float, default=0.0)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--bcrypt-rounds", type=int, default=4)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--queries-per-user", type=int, default=500)
+    parser.add_argument(
+        "--output", default=None, help="write results to this JSON file"
+    )
+
+
+@dataclass
+class BenchEnvironment:
+    provider: StubRateProvider
+    upstream: uvicorn.Server
+    workdir: str
+    user_ids: List[str] = field(default_factory=list)
+    user_emails: List[str] = field(default_factory=list)
+    user_token: str = ""
+    admin_token: str = ""
+
+
+async def start_environment(args: argparse.Namespace) -> BenchEnvironment:
+    """
+    Starts the stub rate provider and configures the environment the project modules read on import.
+    """
+    provider = StubRateProvider(
+        latency=args.upstream_latency,
+        jitter=args.upstream_jitter,
+        error_rate=args.upstream_error_rate,
+    )
+    port = free_port()
+    upstream = await start_stub_server(provider, port)
+    workdir = tempfile.mkdtemp(prefix="currency-bench-")
+    os.environ["RATES_API_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["RATES_API_KEY"] = "stub"
+    os.environ["RATE_HISTORY_DIR"] = os.path.join(workdir, "rate_history")
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # The load generator is one client; measure the routes rather than its rate limit.
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    return BenchEnvironment(provider=provider, upstream=upstream, workdir=workdir)
+
+
+def seed_rate_history() -> None:
+    """
+    Writes a day of hourly rate snapshots to the (not yet opened) history store.
+    """
+    from project.rate_engine import RateMatrix
+    from project.rate_history_store import rate_history_store
+
+    now = datetime.now()
+    rate_history_store.open()
+    for hours_ago in range(24, 0, -1):
+        rate_history_store.append(
+            RateMatrix("USD", STUB_RATES, now - timedelta(hours=hours_ago))
+        )
+    rate_history_store.close()
+
+
+async def seed_users(env: BenchEnvironment, users: int, queries_per_user: int) -> None:
+    """
+    Creates users (the first one an admin) with conversion history, and a bearer token for the first and last.
+    """
+    hashed = bcrypt.hashpw(
+        BENCH_PASSWORD.encode(), bcrypt.gensalt(int(os.environ["BCRYPT_ROUNDS"]))
+    ).decode()
+    # Timezone-aware, like the rows Prisma returns and the ones the query recorder writes.
+    now = datetime.now(timezone.utc)
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    run = os.path.basename(env.workdir)
+    for i in range(users):
+        user = await prisma.models.User.prisma().create(
+            data={
+                "email": f"bench-{run}-{i}@example.com",
+                "password": hashed,
+                "role": (
+                    prisma.enums.UserRole.ADMIN
+                    if i == 0
+                    else prisma.enums.UserRole.USER
+                ),
+            }
+        )
+        env.user_ids.append(user.id)
+        env.user_emails.append(user.email)
+        await prisma.models.CurrencyQuery.prisma().create_many(
+            data=[
+                {
+                    "userId": user.id,
+                    "baseCurrency": "USD",
+                    "targetCurrency": "EUR",
+                    "exchangeRate": 0.9,
+                    "timestamp": now - timedelta(minutes=j),
+                }
+                for j in range(queries_per_user)
+            ]
+        )
+    env.admin_token = await create_token(env.user_ids[0], expires_at)
+    env.user_token = await create_token(env.user_ids[-1], expires_at)
+
+
+async def create_token(user_id: str, expires_at: datetime) -> str:
+    token = secrets.token_hex(16)
+    await prisma.models.AuthToken.prisma().create(
+        data={"userId": user_id, "token": token, "expiresAt": expires_at}
+    )
+    return token
@@ -0,0 +1,81 @@
+"""
+Compares a fresh httpx.AsyncClient per upstream call against the shared pooled client.
+
+Usage:
+    python -m benchmarks.http_client_bench --requests 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, List
+
+import httpx
+
+from benchmarks.results import percentile
+from benchmarks.stub_upstream import StubRateProvider, free_port, start_stub_server
+from project.http_client import create_http_client
+
+
+async def drive(
+    call: Callable[[], Awaitable[None]], requests: int, concurrency: int
+) -> dict:
+    latencies: List[float] = []
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "throughput_rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+    }
+
+
+async def main(requests: int, concurrency: int, latency: float) -> None:
+    port = free_port()
+    server = await start_stub_server(StubRateProvider(latency=latency), port)
+    url = f"http://127.0.0.1:{port}/latest?access_key=stub&base=USD"
+
+    async def client_per_call() -> None:
+        async with httpx.AsyncClient() as client:
+            (await client.get(url)).json()
+
+    shared = create_http_client()
+
+    async def pooled_client() -> None:
+        (await shared.get(url)).json()
+
+    try:
+        for name, call in (
+            ("client_per_call", client_per_call),
+            ("pooled_client", pooled_client),
+        ):
+            result = await drive(call, requests, concurrency)
+            print(
+                f"{name:16} {result['throughput_rps']:9.1f} req/s  "
+                f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  "
+                f"p99 {result['p99_ms']:7.2f} ms"
+            )
+    finally:
+        await shared.aclose()
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.latency))
@@ -0,0 +1,346 @@
+"""
+HTTP load generator for every route in project/server.py.
+
+Starts the stub rate provider and the app under uvicorn in a child process, seeds users, history and rate
+snapshots, then drives each route in turn with a fixed number of concurrent clients over a pooled keep-alive
+connection. Reports throughput and p50/p95/p99 latency per route and optionally writes them to a JSON file.
+For /rates/stream the latency is the time to the first (snapshot) event.
+
+Usage:
+    python -m benchmarks.load_test --requests 2000 --concurrency 32 --output load.json [--filter convert]
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import logging
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.fixtures import (
+    BENCH_PASSWORD,
+    BenchEnvironment,
+    add_environment_arguments,
+    create_token,
+    seed_rate_history,
+    seed_users,
+    start_environment,
+)
+from benchmarks.results import format_row, summarize, write_results
+from benchmarks.stub_database import install_in_memory_database
+from benchmarks.stub_upstream import free_port, start_stub_server
+
+Request = Callable[[httpx.AsyncClient, int], Awaitable[int]]
+
+
+async def drive(
+    port: int,
+    route: str,
+    env: BenchEnvironment,
+    logout_tokens: List[str],
+    indices: range,
+    concurrency: int,
+) -> Tuple[List[float], Counter, int]:
+    """
+    Sends one request per index to a route from concurrency concurrent workers sharing a connection pool.
+
+    Returns:
+        Tuple[List[float], Counter, int]: The latency of every answered request, their status codes, and the number
+        of failed (transport error or status >= 400) requests.
+    """
+    request = routes(env, logout_tokens)[route]
+    remaining = iter(indices)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    errors = 0
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        for i in remaining:
+            started = time.perf_counter()
+            try:
+                status = await request(client, i)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+            if status >= 400:
+                errors += 1
+
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30
+    ) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return latencies, statuses, errors
+
+
+def drive_in_process(*args) -> Tuple[List[float], Counter, int]:
+    return asyncio.run(drive(*args))
+
+
+def routes(env: BenchEnvironment, logout_tokens: List[str]) -> Dict[str, Request]:
+    user_id = env.user_ids[-1]
+    user_auth = {"Authorization": f"Bearer {env.user_token}"}
+    admin_auth = {"Authorization": f"Bearer {env.admin_token}"}
+    now = datetime.now()
+    window = {
+        "start": (now - timedelta(days=1)).isoformat(),
+        "end": now.isoformat(),
+    }
+    run = f"{int(time.time())}"
+    bulk_csv = "amount,base_currency,target_currency\n" + "".join(
+        f"{i}.5,USD,{'EUR' if i % 2 else 'JPY'}\n" for i in range(1000)
+    )
+
+    async def get(client, url, **kwargs) -> int:
+        return (await client.get(url, **kwargs)).status_code
+
+    async def post(client, url, **kwargs) -> int:
+        return (await client.post(url, **kwargs)).status_code
+
+    async def put(client, url, **kwargs) -> int:
+        return (await client.put(url, **kwargs)).status_code
+
+    async def rate_stream(client, i) -> int:
+        async with client.stream("GET", "/rates/stream/USD?targets=EUR,JPY") as r:
+            async for chunk in r.aiter_bytes():
+                if b"\n\n" in chunk:
+                    break
+            return r.status_code
+
+    async def history_stream(client, i) -> int:
+        async with client.stream(
+            "GET", "/user/history/stream", params={"user_id": user_id}
+        ) as r:
+            async for _ in r.aiter_bytes():
+                pass
+            return r.status_code
+
+    return {
+        "GET /convert/{base}/{targets}": lambda c, i: get(c, "/convert/USD/EUR,JPY"),
+        "GET /convert/{base}/all": lambda c, i: get(c, "/convert/USD/all"),
+        "GET /convert/{base}/{targets} (authenticated)": lambda c, i: get(
+            c, "/convert/USD/EUR,JPY", headers=user_auth
+        ),
+        "GET /convert/{base}/{targets}?as_of": lambda c, i: get(
+            c,
+            "/convert/USD/EUR,JPY",
+            params={"as_of": (now - timedelta(hours=3)).isoformat()},
+        ),
+        "POST /batch_convert": lambda c, i: post(
+            c,
+            "/batch_convert",
+            params={"base_currency": "USD"},
+            json=["EUR", "JPY", "GBP"],
+        ),
+        "POST /convert_amounts": lambda c, i: post(
+            c,
+            "/convert_amounts",
+            params={"base_currency": "USD"},
+            json={
+                "amounts": [1999, 250000, 5],
+                "target_currencies": ["EUR", "JPY", "KWD"],
+            },
+        ),
+        "POST /bulk_convert": lambda c, i: post(
+            c, "/bulk_convert", content=bulk_csv, headers={"content-type": "text/csv"}
+        ),
+        "GET /rates/stream/{base}": rate_stream,
+        "GET /rates/history/{base}/{target}": lambda c, i: get(
+            c, "/rates/history/USD/EUR", params=window
+        ),
+        "GET /user/history": lambda c, i: get(
+            c, "/user/history", params={"user_id": user_id}
+        ),
+        "GET /user/history/stream": history_stream,
+        "GET /user/history/summary": lambda c, i: get(
+            c, "/user/history/summary", params={"user_id": user_id}
+        ),
+        "POST /auth/login": lambda c, i: post(
+            c,
+            "/auth/login",
+            params={
+                "email": env.user_emails[i % len(env.user_emails)],
+                "password": BENCH_PASSWORD,
+            },
+        ),
+        "POST /auth/logout": lambda c, i: post(
+            c,
+            "/auth/logout",
+            headers={"Authorization": f"Bearer {logout_tokens[i]}"},
+        ),
+        "POST /auth/register": lambda c, i: post(
+            c,
+            "/auth/register",
+            params={
+                "email": f"register-{run}-{i}@example.com",
+                "password": BENCH_PASSWORD,
+            },
+            json={},
+        ),
+        "POST /user": lambda c, i: post(
+            c,
+            "/user",
+            params={
+                "email": f"profile-{run}-{i}@example.com",
+                "password": BENCH_PASSWORD,
+                "username": f"user{i}",
+                "role": "USER",
+            },
+        ),
+        "PUT /user/{id}": lambda c, i: put(
+            c, f"/user/{user_id}", params={"email": env.user_emails[-1]}, json={}
+        ),
+        "GET /admin/query_recorder": lambda c, i: get(
+            c, "/admin/query_recorder", headers=admin_auth
+        ),
+    }
+
+
+async def serve(args: argparse.Namespace, port: int, connection) -> None:
+    env = await start_environment(args)
+    seed_rate_history()
+
+    # Imported only now: the project modules read the environment set up above.
+    import project.database
+    import project.server
+
+    if args.db == "memory":
+        install_in_memory_database(project.database.database.client)
+    if not args.log_errors:
+        logging.getLogger("project").setLevel(logging.CRITICAL)
+    server = await start_stub_server(project.server.app, port)
+    await seed_users(env, args.users, args.queries_per_user)
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    logout_tokens = [
+        await create_token(env.user_ids[-1], expires_at)
+        for _ in range(args.requests + args.warmup)
+    ]
+    connection.send(
+        (dataclasses.replace(env, provider=None, upstream=None), logout_tokens)
+    )
+    # Serve until the parent is done.
+    await asyncio.get_running_loop().run_in_executor(None, connection.recv)
+    server.should_exit = True
+    env.upstream.should_exit = True
+    await asyncio.sleep(0.5)
+
+
+def run_server(args: argparse.Namespace, port: int, connection) -> None:
+    asyncio.run(serve(args, port, connection))
+
+
+async def main(args: argparse.Namespace) -> None:
+    # The app runs in its own process so the load generator does not compete with it for the event loop.
+    port = free_port()
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.get_context("spawn").Process(
+        target=run_server, args=(args, port, child)
+    )
+    process.start()
+    env, logout_tokens = await asyncio.get_running_loop().run_in_executor(
+        None, parent.recv
+    )
+
+    selected = [
+        name
+        for name in routes(env, logout_tokens)
+        if not args.filter or args.filter in name
+    ]
+    results = {}
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(
+        args.clients, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        if args.clients > 1:
+            # Start the worker processes before anything is timed.
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(pool, time.sleep, 0.1)
+                    for _ in range(args.clients)
+                )
+            )
+        for name in selected:
+            await drive(port, name, env, logout_tokens, range(args.warmup), 1)
+            # Each client process takes an interleaved share of the request indices and of the concurrency.
+            shares = [
+                (
+                    port,
+                    name,
+                    env,
+                    logout_tokens,
+                    range(args.warmup + k, args.warmup + args.requests, args.clients),
+                    max(1, args.concurrency // args.clients),
+                )
+                for k in range(args.clients)
+            ]
+            started = time.perf_counter()
+            if args.clients == 1:
+                outcomes = [await drive(*shares[0])]
+            else:
+                outcomes = await asyncio.gather(
+                    *(
+                        loop.run_in_executor(pool, drive_in_process, *share)
+                        for share in shares
+                    )
+                )
+            elapsed = time.perf_counter() - started
+            statuses: Counter = Counter()
+            for _, share_statuses, _ in outcomes:
+                statuses.update(share_statuses)
+            results[name] = summarize(
+                [latency for latencies, _, _ in outcomes for latency in latencies],
+                elapsed,
+                sum(errors for _, _, errors in outcomes),
+            )
+            results[name]["status_codes"] = {
+                str(code): n for code, n in sorted(statuses.items())
+            }
+            print(format_row(name, results[name]))
+
+    parent.send("stop")
+    process.join(10)
+    if args.output:
+        write_results(
+            args.output,
+            "load_test",
+            {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "filter", "log_errors")
+            },
+            results,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_environment_arguments(parser)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=1,
+        help="load generator processes sharing the concurrency, for machines with spare cores",
+    )
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument(
+        "--filter", default=None, help="only drive routes whose name contains this"
+    )
+    parser.add_argument(
+        "--log-errors",
+        action="store_true",
+        help="log the app's request errors instead of only counting them",
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""
+Measures /convert service latency while a concurrent login load verifies bcrypt passwords.
+
+"inline" calls bcrypt.checkpw directly on the event loop, as the services did before; "pool" goes through the
+password hashing pool.
+
+Usage:
+    python -m benchmarks.password_hashing_bench --logins 200 --login-concurrency 20 --rounds 12
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+import bcrypt
+
+import project.convert_currency_service
+from benchmarks.results import percentile
+from benchmarks.stub_upstream import STUB_RATES
+from project.password_hashing import PasswordHasher
+
+
+async def stub_rates(base: str) -> dict:
+    return {code: rate / STUB_RATES[base] for code, rate in STUB_RATES.items()}
+
+
+async def measure(mode: str, logins: int, concurrency: int, rounds: int) -> dict:
+    hashed = bcrypt.hashpw(b"correct horse", bcrypt.gensalt(rounds)).decode()
+    hasher = PasswordHasher("thread", concurrency, logins, rounds)
+    remaining = iter(range(logins))
+    done = asyncio.Event()
+
+    async def login_worker() -> None:
+        for _ in remaining:
+            if mode == "inline":
+                bcrypt.checkpw(b"correct horse", hashed.encode())
+                await asyncio.sleep(0)
+            else:
+                await hasher.verify("correct horse", hashed)
+
+    async def convert_probe(latencies: List[float]) -> None:
+        # Latency is measured from when the request should have started, so time spent waiting for a blocked
+        # event loop is included just as a real client would see it.
+        while not done.is_set():
+            due = time.perf_counter() + 0.005
+            await asyncio.sleep(0.005)
+            await project.convert_currency_service.convert_currency("USD", "all")
+            latencies.append(time.perf_counter() - due)
+
+    latencies: List[float] = []
+    probe = asyncio.create_task(convert_probe(latencies))
+    started = time.perf_counter()
+    await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe
+    hasher.shutdown()
+    return {
+        "logins_per_s": logins / elapsed,
+        "convert_p50_ms": percentile(latencies, 50) * 1000,
+        "convert_p99_ms": percentile(latencies, 99) * 1000,
+        "convert_max_ms": max(latencies) * 1000,
+        "convert_samples": len(latencies),
+    }
+
+
+async def main(logins: int, concurrency: int, rounds: int) -> None:
+    project.convert_currency_service.rate_refresher.loader = stub_rates
+    await project.convert_currency_service.rate_refresher.refresh_once()
+    for mode in ("inline", "pool"):
+        result = await measure(mode, logins, concurrency, rounds)
+        print(
+            f"{mode:7} {result['logins_per_s']:7.1f} logins/s  /convert p50 "
+            f"{result['convert_p50_ms']:7.2f} ms  p99 {result['convert_p99_ms']:7.2f} ms  "
+            f"max {result['convert_max_ms']:7.2f} ms  ({result['convert_samples']} samples)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.login_concurrency, args.rounds))
@@ -0,0 +1,87 @@
+"""
+Summary statistics and the JSON results file shared by the benchmark scripts.
+
+Every run writes one file of the form::
+
+    {
+        "suite": "load_test",
+        "started_at": "2024-05-01T12:00:00+00:00",
+        "git_commit": "abc1234",
+        "python": "3.11.7",
+        "platform": "Linux-6.1-x86_64",
+        "config": {...},
+        "results": {"GET /convert/{base}/{targets}": {"throughput_rps": ..., "p50_ms": ..., ...}, ...}
+    }
+
+so two runs can be diffed with ``python -m benchmarks.compare``.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> dict:
+    """
+    Summarizes per-operation latencies (in seconds) measured over a run that took elapsed seconds.
+    """
+    if not latencies:
+        return {"count": 0, "errors": errors}
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+def format_row(name: str, result: dict) -> str:
+    if not result.get("count"):
+        return f"{name:44} no samples ({result.get('errors', 0)} errors)"
+    return (
+        f"{name:44} {result['throughput_rps']:9.1f}/s  p50 {result['p50_ms']:8.2f} ms  "
+        f"p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+        f"errors {result['errors']}"
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: str, suite: str, config: dict, results: Dict[str, dict]):
+    """
+    Writes a run's results and enough context to tell runs apart.
+    """
+    document = {
+        "suite": suite,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
@@ -0,0 +1,220 @@
+"""
+Micro-benchmarks for the service functions in project/, run against the stub rate provider and, by default, the
+in-memory Prisma stand-in.
+
+Each benchmark calls one service function sequentially after a warmup and reports throughput and latency
+percentiles. Rates come from a snapshot refreshed once from the stub before the run, as in production.
+
+Usage:
+    python -m benchmarks.service_bench --iterations 2000 --output service.json [--filter convert]
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+from benchmarks.fixtures import (
+    BENCH_PASSWORD,
+    add_environment_arguments,
+    create_token,
+    seed_rate_history,
+    seed_users,
+    start_environment,
+)
+from benchmarks.results import format_row, summarize, write_results
+from benchmarks.stub_database import install_in_memory_database
+
+Call = Callable[[int], Awaitable[object]]
+
+
+async def measure(call: Call, iterations: int, warmup: int) -> dict:
+    for i in range(warmup):
+        try:
+            await call(i)
+        except Exception:
+            pass
+    latencies: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(warmup, warmup + iterations):
+        op_started = time.perf_counter()
+        try:
+            await call(i)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - op_started)
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def bulk_body(rows: int) -> bytes:
+    lines = ["amount,base_currency,target_currency"]
+    lines += [f"{i % 1000}.25,USD,{'EUR' if i % 2 else 'JPY'}" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def main(args: argparse.Namespace) -> None:
+    env = await start_environment(args)
+
+    # Imported only now: the project modules read the environment set up above.
+    from project.database import database
+
+    if args.db == "memory":
+        install_in_memory_database(database.client)
+    await database.ensure_connected()
+    seed_rate_history()
+    await seed_users(env, args.users, args.queries_per_user)
+
+    import project.authenticate_user_service as authenticate
+    import project.batch_convert_currency_service as batch
+    import project.bulk_convert_service as bulk
+    import project.convert_amounts_service as amounts
+    import project.convert_currency_service as convert
+    import project.create_user_profile_service as create_profile
+    import project.logout_user_service as logout
+    import project.rate_history_service as rate_history
+    import project.register_user_service as register
+    import project.update_user_profile_service as update_profile
+    import project.user_history_summary_service as summary
+    import project.view_user_history_service as history
+    from project.auth_token_cache import auth_token_cache
+    from project.currency_query_recorder import query_recorder
+    from project.http_client import close_http_client, start_http_client
+    from project.rate_history_store import rate_history_store
+
+    await start_http_client()
+    rate_history_store.open()
+    await convert.rate_refresher.refresh_once()
+    await query_recorder.start()
+
+    user_id = env.user_ids[-1]
+    now = datetime.now()
+    csv_rows = bulk_body(1000)
+    batch_request = batch.BatchConversionRequest(
+        target_currencies=["EUR", "JPY", "GBP"] * 333 + ["CHF"],
+        amounts=[float(i) for i in range(1000)],
+        base_currencies=["USD", "EUR"] * 500,
+    )
+    amounts_request = amounts.AmountConversionRequest(
+        amounts=list(range(1000)),
+        target_currencies=["EUR", "JPY", "GBP"] * 333 + ["CHF"],
+        base_currencies=["USD", "EUR"] * 500,
+    )
+    etag_all, _ = await convert.convert_currency_encoded("USD", "all")
+    run = f"{int(time.time())}"
+    logout_tokens: List[str] = []
+
+    async def run_bulk(_: int) -> None:
+        async def body():
+            yield csv_rows
+
+        matrix = await convert.rate_refresher.get_snapshot()
+        async for _ in await bulk.bulk_convert(body(), "csv", matrix):
+            pass
+
+    async def run_stream(_: int) -> None:
+        async for _ in history.stream_user_history(user_id):
+            pass
+
+    async def run_logout(i: int) -> None:
+        await logout.logout_user(logout_tokens[i])
+
+    benchmarks: Dict[str, Call] = {
+        "convert_currency[USD->EUR,JPY]": lambda i: convert.convert_currency(
+            "USD", "EUR,JPY"
+        ),
+        "convert_currency[USD->all]": lambda i: convert.convert_currency("USD", "all"),
+        "convert_currency[recorded]": lambda i: convert.convert_currency(
+            "USD", "EUR,JPY", user_id
+        ),
+        "convert_currency[as_of]": lambda i: convert.convert_currency(
+            "USD", "EUR,JPY", as_of=now - timedelta(hours=3)
+        ),
+        "convert_currency_encoded[USD->all]": lambda i: convert.convert_currency_encoded(
+            "USD", "all"
+        ),
+        "convert_currency_encoded[USD->all, 304]": lambda i: convert.convert_currency_encoded(
+            "USD", "all", if_none_match=etag_all
+        ),
+        "fetch_exchange_rate": lambda i: convert.fetch_exchange_rate(
+            "EUR", ["USD", "JPY"]
+        ),
+        "fetch_all_exchange_rates[upstream]": lambda i: convert.fetch_all_exchange_rates(
+            "USD"
+        ),
+        "batch_convert_currency[3 targets]": lambda i: batch.batch_convert_currency(
+            "USD", ["EUR", "JPY", "GBP"]
+        ),
+        "batch_convert_currency[1000 amounts]": lambda i: batch.batch_convert_currency(
+            "USD", batch_request
+        ),
+        "convert_amounts[1000 minor-unit amounts]": lambda i: amounts.convert_amounts(
+            "USD", amounts_request
+        ),
+        "bulk_convert[1000 csv rows]": run_bulk,
+        "view_user_history[page]": lambda i: history.view_user_history(user_id),
+        "stream_user_history": run_stream,
+        "view_user_history_summary": lambda i: summary.view_user_history_summary(
+            user_id
+        ),
+        "get_rate_history_stats": lambda i: rate_history.get_rate_history_stats(
+            "USD", "EUR", now - timedelta(days=1), now
+        ),
+        "authenticate_user": lambda i: authenticate.authenticate_user(
+            env.user_emails[i % len(env.user_emails)], BENCH_PASSWORD
+        ),
+        "auth_token_cache.resolve": lambda i: auth_token_cache.resolve(env.user_token),
+        "register_user": lambda i: register.register_user(
+            f"register-{run}-{i}@example.com", BENCH_PASSWORD, "USER"
+        ),
+        "create_user_profile": lambda i: create_profile.create_user_profile(
+            f"profile-{run}-{i}@example.com", BENCH_PASSWORD, f"user{i}", "USER"
+        ),
+        "update_user_profile": lambda i: update_profile.update_user_profile(
+            user_id, None, None, None
+        ),
+        "logout_user": run_logout,
+    }
+    selected = {
+        name: call
+        for name, call in benchmarks.items()
+        if not args.filter or args.filter in name
+    }
+    if "logout_user" in selected:
+        expires_at = datetime.utcnow() + timedelta(days=1)
+        for _ in range(args.iterations + args.warmup):
+            logout_tokens.append(await create_token(user_id, expires_at))
+
+    results = {}
+    for name, call in selected.items():
+        results[name] = await measure(call, args.iterations, args.warmup)
+        print(format_row(name, results[name]))
+
+    await query_recorder.stop()
+    await close_http_client()
+    rate_history_store.close()
+    env.upstream.should_exit = True
+    if args.output:
+        write_results(
+            args.output,
+            "service_bench",
+            {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "filter")
+            },
+            results,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_environment_arguments(parser)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument(
+        "--filter", default=None, help="only run benchmarks whose name contains this"
+    )
+    asyncio.run(main(parser.parse_args()))
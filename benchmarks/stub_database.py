@@ -0,0 +1,338 @@
+"""
+In-memory stand-in for the Prisma client, for benchmarks only.
+
+install() replaces the prisma() accessor of every generated model with an in-memory table implementing the
+subset of the query API the services use (find_unique/find_first/find_many/count, create/create_many,
+update/upsert, delete/delete_many, include of the relations below, and where clauses built from equality,
+gt/gte/lt/lte/in/not, AND and OR), plus the client's tx() and the raw statements of project/conversion_rollups.py.
+Benchmarks then measure the service code itself rather than a database.
+Lookups on id, email, token and userId go through hash indexes, so table size does not skew the results.
+
+Pass --db postgres to the benchmark scripts to run against the real client and DATABASE_URL instead.
+"""
+
+import contextlib
+import copy
+import types
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+
+INDEXED_FIELDS = ("id", "email", "token", "userId")
+
+# (model, relation) -> (related model, local field, related field, to-many)
+RELATIONS = {
+    ("AuthToken", "User"): ("User", "userId", "id", False),
+    ("CurrencyQuery", "User"): ("User", "userId", "id", False),
+    ("User", "CurrencyQueries"): ("CurrencyQuery", "id", "userId", True),
+    ("User", "AuthToken"): ("AuthToken", "id", "userId", True),
+    ("ExternalAPI", "RateLimits"): (
+        "ExternalAPIRateLimit",
+        "id",
+        "externalApiId",
+        True,
+    ),
+    ("ExternalAPIRateLimit", "ExternalAPI"): (
+        "ExternalAPI",
+        "externalApiId",
+        "id",
+        False,
+    ),
+}
+
+
+def _defaults(model: str) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    values = {"id": str(uuid.uuid4()), "createdAt": now, "updatedAt": now}
+    if model == "User":
+        values.update(role=prisma.enums.UserRole.USER, lastLoginAt=None)
+    elif model in ("CurrencyQuery", "LogEntry"):
+        values["timestamp"] = now
+    return values
+
+
+class Record(types.SimpleNamespace):
+    """
+    A row. Iterating yields (field, value) pairs, like a pydantic model, so rows can be passed to response models.
+    """
+
+    def __iter__(self):
+        return iter(vars(self).items())
+
+
+def _matches(record: Record, where: Optional[Dict]) -> bool:
+    for field, condition in (where or {}).items():
+        if field == "AND":
+            if not all(_matches(record, clause) for clause in condition):
+                return False
+        elif field == "OR":
+            if not any(_matches(record, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = getattr(record, field, None)
+            for op, operand in condition.items():
+                if op == "equals" and value != operand:
+                    return False
+                if op == "not" and value == operand:
+                    return False
+                if op == "in" and value not in operand:
+                    return False
+                if op in ("gt", "gte", "lt", "lte") and value is None:
+                    return False
+                if op == "gt" and not value > operand:
+                    return False
+                if op == "gte" and not value >= operand:
+                    return False
+                if op == "lt" and not value < operand:
+                    return False
+                if op == "lte" and not value <= operand:
+                    return False
+        elif getattr(record, field, None) != condition:
+            return False
+    return True
+
+
+class InMemoryTable:
+    def __init__(self, database: "InMemoryDatabase", model: str):
+        self.database = database
+        self.model = model
+        self.rows: Dict[str, Record] = {}
+        self.indexes: Dict[str, Dict[Any, Dict[str, Record]]] = {
+            field: {} for field in INDEXED_FIELDS
+        }
+        # CurrencyQueryRollup rows by their (userId, baseCurrency, targetCurrency) key.
+        self.rollups: Dict[tuple, Record] = {}
+
+    def _index(self, record: Record) -> None:
+        for field, index in self.indexes.items():
+            value = getattr(record, field, None)
+            if value is not None:
+                index.setdefault(value, {})[record.id] = record
+
+    def _unindex(self, record: Record) -> None:
+        for field, index in self.indexes.items():
+            value = getattr(record, field, None)
+            if value is not None:
+                index.get(value, {}).pop(record.id, None)
+
+    def _candidates(self, where: Optional[Dict]) -> List[Record]:
+        for field in INDEXED_FIELDS:
+            value = (where or {}).get(field)
+            if value is not None and not isinstance(value, dict):
+                return list(self.indexes[field].get(value, {}).values())
+        return list(self.rows.values())
+
+    def _include(self, record: Record, include: Optional[Dict]) -> Record:
+        if not include:
+            return record
+        record = copy.copy(record)
+        for relation, wanted in include.items():
+            if not wanted:
+                continue
+            model, local, remote, many = RELATIONS[(self.model, relation)]
+            related = self.database.table(model)._select(
+                {remote: getattr(record, local)}
+            )
+            setattr(record, relation, related if many else next(iter(related), None))
+        return record
+
+    def _select(self, where, order=None, take=None, skip=None) -> List[Record]:
+        rows = [row for row in self._candidates(where) if _matches(row, where)]
+        orders = order if isinstance(order, list) else [order] if order else []
+        for clause in reversed(orders):
+            ((field, direction),) = clause.items()
+            rows.sort(key=lambda row: getattr(row, field), reverse=direction == "desc")
+        if skip:
+            rows = rows[skip:]
+        if take is not None:
+            rows = rows[:take]
+        return rows
+
+    async def find_unique(self, where, include=None, **kwargs):
+        rows = self._select(where, take=1)
+        return self._include(rows[0], include) if rows else None
+
+    async def find_first(self, where=None, include=None, order=None, **kwargs):
+        rows = self._select(where, order=order, take=1)
+        return self._include(rows[0], include) if rows else None
+
+    async def find_many(
+        self, where=None, include=None, order=None, take=None, skip=None, **kwargs
+    ):
+        return [
+            self._include(row, include)
+            for row in self._select(where, order=order, take=take, skip=skip)
+        ]
+
+    async def count(self, where=None, **kwargs) -> int:
+        return len(self._select(where))
+
+    async def create(self, data, include=None, **kwargs):
+        values = _defaults(self.model)
+        values.update(data)
+        record = Record(**values)
+        self.rows[record.id] = record
+        self._index(record)
+        return self._include(record, include)
+
+    async def create_many(self, data, skip_duplicates=False, **kwargs) -> int:
+        for values in data:
+            await self.create(values)
+        return len(data)
+
+    async def update(self, where, data, include=None, **kwargs):
+        rows = self._select(where, take=1)
+        if not rows:
+            return None
+        record = rows[0]
+        self._unindex(record)
+        for field, value in data.items():
+            setattr(record, field, value)
+        record.updatedAt = datetime.now(timezone.utc)
+        self._index(record)
+        return self._include(record, include)
+
+    async def upsert(self, where, data, include=None, **kwargs):
+        if self._select(where, take=1):
+            return await self.update(where, data["update"], include=include)
+        return await self.create(data["create"], include=include)
+
+    async def delete(self, where, **kwargs):
+        rows = self._select(where, take=1)
+        if not rows:
+            return None
+        self._unindex(rows[0])
+        return self.rows.pop(rows[0].id)
+
+    async def delete_many(self, where=None, **kwargs) -> int:
+        rows = self._select(where)
+        for record in rows:
+            self._unindex(record)
+            del self.rows[record.id]
+        return len(rows)
+
+
+class InMemoryDatabase:
+    def __init__(self):
+        self.tables: Dict[str, InMemoryTable] = {}
+
+    def _merge_rollup(self, key, values: Dict) -> None:
+        table = self.table("CurrencyQueryRollup")
+        existing = table.rollups.get(key)
+        if existing is None:
+            record = Record(**values)
+            record.id = "|".join(key)
+            table.rollups[key] = table.rows[record.id] = record
+            table._index(record)
+            return
+        existing.count += values["count"]
+        existing.sumRate += values["sumRate"]
+        existing.minRate = min(existing.minRate, values["minRate"])
+        existing.maxRate = max(existing.maxRate, values["maxRate"])
+        existing.firstUsedAt = min(existing.firstUsedAt, values["firstUsedAt"])
+        existing.lastUsedAt = max(existing.lastUsedAt, values["lastUsedAt"])
+
+    async def execute_raw(self, query: str, *params) -> int:
+        """
+        Runs the rollup checkpoint, rebuild, lock and reset statements of project/conversion_rollups.py.
+        """
+        if query.startswith("SELECT pg_advisory_xact_lock"):
+            # There is one rollups instance per process, so there is nobody to wait for.
+            return 1
+        table = self.table("CurrencyQueryRollup")
+        if query.startswith('DELETE FROM "CurrencyQueryRollup"'):
+            count = len(table.rows)
+            table.rows.clear()
+            table.rollups.clear()
+            for index in table.indexes.values():
+                index.clear()
+            return count
+        fields = ("userId", "baseCurrency", "targetCurrency", "count", "firstUsedAt")
+        fields += ("lastUsedAt", "minRate", "maxRate", "sumRate")
+        if "VALUES" in query:
+            for start in range(0, len(params), len(fields)):
+                values = dict(zip(fields, params[start : start + len(fields)]))
+                for field in ("firstUsedAt", "lastUsedAt"):
+                    values[field] = values[field].replace(tzinfo=timezone.utc)
+                self._merge_rollup(tuple(params[start : start + 3]), values)
+            return len(params) // len(fields)
+        if 'FROM "CurrencyQuery"' in query:
+            cutoff = params[0].replace(tzinfo=timezone.utc)
+            totals: Dict = {}
+            for row in self.table("CurrencyQuery").rows.values():
+                if row.timestamp >= cutoff:
+                    continue
+                key = (row.userId, row.baseCurrency, row.targetCurrency)
+                rate, at = row.exchangeRate, row.timestamp
+                total = totals.setdefault(
+                    key,
+                    dict(
+                        count=0,
+                        sumRate=0.0,
+                        minRate=rate,
+                        maxRate=rate,
+                        firstUsedAt=at,
+                        lastUsedAt=at,
+                    ),
+                )
+                total["count"] += 1
+                total["sumRate"] += rate
+                total["minRate"] = min(total["minRate"], rate)
+                total["maxRate"] = max(total["maxRate"], rate)
+                total["firstUsedAt"] = min(total["firstUsedAt"], at)
+                total["lastUsedAt"] = max(total["lastUsedAt"], at)
+            for key, total in totals.items():
+                user_id, base, target = key
+                self._merge_rollup(
+                    key,
+                    dict(
+                        total,
+                        userId=user_id,
+                        baseCurrency=base,
+                        targetCurrency=target,
+                    ),
+                )
+            return len(totals)
+        raise NotImplementedError(query)
+
+    def table(self, model: str) -> InMemoryTable:
+        if model not in self.tables:
+            self.tables[model] = InMemoryTable(self, model)
+        return self.tables[model]
+
+    def install(self) -> None:
+        """
+        Points every generated model's prisma() accessor at this database, whichever client or transaction it is
+        given.
+        """
+        for name in dir(prisma.models):
+            model = getattr(prisma.models, name)
+            if isinstance(model, type) and hasattr(model, "prisma"):
+                table = self.table(name)
+                model.prisma = classmethod(lambda cls, client=None, table=table: table)
+
+
+def install_in_memory_database(db_client: Optional[prisma.Prisma] = None):
+    """
+    Installs a fresh in-memory database and, if given, makes the client's connect/disconnect no-ops.
+    """
+    database = InMemoryDatabase()
+    database.install()
+    if db_client is not None:
+
+        async def noop(*args, **kwargs) -> None:
+            return None
+
+        @contextlib.asynccontextmanager
+        async def tx(*args, **kwargs):
+            yield database
+
+        db_client.connect = noop
+        db_client.disconnect = noop
+        db_client.execute_raw = database.execute_raw
+        db_client.tx = tx
+    return database
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import random
+import socket
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import uvicorn
+
+STUB_RATES: Dict[str, float] = {
+    "USD": 1.0,
+    "EUR": 0.92,
+    "JPY": 151.3,
+    "GBP": 0.79,
+    "AUD": 1.52,
+    "CAD": 1.36,
+    "CHF": 0.9,
+    "CNH": 7.24,
+    "SEK": 10.6,
+    "NZD": 1.66,
+}
+
+
+class StubRateProvider:
+    """
+    Minimal ASGI app imitating the upstream '/latest' rates endpoint, for benchmarks only.
+
+    Rates are returned relative to the requested base. Latency, jitter and error rate are configurable so the
+    service can be measured against a slow or flaky provider. Failures are HTTP 500 by default; error_status,
+    error_body and error_headers imitate other failures, such as a 429 with Retry-After or a 200 with an error
+    body.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        error_body: Optional[dict] = None,
+        error_headers: Optional[Dict[str, str]] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_body = error_body or {"error": "stub failure"}
+        self.error_headers = [
+            (name.lower().encode(), value.encode())
+            for name, value in (error_headers or {}).items()
+        ]
+        self.requests = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        self.requests += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if random.random() < self.error_rate:
+            await self._send(
+                send, self.error_status, self.error_body, self.error_headers
+            )
+            return
+        query = parse_qs(scope["query_string"].decode())
+        base = query.get("base", ["USD"])[0]
+        if base not in STUB_RATES:
+            await self._send(send, 400, {"error": "unknown base"})
+            return
+        pivot = STUB_RATES[base]
+        rates = {code: rate / pivot for code, rate in STUB_RATES.items()}
+        symbols = query.get("symbols")
+        if symbols:
+            wanted = set(symbols[0].split(","))
+            rates = {code: rate for code, rate in rates.items() if code in wanted}
+        await self._send(send, 200, {"base": base, "rates": rates})
+
+    @staticmethod
+    async def _send(
+        send, status: int, body: dict, headers: List[Tuple[bytes, bytes]] = ()
+    ) -> None:
+        payload = json.dumps(body).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode()),
+                    *headers,
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": payload})
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_stub_server(app, port: int) -> uvicorn.Server:
+    """
+    Starts an ASGI app on localhost in the current event loop and waits until it accepts connections.
+    """
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    server.config.setup_event_loop = lambda: None
+    asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
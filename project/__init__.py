@@ -0,0 +1,2 @@
+# Imported first so that fast-start mode can make heavy packages load lazily before any module imports them.
+import project.startup  # noqa: F401
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from prometheus_client import Counter
+
+from project.deadlines import request_deadline
+
+
+def _per_class(value: str) -> Dict[str, float]:
+    return {
+        name.strip(): float(limit)
+        for name, limit in (
+            item.split(":") for item in value.split(",") if item.strip()
+        )
+    }
+
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Per route class: requests handled at once, requests allowed to wait for a slot, and the request deadline in
+# seconds (0 for none).
+ADMISSION_MAX_CONCURRENT = _per_class(
+    os.getenv(
+        "ADMISSION_MAX_CONCURRENT",
+        "convert:256,bulk:4,database:32,stream:500,default:64",
+    )
+)
+ADMISSION_MAX_QUEUE = _per_class(
+    os.getenv(
+        "ADMISSION_MAX_QUEUE", "convert:512,bulk:8,database:128,stream:0,default:128"
+    )
+)
+ADMISSION_TIMEOUT_SECONDS = _per_class(
+    os.getenv(
+        "ADMISSION_TIMEOUT_SECONDS", "convert:5,bulk:60,database:10,stream:0,default:10"
+    )
+)
+# Queued requests still without a slot after this long are shed.
+ADMISSION_MAX_QUEUE_WAIT_SECONDS = float(
+    os.getenv("ADMISSION_MAX_QUEUE_WAIT_SECONDS", "1")
+)
+ADMISSION_RETRY_AFTER_SECONDS = float(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+ADMISSION_EXEMPT_PATHS = frozenset(
+    os.getenv(
+        "ADMISSION_EXEMPT_PATHS", "/metrics,/docs,/redoc,/openapi.json,/admin/profile"
+    ).split(",")
+)
+
+# Path prefixes of each route class, most specific first; other paths are in the default class.
+ROUTE_CLASSES = (
+    ("/rates/stream/", "stream"),
+    ("/user/history/stream", "stream"),
+    ("/bulk_convert", "bulk"),
+    ("/convert", "convert"),
+    ("/batch_convert", "convert"),
+    ("/rates/history/", "database"),
+    ("/user", "database"),
+    ("/auth/", "database"),
+)
+DEFAULT_CLASS = "default"
+
+ADMISSION_SHED = Counter(
+    "admission_shed_total",
+    "Requests answered 503 without being handled, by route class and reason.",
+    ["route_class", "reason"],
+)
+ADMISSION_DEADLINE_EXCEEDED = Counter(
+    "admission_deadline_exceeded_total",
+    "Requests cancelled at their deadline, by route class.",
+    ["route_class"],
+)
+
+
+def route_class(path: str) -> str:
+    for prefix, name in ROUTE_CLASSES:
+        if path.startswith(prefix):
+            return name
+    return DEFAULT_CLASS
+
+
+class AdmissionGate:
+    """
+    Concurrency limit with a bounded FIFO wait queue for one route class.
+
+    A request gets a slot right away while fewer than max_concurrent are in flight and nobody is queued;
+    otherwise it queues, unless max_queue requests already are. A released slot is handed directly to the
+    oldest waiter. A waiter that gets no slot within its wait budget gives up, so under overload requests are
+    rejected within the wait budget rather than piling up.
+    """
+
+    def __init__(
+        self, name: str, max_concurrent: int, max_queue: int, timeout_seconds: float
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout_seconds = timeout_seconds
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, wait_seconds: float) -> Optional[str]:
+        """
+        Takes a slot, waiting up to wait_seconds for one.
+
+        Returns:
+            Optional[str]: None once a slot is held, or why the request was shed: 'queue_full' or 'queue_timeout'.
+        """
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return "queue_full"
+        if wait_seconds <= 0:
+            return "queue_timeout"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), wait_seconds)
+            return None
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # The slot was handed over just as the wait ran out.
+                return None
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+def _gate(name: str) -> AdmissionGate:
+    def setting(values: Dict[str, float]) -> float:
+        return values.get(name, values.get(DEFAULT_CLASS, 0))
+
+    return AdmissionGate(
+        name,
+        max_concurrent=int(setting(ADMISSION_MAX_CONCURRENT)),
+        max_queue=int(setting(ADMISSION_MAX_QUEUE)),
+        timeout_seconds=setting(ADMISSION_TIMEOUT_SECONDS),
+    )
+
+
+async def _reply(send, status: int, error: str, headers=()) -> None:
+    body = json.dumps({"error": error}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def _client_timeout(scope) -> Optional[float]:
+    for key, value in scope["headers"]:
+        if key == b"x-request-timeout":
+            try:
+                seconds = float(value)
+            except ValueError:
+                return None
+            return seconds if seconds > 0 else None
+    return None
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware applying each route class's concurrency limit and request deadline.
+
+    Requests that cannot get a slot are answered 503 with a Retry-After header. Admitted requests run under a
+    deadline: the class timeout, or the client's X-Request-Timeout header if shorter. The deadline is published
+    in project.deadlines for code that waits on the upstream, and at the deadline the request is cancelled,
+    which also cancels the upstream call or Prisma query it is awaiting, and answered 504. The deadline covers
+    the time to start the response: once it has started, e.g. a long /bulk_convert stream, it is not cut off.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not ADMISSION_ENABLED
+            or scope["type"] != "http"
+            or scope["path"] in ADMISSION_EXEMPT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+        gate = admission_gates[route_class(scope["path"])]
+        timeout = gate.timeout_seconds or None
+        client_timeout = _client_timeout(scope)
+        if client_timeout is not None:
+            timeout = min(timeout or client_timeout, client_timeout)
+        deadline = time.monotonic() + timeout if timeout else None
+
+        wait = ADMISSION_MAX_QUEUE_WAIT_SECONDS
+        if timeout:
+            wait = min(wait, timeout)
+        shed = await gate.acquire(wait)
+        if shed is not None:
+            ADMISSION_SHED.labels(gate.name, shed).inc()
+            retry_after = max(1, math.ceil(ADMISSION_RETRY_AFTER_SECONDS))
+            await _reply(
+                send,
+                503,
+                f"Server busy ({gate.name} requests); retry in {retry_after} s",
+                [(b"retry-after", str(retry_after).encode())],
+            )
+            return
+
+        timer: Optional[asyncio.Timeout] = None
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and timer is not None:
+                timer.reschedule(None)
+            await send(message)
+
+        token = request_deadline.set(deadline)
+        try:
+            if deadline is None:
+                await self.app(scope, receive, send_wrapper)
+                return
+            try:
+                async with asyncio.timeout(deadline - time.monotonic()) as timer:
+                    await self.app(scope, receive, send_wrapper)
+            except TimeoutError:
+                ADMISSION_DEADLINE_EXCEEDED.labels(gate.name).inc()
+                await _reply(send, 504, f"Request deadline of {timeout:g} s exceeded")
+        finally:
+            request_deadline.reset(token)
+            gate.release()
+
+
+admission_gates: Dict[str, AdmissionGate] = {
+    name: _gate(name)
+    for name in dict.fromkeys([name for _, name in ROUTE_CLASSES] + [DEFAULT_CLASS])
+}
@@ -0,0 +1,224 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional, Set
+
+import prisma
+import prisma.models
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from project.database import database
+from project.deadlines import SharedLoad
+from project.metrics import db_query
+
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+AUTH_TOKEN_CACHE_TTL_SECONDS = float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+AUTH_TOKEN_NEGATIVE_TTL_SECONDS = float(
+    os.getenv("AUTH_TOKEN_NEGATIVE_TTL_SECONDS", "30")
+)
+
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """
+    The identity behind a valid bearer token.
+    """
+
+    user_id: str
+    role: str
+    token: str
+    expires_at: datetime
+
+
+class CachedToken(NamedTuple):
+    user: Optional[AuthenticatedUser]
+    cache_until: float
+
+
+def _epoch(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def role_name(role) -> str:
+    return getattr(role, "name", None) or str(role)
+
+
+class AuthTokenCache:
+    """
+    Bounded, expiry-aware cache of bearer token lookups in front of the AuthToken table.
+
+    Valid tokens are cached until the earlier of their expiry and the cache TTL; unknown or expired tokens are
+    cached as negative entries for a shorter TTL. The least recently used entry is evicted once the cache is full,
+    and concurrent lookups of the same uncached token share one database query.
+    """
+
+    def __init__(
+        self, max_entries: int, ttl_seconds: float, negative_ttl_seconds: float
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[str, CachedToken]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        self._in_flight: Dict[str, SharedLoad] = {}
+        # Bumped by every invalidation; a lookup that overlapped one does not cache what it read.
+        self._invalidations = 0
+
+    def _store(self, token: str, user: Optional[AuthenticatedUser]) -> None:
+        now = time.time()
+        if user is not None:
+            cache_until = min(now + self.ttl_seconds, _epoch(user.expires_at))
+            self._tokens_by_user.setdefault(user.user_id, set()).add(token)
+        else:
+            cache_until = now + self.negative_ttl_seconds
+        self._entries[token] = CachedToken(user, cache_until)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            evicted, entry = self._entries.popitem(last=False)
+            self._forget_user_token(evicted, entry.user)
+
+    def _forget_user_token(self, token: str, user: Optional[AuthenticatedUser]) -> None:
+        if user is None:
+            return
+        tokens = self._tokens_by_user.get(user.user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user.user_id]
+
+    def put(self, user: AuthenticatedUser) -> None:
+        """
+        Caches a freshly issued token so its first use does not need a database query.
+        """
+        self._store(user.token, user)
+
+    async def _load(self, token: str) -> Optional[AuthenticatedUser]:
+        invalidations = self._invalidations
+        await database.ensure_connected()
+        with db_query("AuthToken", "find_unique"):
+            auth_token = await prisma.models.AuthToken.prisma().find_unique(
+                where={"token": token}, include={"User": True}
+            )
+        user = None
+        if (
+            auth_token is not None
+            and auth_token.User is not None
+            and _epoch(auth_token.expiresAt) > time.time()
+        ):
+            user = AuthenticatedUser(
+                user_id=auth_token.userId,
+                role=role_name(auth_token.User.role),
+                token=token,
+                expires_at=auth_token.expiresAt,
+            )
+        if invalidations == self._invalidations:
+            self._store(token, user)
+        return user
+
+    async def resolve(self, token: str) -> Optional[AuthenticatedUser]:
+        """
+        Returns the user behind a bearer token, or None if the token is unknown or expired.
+
+        Args:
+            token (str): The bearer token presented by the client.
+
+        Returns:
+            Optional[AuthenticatedUser]: The authenticated user, or None for an invalid token.
+        """
+        entry = self._entries.get(token)
+        if entry is not None:
+            if entry.cache_until > time.time():
+                self._entries.move_to_end(token)
+                return entry.user
+            del self._entries[token]
+            self._forget_user_token(token, entry.user)
+        load = self._in_flight.get(token)
+        if load is None:
+            load = SharedLoad(self._in_flight, token, self._load(token))
+        return await load.join()
+
+    def peek(self, token: str) -> Optional[CachedToken]:
+        """
+        Returns the cached lookup of a token, or None if it is not cached or has expired. Never queries the database.
+        """
+        entry = self._entries.get(token)
+        if entry is not None and entry.cache_until > time.time():
+            return entry
+        return None
+
+    def invalidate_token(self, token: str) -> None:
+        """
+        Drops a single token, e.g. on logout.
+        """
+        self._invalidations += 1
+        # Requests from now on look the token up again rather than join a lookup that may predate the logout.
+        self._in_flight.pop(token, None)
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            self._forget_user_token(token, entry.user)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """
+        Drops every cached token of a user, e.g. after a role change.
+        """
+        self._invalidations += 1
+        for token in self._tokens_by_user.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+
+auth_token_cache = AuthTokenCache(
+    max_entries=AUTH_TOKEN_CACHE_MAX_ENTRIES,
+    ttl_seconds=AUTH_TOKEN_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=AUTH_TOKEN_NEGATIVE_TTL_SECONDS,
+)
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+async def optional_auth(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+) -> Optional[AuthenticatedUser]:
+    """
+    FastAPI dependency resolving the bearer token if one is sent. Anonymous requests yield None; an invalid token is rejected with 401.
+    """
+    if credentials is None:
+        return None
+    user = await auth_token_cache.resolve(credentials.credentials)
+    if user is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
+async def require_auth(
+    user: Optional[AuthenticatedUser] = Depends(optional_auth),
+) -> AuthenticatedUser:
+    """
+    FastAPI dependency requiring a valid bearer token.
+    """
+    if user is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
+async def require_admin(
+    user: AuthenticatedUser = Depends(require_auth),
+) -> AuthenticatedUser:
+    """
+    FastAPI dependency requiring a valid bearer token of an ADMIN user.
+    """
+    if user.role != "ADMIN":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return user
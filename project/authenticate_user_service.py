@@ -1,11 +1,14 @@
 import secrets
 from datetime import datetime, timedelta
 
-import bcrypt
 import prisma
 import prisma.models
 from pydantic import BaseModel
 
+from project.auth_token_cache import AuthenticatedUser, auth_token_cache, role_name
+from project.metrics import db_query
+from project.password_hashing import password_hasher
+
 
 class AuthenticateUserResponse(BaseModel):
     """
@@ -19,7 +22,7 @@ class AuthenticateUserResponse(BaseModel):
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
-    Verifies if a plain text password matches the hashed password.
+    Verifies if a plain text password matches the hashed password on the password hashing pool.
 
     Args:
         plain_password (str): The plain text password to verify.
@@ -28,12 +31,12 @@ async def verify_password(plain_password: str, hashed_password: str) -> bool:
     Returns:
         bool: True if the password matches, False otherwise.
     """
-    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
 async def authenticate_user(email: str, password: str) -> AuthenticateUserResponse:
     """
-    Authenticates user and returns a session token.
+    Authenticates user and returns a session token. The token is added to the token cache so its first use does not hit the database.
 
     Args:
     email (str): The user's email address used for login.
@@ -42,14 +45,24 @@ async def authenticate_user(email: str, password: str) -> AuthenticateUserRespon
     Returns:
     AuthenticateUserResponse: Response model for a successful authentication. Provides a session token for the authenticated session.
     """
-    user = await prisma.models.User.prisma().find_unique(where={"email": email})
+    with db_query("User", "find_unique"):
+        user = await prisma.models.User.prisma().find_unique(where={"email": email})
     if not user:
         raise Exception("User not found or incorrect password")
     if not await verify_password(password, user.password):
         raise Exception("User not found or incorrect password")
     token = secrets.token_hex(16)
     expires_at = datetime.utcnow() + timedelta(days=1)
-    auth_token = await prisma.models.AuthToken.prisma().create(
-        data={"userId": user.id, "token": token, "expiresAt": expires_at}
+    with db_query("AuthToken", "create"):
+        await prisma.models.AuthToken.prisma().create(
+            data={"userId": user.id, "token": token, "expiresAt": expires_at}
+        )
+    auth_token_cache.put(
+        AuthenticatedUser(
+            user_id=user.id,
+            role=role_name(user.role),
+            token=token,
+            expires_at=expires_at,
+        )
     )
     return AuthenticateUserResponse(token=token, user_id=user.id, expires_at=expires_at)
@@ -1,8 +1,28 @@
-from datetime import datetime
-from typing import List
+from datetime import datetime, timezone
+from typing import List, Optional, Union
 
+import numpy as np
 from pydantic import BaseModel
 
+from project.convert_currency_service import rate_refresher
+from project.currency_query_recorder import query_recorder
+
+
+class BatchLengthMismatchError(Exception):
+    """
+    Raised when the per-item lists of a batch conversion request have different lengths.
+    """
+
+
+class BatchConversionRequest(BaseModel):
+    """
+    Request body for a batch conversion. Item i converts amounts[i] from base_currencies[i] (or the request's base currency) to target_currencies[i].
+    """
+
+    target_currencies: List[str]
+    amounts: Optional[List[float]] = None
+    base_currencies: Optional[List[str]] = None
+
 
 class ConversionResult(BaseModel):
     """
@@ -10,9 +30,12 @@ class ConversionResult(BaseModel):
     """
 
     target_currency: str
-    exchange_rate: float
+    exchange_rate: Optional[float]
     timestamp: datetime
     status: str
+    base_currency: Optional[str] = None
+    amount: Optional[float] = None
+    converted_amount: Optional[float] = None
 
 
 class BatchConversionResponse(BaseModel):
@@ -22,37 +45,106 @@ class BatchConversionResponse(BaseModel):
 
     base_currency: str
     conversions: List[ConversionResult]
+    timestamp: Optional[datetime] = None
+    snapshot_id: Optional[int] = None
+    snapshot_age_seconds: float = 0.0
+    stale: bool = False
 
 
 async def batch_convert_currency(
-    base_currency: str, target_currencies: List[str]
+    base_currency: str,
+    target_currencies: Union[BatchConversionRequest, List[str]],
+    user_id: Optional[str] = None,
 ) -> BatchConversionResponse:
     """
     Performs batch conversion from a base currency to multiple targets.
 
+    Every rate is resolved from a single rate snapshot in one pass, amounts are converted as one vectorized
+    operation, and the whole batch is stamped with the snapshot timestamp.
+
     Args:
-        base_currency (str): The base currency code (e.g., USD) from which to convert.
-        target_currencies (List[str]): A list of target currency codes (e.g., ['EUR', 'GBP']) to which the base currency will be converted.
+        base_currency (str): The base currency code (e.g., USD) from which to convert, used for items without their own base.
+        target_currencies (Union[BatchConversionRequest, List[str]]): Either a plain list of target currency codes (e.g., ['EUR', 'GBP']), or a request carrying parallel lists of targets, amounts and optional per-item bases.
+        user_id (Optional[str]): The authenticated user, if any. Successful items are queued for the history table.
 
     Returns:
         BatchConversionResponse: The response model for the batch conversion request, which includes the exchange rates
         for the base currency to each of the requested target currencies, along with a timestamp for each rate.
+        Items whose base or target currency is not in the snapshot are reported with status 'unknown_currency'.
+
+    Raises:
+        StaleRatesError: If no sufficiently fresh rate snapshot is available.
+        BatchLengthMismatchError: If base_currencies or amounts do not have one entry per target currency.
 
     Example:
         response = await batch_convert_currency("USD", ["EUR", "JPY"])
         print(response)
     """
-    conversion_results = []
-    for target_currency in target_currencies:
-        exchange_rate = 0.75
-        conversion_results.append(
-            ConversionResult(
-                target_currency=target_currency,
-                exchange_rate=exchange_rate,
-                timestamp=datetime.now(),
-                status="success",
-            )
+    if isinstance(target_currencies, BatchConversionRequest):
+        request = target_currencies
+    else:
+        request = BatchConversionRequest(target_currencies=target_currencies)
+    targets = request.target_currencies
+    bases = request.base_currencies or [base_currency] * len(targets)
+    if len(bases) != len(targets):
+        raise BatchLengthMismatchError(
+            "base_currencies and target_currencies must have equal length"
+        )
+    if request.amounts is not None and len(request.amounts) != len(targets):
+        raise BatchLengthMismatchError(
+            "amounts and target_currencies must have equal length"
+        )
+
+    matrix = await rate_refresher.get_snapshot()
+    age = rate_refresher.age_seconds(matrix)
+    rates, known = matrix.cross_rates(bases, targets)
+    rate_list = rates.tolist()
+    known_list = known.tolist()
+    if request.amounts is not None:
+        converted_list = (
+            np.asarray(request.amounts, dtype=np.float64) * rates
+        ).tolist()
+        amount_list = request.amounts
+    else:
+        converted_list = amount_list = [None] * len(targets)
+
+    if user_id is not None:
+        recorded_at = datetime.now(timezone.utc)
+        await query_recorder.record(
+            [
+                {
+                    "userId": user_id,
+                    "baseCurrency": base,
+                    "targetCurrency": target,
+                    "exchangeRate": rate,
+                    "timestamp": recorded_at,
+                }
+                for target, base, rate, ok in zip(targets, bases, rate_list, known_list)
+                if ok
+            ]
+        )
+
+    timestamp = matrix.fetched_at
+    # Values come straight from the validated request and the snapshot, so skip per-item validation.
+    conversion_results = [
+        ConversionResult.construct(
+            target_currency=target,
+            exchange_rate=rate if ok else None,
+            timestamp=timestamp,
+            status="success" if ok else "unknown_currency",
+            base_currency=base,
+            amount=amount,
+            converted_amount=converted if ok else None,
+        )
+        for target, base, rate, ok, amount, converted in zip(
+            targets, bases, rate_list, known_list, amount_list, converted_list
         )
-    return BatchConversionResponse(
-        base_currency=base_currency, conversions=conversion_results
+    ]
+    return BatchConversionResponse.construct(
+        base_currency=base_currency,
+        conversions=conversion_results,
+        timestamp=timestamp,
+        snapshot_id=matrix.snapshot_id,
+        snapshot_age_seconds=age,
+        stale=age > rate_refresher.stale_after_seconds,
     )
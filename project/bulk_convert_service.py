@@ -0,0 +1,307 @@
+import csv
+import io
+import json
+import math
+import os
+from typing import AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+from fastapi.responses import StreamingResponse
+
+from project.rate_engine import RateMatrix
+
+BULK_CONVERT_CHUNK_ROWS = int(os.getenv("BULK_CONVERT_CHUNK_ROWS", "10000"))
+# Longest row accepted, in bytes (or characters, for a CSV record spanning lines); longer rows are invalid.
+BULK_CONVERT_MAX_ROW_BYTES = int(os.getenv("BULK_CONVERT_MAX_ROW_BYTES", "65536"))
+
+CSV_OUTPUT_HEADER = (
+    "amount,base_currency,target_currency,exchange_rate,converted_amount,status\n"
+)
+
+# Lines that are not valid UTF-8 are decoded with this replacement character, which marks their rows invalid.
+# Rows over BULK_CONVERT_MAX_ROW_BYTES are replaced by it.
+UNDECODABLE = "\ufffd"
+
+
+class BulkConvertFormatError(Exception):
+    """
+    Raised when a bulk conversion body is in an unsupported format or lacks required columns.
+    """
+
+
+class BulkConvertResponse(StreamingResponse):
+    """
+    Streams converted rows while the request body is still being read.
+
+    StreamingResponse normally listens for a client disconnect on the ASGI receive channel while it streams,
+    which would race the body iterator for request body messages. Here the body iterator reads the request
+    itself and sees the disconnect, so the listener is skipped.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+ParsedRows = Tuple[List[float], List[str], List[str], List[bool]]
+
+
+def _parse_csv(
+    lines: List[str], columns: Tuple[int, Optional[int], int], default_base: str
+) -> ParsedRows:
+    amount_column, base_column, target_column = columns
+    amounts, bases, targets, valid = [], [], [], []
+    for row in csv.reader(lines):
+        try:
+            amount = float(row[amount_column])
+            base = row[base_column].strip() if base_column is not None else default_base
+            target = row[target_column].strip()
+            ok = math.isfinite(amount) and UNDECODABLE not in base + target
+        except (IndexError, ValueError):
+            amount, base, target, ok = math.nan, "", "", False
+        amounts.append(amount)
+        bases.append(base)
+        targets.append(target)
+        valid.append(ok)
+    return amounts, bases, targets, valid
+
+
+def _parse_ndjson(lines: List[str], default_base: str) -> ParsedRows:
+    amounts, bases, targets, valid = [], [], [], []
+    for line in lines:
+        try:
+            item = json.loads(line)
+            amount = float(item["amount"])
+            base = item.get("base_currency") or default_base or ""
+            target = item["target_currency"]
+            ok = (
+                math.isfinite(amount)
+                and isinstance(target, str)
+                and UNDECODABLE not in line
+            )
+        except (KeyError, TypeError, ValueError, AttributeError):
+            amount, base, target, ok = math.nan, "", "", False
+        amounts.append(amount)
+        bases.append(str(base))
+        targets.append(str(target))
+        valid.append(ok)
+    return amounts, bases, targets, valid
+
+
+def _convert_chunk(matrix: RateMatrix, rows: ParsedRows, output_format: str) -> bytes:
+    amounts, bases, targets, valid = rows
+    rates, known = matrix.cross_rates(bases, targets)
+    converted = np.asarray(amounts, dtype=np.float64) * rates
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for amount, base, target, ok, has_rate, rate, value in zip(
+        amounts,
+        bases,
+        targets,
+        valid,
+        known.tolist(),
+        rates.tolist(),
+        converted.tolist(),
+    ):
+        if not ok:
+            status, rate, value = "invalid_row", None, None
+        elif not has_rate:
+            status, rate, value = "unknown_currency", None, None
+        else:
+            status = "success"
+        if output_format == "csv":
+            # csv.writer quotes fields holding commas, quotes or newlines, as csv.reader accepted them.
+            writer.writerow(
+                (
+                    amount if ok else "",
+                    base,
+                    target,
+                    "" if rate is None else rate,
+                    "" if value is None else value,
+                    status,
+                )
+            )
+        else:
+            out.write(
+                json.dumps(
+                    {
+                        "amount": amount if ok else None,
+                        "base_currency": base,
+                        "target_currency": target,
+                        "exchange_rate": rate,
+                        "converted_amount": value,
+                        "status": status,
+                    }
+                )
+                + "\n"
+            )
+    return out.getvalue().encode()
+
+
+def _csv_columns(
+    header: str, default_base: Optional[str]
+) -> Tuple[int, Optional[int], int]:
+    names = [name.strip().lower() for name in next(csv.reader([header]))]
+    try:
+        amount_column = names.index("amount")
+        target_column = names.index("target_currency")
+    except ValueError:
+        raise BulkConvertFormatError(
+            "CSV header must contain 'amount' and 'target_currency' columns"
+        )
+    base_column = names.index("base_currency") if "base_currency" in names else None
+    if base_column is None and default_base is None:
+        raise BulkConvertFormatError(
+            "CSV without a 'base_currency' column requires the base_currency parameter"
+        )
+    return amount_column, base_column, target_column
+
+
+def _decode(line: bytes) -> str:
+    # Decoding must not fail once the response has started; the row is reported invalid instead.
+    return line.decode("utf-8", errors="replace").rstrip("\r")
+
+
+async def _lines(body: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Only the partial last line is carried over between chunks, and at most BULK_CONVERT_MAX_ROW_BYTES of it.
+    buffer = b""
+    oversized = False
+    async for data in body:
+        *complete, rest = data.split(b"\n")
+        for piece in complete:
+            line, buffer = buffer + piece, b""
+            if oversized:
+                oversized = False
+            elif len(line) > BULK_CONVERT_MAX_ROW_BYTES:
+                yield UNDECODABLE
+            elif line.strip():
+                yield _decode(line)
+        if not oversized:
+            buffer += rest
+            if len(buffer) > BULK_CONVERT_MAX_ROW_BYTES:
+                # Reported now; the rest of the line is skipped.
+                yield UNDECODABLE
+                buffer = b""
+                oversized = True
+    if buffer.strip() and not oversized:
+        yield _decode(buffer)
+
+
+def _quote_open(line: str, quoted: bool) -> bool:
+    """
+    Returns whether a quoted field is still open at the end of a line, given whether one was at its start.
+
+    As in csv.reader, a quote opens a quoted field only at the start of a field, and a doubled quote inside one
+    is a literal quote; any other quote is an ordinary character.
+    """
+    field_start = not quoted
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quoted:
+            if char == '"':
+                if line.startswith('"', i + 1):
+                    i += 1
+                else:
+                    quoted = False
+        elif char == ",":
+            field_start = True
+            i += 1
+            continue
+        elif char == '"' and field_start:
+            quoted = True
+        field_start = False
+        i += 1
+    return quoted
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Joins lines back into CSV records where a quoted field spans a line break. A record growing past
+    BULK_CONVERT_MAX_ROW_BYTES is reported invalid, and the following lines are read as new records.
+    """
+    record = None
+    quoted = False
+    async for line in lines:
+        quoted = _quote_open(line, quoted)
+        record = line if record is None else f"{record}\n{line}"
+        if len(record) > BULK_CONVERT_MAX_ROW_BYTES:
+            yield UNDECODABLE
+            record, quoted = None, False
+        elif not quoted:
+            yield record
+            record = None
+    if record is not None:
+        yield record
+
+
+async def _convert_lines(
+    lines: AsyncIterator[str],
+    input_format: str,
+    matrix: RateMatrix,
+    base_currency: Optional[str],
+    columns: Optional[Tuple[int, Optional[int], int]],
+    chunk_rows: int,
+) -> AsyncIterator[bytes]:
+    def convert(chunk: List[str]) -> bytes:
+        if input_format == "csv":
+            rows = _parse_csv(chunk, columns, base_currency)
+        else:
+            rows = _parse_ndjson(chunk, base_currency)
+        return _convert_chunk(matrix, rows, input_format)
+
+    if input_format == "csv":
+        yield CSV_OUTPUT_HEADER.encode()
+    pending: List[str] = []
+    async for line in lines:
+        pending.append(line)
+        if len(pending) >= chunk_rows:
+            yield convert(pending)
+            pending = []
+    if pending:
+        yield convert(pending)
+
+
+async def bulk_convert(
+    body: AsyncIterator[bytes],
+    input_format: str,
+    matrix: RateMatrix,
+    base_currency: Optional[str] = None,
+    chunk_rows: int = BULK_CONVERT_CHUNK_ROWS,
+) -> AsyncIterator[bytes]:
+    """
+    Converts a streamed CSV or NDJSON body of (amount, base, target) rows against one pinned rate snapshot.
+
+    The body is split into lines as it arrives and converted in chunks of chunk_rows rows; each chunk's output is
+    yielded before more input is read, so memory use does not depend on the size of the upload. Output rows are
+    in the input format and order, with an exchange rate, converted amount and per-row status. For CSV the header
+    row is read and validated before this function returns, so format errors surface before streaming starts.
+
+    Args:
+        body (AsyncIterator[bytes]): The raw request body.
+        input_format (str): 'csv' (with a header row) or 'ndjson'.
+        matrix (RateMatrix): The rate snapshot every row is converted with.
+        base_currency (Optional[str]): The base currency for rows that do not name one.
+        chunk_rows (int): The number of rows converted per vectorized step.
+
+    Returns:
+        AsyncIterator[bytes]: The converted rows.
+
+    Raises:
+        BulkConvertFormatError: If the format is unsupported or the CSV header lacks required columns.
+    """
+    if input_format not in ("csv", "ndjson"):
+        raise BulkConvertFormatError(f"Unsupported bulk format: {input_format}")
+    lines = _lines(body)
+    columns = None
+    if input_format == "csv":
+        lines = _csv_records(lines)
+        try:
+            header = await lines.__anext__()
+        except StopAsyncIteration:
+            raise BulkConvertFormatError("CSV body is empty")
+        columns = _csv_columns(header, base_currency)
+    return _convert_lines(
+        lines, input_format, matrix, base_currency, columns, chunk_rows
+    )
@@ -0,0 +1,438 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import prisma
+import prisma.models
+
+from project.currency_query_recorder import query_recorder
+from project.database import database
+from project.metrics import db_query
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_CHECKPOINT_SECONDS = float(os.getenv("ROLLUP_CHECKPOINT_SECONDS", "5"))
+ROLLUP_CACHE_MAX_USERS = int(os.getenv("ROLLUP_CACHE_MAX_USERS", "10000"))
+# Other workers' checkpoints become visible once a cached user is older than this.
+ROLLUP_CACHE_TTL_SECONDS = float(os.getenv("ROLLUP_CACHE_TTL_SECONDS", "30"))
+# Recompute the whole rollup table from CurrencyQuery at startup, e.g. after restoring history.
+ROLLUP_REBUILD_ON_START = os.getenv("ROLLUP_REBUILD_ON_START", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# The rebuild aggregates the whole CurrencyQuery history in one transaction, and other workers wait for its lock
+# in theirs, so both may take this long. A failed rebuild is retried after ROLLUP_REBUILD_RETRY_SECONDS.
+ROLLUP_REBUILD_TIMEOUT_SECONDS = float(
+    os.getenv("ROLLUP_REBUILD_TIMEOUT_SECONDS", "900")
+)
+ROLLUP_REBUILD_RETRY_SECONDS = float(os.getenv("ROLLUP_REBUILD_RETRY_SECONDS", "30"))
+# Pairs per checkpoint statement; each takes 9 bind parameters.
+CHECKPOINT_CHUNK_SIZE = 500
+# Rows are written within about QUERY_RECORDER_FLUSH_INTERVAL_SECONDS of being recorded. A rebuild waits this
+# long after its cutoff, so every row recorded before it is in CurrencyQuery by then.
+REBUILD_SETTLE_SECONDS = 5.0
+# Workers starting within this long of a replacing rebuild take it as their own, so a deployment rebuilds once.
+REBUILD_SHARED_SECONDS = 300.0
+REBUILD_ID = 1
+# Cutoff for a table filled by checkpoints alone, before rebuilds were recorded: every row counts.
+NO_CUTOFF = datetime.min.replace(tzinfo=timezone.utc)
+
+Pair = Tuple[str, str]
+Key = Tuple[str, str, str]
+
+COLUMNS = (
+    '"userId", "baseCurrency", "targetCurrency", "count", "firstUsedAt", "lastUsedAt", '
+    '"minRate", "maxRate", "sumRate", "updatedAt"'
+)
+# Merging is commutative, so workers checkpointing the same pair concurrently add up correctly.
+MERGE = """
+ON CONFLICT ("userId", "baseCurrency", "targetCurrency") DO UPDATE SET
+    "count" = "CurrencyQueryRollup"."count" + EXCLUDED."count",
+    "firstUsedAt" = LEAST("CurrencyQueryRollup"."firstUsedAt", EXCLUDED."firstUsedAt"),
+    "lastUsedAt" = GREATEST("CurrencyQueryRollup"."lastUsedAt", EXCLUDED."lastUsedAt"),
+    "minRate" = LEAST("CurrencyQueryRollup"."minRate", EXCLUDED."minRate"),
+    "maxRate" = GREATEST("CurrencyQueryRollup"."maxRate", EXCLUDED."maxRate"),
+    "sumRate" = "CurrencyQueryRollup"."sumRate" + EXCLUDED."sumRate",
+    "updatedAt" = EXCLUDED."updatedAt"
+"""
+REBUILD = f"""
+INSERT INTO "CurrencyQueryRollup" ({COLUMNS})
+SELECT "userId", "baseCurrency", "targetCurrency", COUNT(*), MIN("timestamp"), MAX("timestamp"),
+    MIN("exchangeRate"), MAX("exchangeRate"), SUM("exchangeRate"), NOW()
+FROM "CurrencyQuery"
+WHERE "timestamp" < $1::timestamp
+GROUP BY "userId", "baseCurrency", "targetCurrency"
+{MERGE}"""
+# Held until the rebuild transaction ends, so workers starting together check the table and rebuild one at a time.
+REBUILD_LOCK = "SELECT pg_advisory_xact_lock(hashtext('CurrencyQueryRollup'))"
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+@dataclass(slots=True)
+class PairRollup:
+    """
+    Running totals of one user's conversions of one currency pair.
+    """
+
+    count: int
+    first_used_at: datetime
+    last_used_at: datetime
+    min_rate: float
+    max_rate: float
+    sum_rate: float
+
+    @classmethod
+    def of(cls, rate: float, timestamp: datetime) -> "PairRollup":
+        return cls(1, timestamp, timestamp, rate, rate, rate)
+
+    def add(self, rate: float, timestamp: datetime) -> None:
+        self.count += 1
+        self.sum_rate += rate
+        if rate < self.min_rate:
+            self.min_rate = rate
+        if rate > self.max_rate:
+            self.max_rate = rate
+        if timestamp < self.first_used_at:
+            self.first_used_at = timestamp
+        if timestamp > self.last_used_at:
+            self.last_used_at = timestamp
+
+    def merge(self, other: "PairRollup") -> None:
+        self.count += other.count
+        self.sum_rate += other.sum_rate
+        self.min_rate = min(self.min_rate, other.min_rate)
+        self.max_rate = max(self.max_rate, other.max_rate)
+        self.first_used_at = min(self.first_used_at, other.first_used_at)
+        self.last_used_at = max(self.last_used_at, other.last_used_at)
+
+    def copy(self) -> "PairRollup":
+        return PairRollup(
+            self.count,
+            self.first_used_at,
+            self.last_used_at,
+            self.min_rate,
+            self.max_rate,
+            self.sum_rate,
+        )
+
+
+def _merge_into(target: Dict, key, rollup: PairRollup) -> None:
+    existing = target.get(key)
+    if existing is None:
+        target[key] = rollup.copy()
+    else:
+        existing.merge(rollup)
+
+
+class CachedUser:
+    __slots__ = ("pairs", "loaded_at")
+
+    def __init__(self, pairs: Dict[Pair, PairRollup], loaded_at: float):
+        self.pairs = pairs
+        self.loaded_at = loaded_at
+
+
+class ConversionRollups:
+    """
+    Per-user, per-currency-pair conversion totals kept up to date as CurrencyQuery rows are written.
+
+    Every batch the query recorder writes is folded into a map of pending deltas, one PairRollup per
+    (user, base, target), and into the totals of users already cached. A background task checkpoints the pending
+    deltas to the CurrencyQueryRollup table with a single upsert that adds counts and sums and keeps the extremes,
+    so deltas from several workers merge correctly. A user's totals are loaded from that table (one row per pair)
+    plus the deltas not yet checkpointed, then cached for a TTL, so a summary costs O(pairs) whatever the size of
+    the history.
+
+    On startup, an empty table is filled from the CurrencyQuery history with one aggregate query, by one worker
+    for all of them. The rebuild counts rows before a cutoff and the workers count the rows from then on, so rows
+    recorded before the cutoff is known are held back and folded in afterwards, minus those the rebuild counted.
+    Deltas not checkpointed when a worker dies are lost; ROLLUP_REBUILD_ON_START recomputes the table from history.
+    """
+
+    def __init__(
+        self, checkpoint_seconds: float, cache_max_users: int, cache_ttl_seconds: float
+    ):
+        self.checkpoint_seconds = checkpoint_seconds
+        self.cache_max_users = cache_max_users
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.checkpoints = 0
+        self.checkpoint_errors = 0
+        self._pending: Dict[Key, PairRollup] = {}
+        self._checkpointing: Dict[Key, PairRollup] = {}
+        self._checkpoint_generation = 0
+        self._users: "OrderedDict[str, CachedUser]" = OrderedDict()
+        self._started_at = datetime.now(timezone.utc)
+        # Rows older than the cutoff are counted by the rebuild; None until the rebuild settles it.
+        self._cutoff: Optional[datetime] = None
+        self._held: List[Dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._checkpoint_task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending) + len(self._checkpointing)
+
+    def apply(self, rows: Iterable[Dict]) -> None:
+        """
+        Folds written CurrencyQuery rows into the pending deltas and the cached totals.
+        """
+        if self._cutoff is None:
+            self._held.extend(rows)
+            return
+        for row in rows:
+            timestamp = _utc(row["timestamp"])
+            if timestamp < self._cutoff:
+                continue
+            user_id = row["userId"]
+            pair = (row["baseCurrency"], row["targetCurrency"])
+            rate = row["exchangeRate"]
+            key = (user_id, *pair)
+            delta = self._pending.get(key)
+            if delta is None:
+                self._pending[key] = PairRollup.of(rate, timestamp)
+            else:
+                delta.add(rate, timestamp)
+            cached = self._users.get(user_id)
+            if cached is not None:
+                rollup = cached.pairs.get(pair)
+                if rollup is None:
+                    cached.pairs[pair] = PairRollup.of(rate, timestamp)
+                else:
+                    rollup.add(rate, timestamp)
+
+    def _local_deltas(self, user_id: str) -> Dict[Pair, PairRollup]:
+        deltas: Dict[Pair, PairRollup] = {}
+        for source in (self._checkpointing, self._pending):
+            for (owner, base, target), delta in source.items():
+                if owner == user_id:
+                    _merge_into(deltas, (base, target), delta)
+        return deltas
+
+    async def _load(self, user_id: str) -> Dict[Pair, PairRollup]:
+        await database.ensure_connected()
+        with db_query("CurrencyQueryRollup", "find_many"):
+            rows = await prisma.models.CurrencyQueryRollup.prisma().find_many(
+                where={"userId": user_id}
+            )
+        return {
+            (row.baseCurrency, row.targetCurrency): PairRollup(
+                row.count,
+                _utc(row.firstUsedAt),
+                _utc(row.lastUsedAt),
+                row.minRate,
+                row.maxRate,
+                row.sumRate,
+            )
+            for row in rows
+        }
+
+    async def user_pairs(self, user_id: str) -> Dict[Pair, PairRollup]:
+        """
+        Returns a user's totals per (base, target) pair, including conversions not yet checkpointed.
+        """
+        cached = self._users.get(user_id)
+        if (
+            cached is not None
+            and time.monotonic() - cached.loaded_at < self.cache_ttl_seconds
+        ):
+            self._users.move_to_end(user_id)
+            return cached.pairs
+        generation = self._checkpoint_generation
+        pairs = await self._load(user_id)
+        # A checkpoint that ran during the read may or may not be in what was read; read again.
+        if generation != self._checkpoint_generation or self._checkpointing:
+            generation = self._checkpoint_generation
+            pairs = await self._load(user_id)
+        for pair, delta in self._local_deltas(user_id).items():
+            _merge_into(pairs, pair, delta)
+        if generation == self._checkpoint_generation and not self._checkpointing:
+            self._users[user_id] = CachedUser(pairs, time.monotonic())
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.cache_max_users:
+                self._users.popitem(last=False)
+        return pairs
+
+    async def _write(self, deltas: Dict[Key, PairRollup]) -> None:
+        items = list(deltas.items())
+        for start in range(0, len(items), CHECKPOINT_CHUNK_SIZE):
+            chunk = items[start : start + CHECKPOINT_CHUNK_SIZE]
+            values = []
+            params: List = []
+            for (user_id, base, target), delta in chunk:
+                n = len(params)
+                values.append(
+                    f"(${n + 1}, ${n + 2}, ${n + 3}, ${n + 4}::integer, ${n + 5}::timestamp, "
+                    f"${n + 6}::timestamp, ${n + 7}::double precision, ${n + 8}::double precision, "
+                    f"${n + 9}::double precision, NOW())"
+                )
+                params += [
+                    user_id,
+                    base,
+                    target,
+                    delta.count,
+                    delta.first_used_at.replace(tzinfo=None),
+                    delta.last_used_at.replace(tzinfo=None),
+                    delta.min_rate,
+                    delta.max_rate,
+                    delta.sum_rate,
+                ]
+            sql = f'INSERT INTO "CurrencyQueryRollup" ({COLUMNS}) VALUES {", ".join(values)} {MERGE}'
+            with db_query("CurrencyQueryRollup", "execute_raw"):
+                await database.client.execute_raw(sql, *params)
+            # Written chunks must not be written again if a later chunk fails.
+            for key, _ in chunk:
+                del deltas[key]
+
+    async def checkpoint(self) -> None:
+        """
+        Writes the pending deltas to the rollup table. Deltas that fail to be written stay pending.
+        """
+        if not self._pending or self._checkpointing:
+            return
+        self._checkpointing, self._pending = self._pending, {}
+        try:
+            await database.ensure_connected()
+            await self._write(self._checkpointing)
+            self.checkpoints += 1
+        except Exception:
+            self.checkpoint_errors += 1
+            logger.exception("Failed to checkpoint conversion rollups")
+            for key, delta in self._checkpointing.items():
+                _merge_into(self._pending, key, delta)
+        finally:
+            self._checkpointing = {}
+            self._checkpoint_generation += 1
+
+    async def rebuild(self, replace: bool = False) -> datetime:
+        """
+        Fills the rollup table from the CurrencyQuery history unless it was filled before, or recomputes it if
+        replace is set, unless another worker did so around when this one started.
+
+        Workers check and rebuild under a lock, so only one of them rebuilds. The rebuild aggregates the rows
+        from before this worker started and records that cutoff in CurrencyQueryRollupRebuild; later rows reach
+        the table through the checkpoints of the workers that recorded them.
+
+        Returns:
+            datetime: The cutoff of the rebuild the table holds.
+        """
+        await database.ensure_connected()
+        cutoff = self._started_at
+        settled = cutoff + timedelta(seconds=REBUILD_SETTLE_SECONDS)
+        await asyncio.sleep(
+            max(0.0, (settled - datetime.now(timezone.utc)).total_seconds())
+        )
+        started = time.perf_counter()
+        limit = timedelta(seconds=ROLLUP_REBUILD_TIMEOUT_SECONDS)
+        async with database.client.tx(max_wait=limit, timeout=limit) as transaction:
+            await transaction.execute_raw(REBUILD_LOCK)
+            with db_query("CurrencyQueryRollupRebuild", "find_unique"):
+                last = await prisma.models.CurrencyQueryRollupRebuild.prisma(
+                    transaction
+                ).find_unique(where={"id": REBUILD_ID})
+            if replace:
+                since = self._started_at - timedelta(seconds=REBUILD_SHARED_SECONDS)
+                done = last is not None and _utc(last.rebuiltAt) >= since
+            elif last is not None:
+                done = True
+            else:
+                with db_query("CurrencyQueryRollup", "find_first"):
+                    existing = await prisma.models.CurrencyQueryRollup.prisma(
+                        transaction
+                    ).find_first()
+                done = existing is not None
+            if done:
+                return _utc(last.cutoff) if last is not None else NO_CUTOFF
+            if replace:
+                await transaction.execute_raw('DELETE FROM "CurrencyQueryRollup"')
+            with db_query("CurrencyQueryRollup", "rebuild"):
+                pairs = await transaction.execute_raw(
+                    REBUILD, cutoff.replace(tzinfo=None)
+                )
+            state = {"cutoff": cutoff, "rebuiltAt": datetime.now(timezone.utc)}
+            with db_query("CurrencyQueryRollupRebuild", "upsert"):
+                await prisma.models.CurrencyQueryRollupRebuild.prisma(
+                    transaction
+                ).upsert(
+                    where={"id": REBUILD_ID},
+                    data={"create": {"id": REBUILD_ID, **state}, "update": state},
+                )
+        self._users.clear()
+        logger.info(
+            "Rebuilt %d conversion rollups from history in %.1f s",
+            pairs,
+            time.perf_counter() - started,
+        )
+        return cutoff
+
+    def _settle(self, cutoff: datetime) -> None:
+        self._cutoff = cutoff
+        held, self._held = self._held, []
+        self.apply(held)
+
+    async def _run(self, rebuild: bool) -> None:
+        # The first checkpoint waits for the rebuild, which skips a table that already has rows.
+        if rebuild:
+            # Settling without a rebuild would let checkpoints fill the table, and it would never be backfilled;
+            # rows stay held back until a rebuild succeeds.
+            while True:
+                try:
+                    cutoff = await self.rebuild(replace=ROLLUP_REBUILD_ON_START)
+                    break
+                except Exception:
+                    logger.exception(
+                        "Failed to rebuild conversion rollups; retrying in %g s",
+                        ROLLUP_REBUILD_RETRY_SECONDS,
+                    )
+                    await asyncio.sleep(ROLLUP_REBUILD_RETRY_SECONDS)
+            self._settle(cutoff)
+        while True:
+            await asyncio.sleep(self.checkpoint_seconds)
+            self._checkpoint_task = asyncio.ensure_future(self.checkpoint())
+            # Stopping cancels the wait, not the checkpoint, so a batch being written is not lost.
+            await asyncio.shield(self._checkpoint_task)
+
+    async def start(self, rebuild: bool = True) -> None:
+        """
+        Starts the background task, which first fills the table from history if it is empty (rebuild=True) and
+        then checkpoints periodically.
+        """
+        if self._task is None:
+            self._started_at = datetime.now(timezone.utc)
+            if not rebuild:
+                self._settle(NO_CUTOFF)
+            self._task = asyncio.create_task(self._run(rebuild))
+
+    async def stop(self) -> None:
+        """
+        Stops the background task and writes the pending deltas.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._checkpoint_task is not None:
+            await self._checkpoint_task
+            self._checkpoint_task = None
+        await self.checkpoint()
+
+
+conversion_rollups = ConversionRollups(
+    checkpoint_seconds=ROLLUP_CHECKPOINT_SECONDS,
+    cache_max_users=ROLLUP_CACHE_MAX_USERS,
+    cache_ttl_seconds=ROLLUP_CACHE_TTL_SECONDS,
+)
+query_recorder.subscribe(conversion_rollups.apply)
@@ -0,0 +1,155 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Literal, Optional
+
+import numpy as np
+from pydantic import BaseModel, conint
+
+from project.convert_currency_service import rate_refresher
+from project.currency_query_recorder import query_recorder
+from project.fixed_point import (
+    convert_minor,
+    exponents,
+    format_rate,
+    minor_unit_table,
+    scale_rates,
+)
+
+
+class AmountListLengthError(Exception):
+    """
+    Raised when target_currencies or base_currencies has neither one entry nor one entry per amount.
+    """
+
+
+class AmountConversionRequest(BaseModel):
+    """
+    Request body for converting amounts in minor units. Item i converts amounts[i] from base_currencies[i] (or the request's base currency) to target_currencies[i]; a single target applies to every item.
+    """
+
+    amounts: List[conint(ge=-(2**63), le=2**63 - 1)]
+    target_currencies: List[str]
+    base_currencies: Optional[List[str]] = None
+    rounding: Literal["half_even", "half_up", "down"] = "half_even"
+
+
+class AmountConversionResponse(BaseModel):
+    """
+    Converted amounts in minor units of their target currencies, parallel to the request's amounts.
+
+    converted_amounts[i] is None where statuses[i] is not 'success'. rates maps each converted 'BASE/TARGET' pair to
+    the exact decimal rate that was applied, and minor_units the exponent of every currency in the request.
+    """
+
+    base_currency: str
+    rounding: str
+    converted_amounts: List[Optional[int]]
+    statuses: List[str]
+    rates: Dict[str, str]
+    minor_units: Dict[str, int]
+    timestamp: Optional[datetime] = None
+    snapshot_id: Optional[int] = None
+    snapshot_age_seconds: float = 0.0
+    stale: bool = False
+
+
+async def convert_amounts(
+    base_currency: str,
+    request: AmountConversionRequest,
+    user_id: Optional[str] = None,
+) -> AmountConversionResponse:
+    """
+    Converts amounts given as integer minor units (cents for USD, yen for JPY, fils for KWD) with fixed-point arithmetic.
+
+    Rates from one snapshot are scaled to integers and every amount is converted and rounded once with exact integer
+    math, so the same request against the same snapshot always produces the same amounts.
+
+    Args:
+        base_currency (str): The base currency code for items without their own base.
+        request (AmountConversionRequest): Amounts in base minor units, their targets, optional per-item bases and the rounding mode ('half_even', 'half_up' or 'down').
+        user_id (Optional[str]): The authenticated user, if any. Each converted currency pair is queued for the history table once.
+
+    Returns:
+        AmountConversionResponse: The converted amounts in target minor units. Items whose currency is not in the
+        snapshot have status 'unknown_currency'; items whose result does not fit in a signed 64-bit integer have
+        status 'overflow'.
+
+    Raises:
+        StaleRatesError: If no sufficiently fresh rate snapshot is available.
+        AmountListLengthError: If the lists have mismatched lengths.
+        ValueError: If the rounding mode is unknown.
+
+    Example:
+        response = await convert_amounts("USD", AmountConversionRequest(amounts=[1999], target_currencies=["JPY"]))
+        print(response.converted_amounts)
+    """
+    count = len(request.amounts)
+    targets = request.target_currencies
+    if len(targets) == 1:
+        targets = targets * count
+    bases = request.base_currencies or [base_currency] * count
+    if len(targets) != count or len(bases) != count:
+        raise AmountListLengthError(
+            "target_currencies and base_currencies must have one entry or one per amount"
+        )
+
+    matrix = await rate_refresher.get_snapshot()
+    age = rate_refresher.age_seconds(matrix)
+    rates, known = matrix.cross_rates(bases, targets)
+    base_exponents = exponents(bases)
+    target_exponents = exponents(targets)
+    scaled, scales = scale_rates(rates, base_exponents, target_exponents)
+    converted, fits = convert_minor(
+        np.asarray(request.amounts, dtype=np.int64),
+        scaled,
+        scales,
+        base_exponents,
+        target_exponents,
+        request.rounding,
+    )
+    ok = known & fits
+    statuses = np.where(
+        known, np.where(fits, "success", "overflow"), "unknown_currency"
+    ).tolist()
+    converted_amounts = [
+        amount if success else None
+        for amount, success in zip(converted.tolist(), ok.tolist())
+    ]
+
+    applied = {}
+    for base, target, rate, scale, success in zip(
+        bases, targets, scaled.tolist(), scales.tolist(), ok.tolist()
+    ):
+        if success and (base, target) not in applied:
+            applied[(base, target)] = (rate, scale)
+
+    if user_id is not None:
+        recorded_at = datetime.now(timezone.utc)
+        await query_recorder.record(
+            [
+                {
+                    "userId": user_id,
+                    "baseCurrency": base,
+                    "targetCurrency": target,
+                    "exchangeRate": rate / 10**scale,
+                    "timestamp": recorded_at,
+                }
+                for (base, target), (rate, scale) in applied.items()
+            ]
+        )
+
+    # Values come straight from the validated request and the snapshot, so skip validation.
+    return AmountConversionResponse.construct(
+        base_currency=base_currency,
+        rounding=request.rounding,
+        converted_amounts=converted_amounts,
+        statuses=statuses,
+        rates={
+            f"{base}/{target}": format_rate(rate, scale)
+            for (base, target), (rate, scale) in applied.items()
+        },
+        minor_units=minor_unit_table({*bases, *targets}),
+        timestamp=matrix.fetched_at,
+        snapshot_id=matrix.snapshot_id,
+        snapshot_age_seconds=age,
+        stale=age > rate_refresher.stale_after_seconds,
+    )
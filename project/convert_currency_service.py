@@ -1,9 +1,39 @@
+import os
 from datetime import datetime
-from typing import List
+from typing import List, Optional, Tuple
 
-import httpx
 from pydantic import BaseModel
 
+from project.convert_response_cache import (
+    EncodedConvertResponse,
+    convert_response_cache,
+)
+from project.currency_query_recorder import query_recorder
+from project.rate_broadcaster import rate_broadcaster
+from project.rate_cache import rate_cache
+from project.rate_engine import RateEngine, RateMatrix
+from project.rate_history_store import rate_history_store
+from project.rate_provider_scheduler import ProviderScheduler
+from project.rate_refresher import RateRefresher
+from project.shared_rate_snapshot import shared_rate_snapshot
+
+RATES_API_URL = os.getenv("RATES_API_URL", "http://api.example.com")
+RATES_API_KEY = os.getenv("RATES_API_KEY", "API_KEY")
+RATE_PROVIDER_QUOTA_WINDOW_SECONDS = float(
+    os.getenv("RATE_PROVIDER_QUOTA_WINDOW_SECONDS", str(30 * 24 * 3600))
+)
+RATE_PROVIDER_SYNC_INTERVAL_SECONDS = float(
+    os.getenv("RATE_PROVIDER_SYNC_INTERVAL_SECONDS", "60")
+)
+RATE_PROVIDER_FAILURE_COOLDOWN_SECONDS = float(
+    os.getenv("RATE_PROVIDER_FAILURE_COOLDOWN_SECONDS", "5")
+)
+RATE_PIVOT_CURRENCY = os.getenv("RATE_PIVOT_CURRENCY", "USD")
+RATE_REFRESH_INTERVAL_SECONDS = float(os.getenv("RATE_REFRESH_INTERVAL_SECONDS", "30"))
+RATE_REFRESH_RETRY_SECONDS = float(os.getenv("RATE_REFRESH_RETRY_SECONDS", "5"))
+RATE_STALE_AFTER_SECONDS = float(os.getenv("RATE_STALE_AFTER_SECONDS", "90"))
+RATE_MAX_STALENESS_SECONDS = float(os.getenv("RATE_MAX_STALENESS_SECONDS", "3600"))
+
 
 class TargetCurrencyDetail(BaseModel):
     """
@@ -22,11 +52,85 @@ class ConvertCurrencyResponse(BaseModel):
     base_currency: str
     target_currencies: List[TargetCurrencyDetail]
     timestamp: datetime
+    snapshot_age_seconds: float = 0.0
+    stale: bool = False
+
+
+provider_scheduler = ProviderScheduler(
+    default_base_url=RATES_API_URL,
+    default_api_key=RATES_API_KEY,
+    quota_window_seconds=RATE_PROVIDER_QUOTA_WINDOW_SECONDS,
+    sync_interval_seconds=RATE_PROVIDER_SYNC_INTERVAL_SECONDS,
+    failure_cooldown_seconds=RATE_PROVIDER_FAILURE_COOLDOWN_SECONDS,
+)
+
+
+async def fetch_all_exchange_rates(base: str) -> dict:
+    """
+    Fetches the full rate table for the base currency from the external APIs, bypassing the rate cache.
+
+    The request is routed by the provider scheduler to the configured provider with the most quota headroom and
+    lowest latency, failing over to the others on errors.
+
+    Args:
+        base (str): The base currency code.
+
+    Returns:
+        dict: A dictionary with every currency code the API knows as keys and exchange rates as values.
+
+    Raises:
+        ProvidersUnavailableError: If no provider could serve the request.
+    """
+    return await provider_scheduler.fetch_rates(base)
+
+
+async def fetch_pivot_rates(pivot: str) -> dict:
+    """
+    Returns the cached full rate table for the pivot currency, loading it from the external API on a miss.
+
+    Args:
+        pivot (str): The pivot currency code.
+
+    Returns:
+        dict: The pivot rate table. The same dict object is returned for as long as the cache entry is live.
+    """
+    return await rate_cache.get(pivot, fetch_all_exchange_rates)
+
+
+rate_engine = RateEngine(RATE_PIVOT_CURRENCY, fetch_pivot_rates)
+rate_refresher = RateRefresher(
+    rate_engine,
+    fetch_all_exchange_rates,
+    interval_seconds=RATE_REFRESH_INTERVAL_SECONDS,
+    retry_seconds=RATE_REFRESH_RETRY_SECONDS,
+    stale_after_seconds=RATE_STALE_AFTER_SECONDS,
+    max_staleness_seconds=RATE_MAX_STALENESS_SECONDS,
+    shared=shared_rate_snapshot,
+    warm_start=rate_history_store.latest,
+)
+
+
+def record_rate_history(matrix: RateMatrix) -> None:
+    """
+    Appends a published snapshot to the rate history store.
+
+    With a shared snapshot every worker publishes each snapshot, so only the worker that fetched it records it.
+    """
+    if rate_refresher.leading:
+        rate_history_store.append(matrix)
+
+
+rate_engine.subscribe(record_rate_history)
+rate_engine.subscribe(rate_broadcaster.publish)
+rate_engine.subscribe(convert_response_cache.invalidate)
 
 
 async def fetch_exchange_rate(base: str, targets: List[str]) -> dict:
     """
-    Fetches the exchange rates for the base currency compared to the target currencies from an external API.
+    Fetches the exchange rates for the base currency compared to the target currencies.
+
+    Rates are cross rates derived from the current rate snapshot, so any base currency is answered without an
+    upstream call.
 
     Args:
         base (str): The base currency code.
@@ -35,38 +139,109 @@ async def fetch_exchange_rate(base: str, targets: List[str]) -> dict:
     Returns:
         dict: A dictionary with target currency codes as keys and exchange rates as values.
     """
-    api_url = f"http://api.example.com/latest?access_key=API_KEY&base={base}&symbols={','.join(targets)}"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(api_url)
-        if response.status_code == 200:
-            data = response.json()
-            rates = data["rates"]
-            return rates
-        else:
-            return {}
+    matrix = await rate_refresher.get_snapshot()
+    return matrix.rates(base, targets)
 
 
-async def convert_currency(base: str, targets: str) -> ConvertCurrencyResponse:
+async def convert_currency(
+    base: str,
+    targets: str,
+    user_id: Optional[str] = None,
+    as_of: Optional[datetime] = None,
+) -> ConvertCurrencyResponse:
     """
     Converts base currency to target currencies using real-time exchange rates.
 
     Args:
         base (str): The base currency code to convert from, e.g., 'USD'.
         targets (str): A comma-separated string of target currency codes to convert to, e.g., 'EUR,JPY'. Can also accept a special keyword 'all' to convert to all available currencies.
+        user_id (Optional[str]): The authenticated user, if any. Their conversion is queued for the history table.
+        as_of (Optional[datetime]): Convert at the rates in effect at this time, read from the rate history store instead of the live snapshot.
 
     Returns:
         ConvertCurrencyResponse: Includes the conversion rate(s), base and target currency codes, and a timestamp. Designed to provide a comprehensive outcome of the conversion request.
+
+    Raises:
+        StaleRatesError: If no sufficiently fresh rate snapshot is available.
+        RateHistoryUnavailableError: If as_of is given and no rates were recorded at or before it.
     """
-    all_targets = ["EUR", "JPY", "GBP", "AUD", "CAD", "CHF", "CNH", "SEK", "NZD"]
-    target_currencies = targets.split(",") if targets != "all" else all_targets
-    rates = await fetch_exchange_rate(base, target_currencies)
+    if as_of is not None:
+        matrix = rate_history_store.as_of(as_of)
+        age = as_of.timestamp() - matrix.fetched_at.timestamp()
+    else:
+        matrix = await rate_refresher.get_snapshot()
+        age = rate_refresher.age_seconds(matrix)
+    rates = (
+        matrix.row(base) if targets == "all" else matrix.rates(base, targets.split(","))
+    )
+    if user_id is not None and as_of is None:
+        await query_recorder.record_conversions(user_id, base, rates)
     target_currency_details = [
-        TargetCurrencyDetail(currency_code=target, exchange_rate=rates.get(target, 0))
-        for target in target_currencies
-        if target in rates
+        TargetCurrencyDetail(currency_code=target, exchange_rate=rate)
+        for target, rate in rates.items()
     ]
     return ConvertCurrencyResponse(
         base_currency=base,
         target_currencies=target_currency_details,
-        timestamp=datetime.now(),
+        timestamp=matrix.fetched_at,
+        snapshot_age_seconds=age,
+        stale=as_of is None and age > rate_refresher.stale_after_seconds,
+    )
+
+
+def encode_convert_response(
+    matrix: RateMatrix, base: str, targets: str
+) -> EncodedConvertResponse:
+    """
+    Encodes the ConvertCurrencyResponse fields that are fixed for a snapshot, in the order the model declares them.
+    """
+    rates = (
+        matrix.row(base) if targets == "all" else matrix.rates(base, targets.split(","))
+    )
+    return EncodedConvertResponse(
+        rates,
+        {
+            "base_currency": base,
+            "target_currencies": [
+                {"currency_code": target, "exchange_rate": rate}
+                for target, rate in rates.items()
+            ],
+            "timestamp": matrix.fetched_at.isoformat(),
+        },
     )
+
+
+async def convert_currency_encoded(
+    base: str,
+    targets: str,
+    user_id: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+) -> Tuple[str, Optional[bytes]]:
+    """
+    Converts base currency to target currencies at the current snapshot, returning the response as encoded JSON.
+
+    The body is served from the encoded response cache, so repeated conversions skip building and encoding the
+    response model.
+
+    Args:
+        base (str): The base currency code to convert from, e.g., 'USD'.
+        targets (str): A comma-separated string of target currency codes, or 'all'.
+        user_id (Optional[str]): The authenticated user, if any. Their conversion is queued for the history table.
+        if_none_match (Optional[str]): The request's If-None-Match header, if any.
+
+    Returns:
+        Tuple[str, Optional[bytes]]: The response's ETag, and the encoded ConvertCurrencyResponse, or None if
+        if_none_match already lists the ETag.
+
+    Raises:
+        StaleRatesError: If no sufficiently fresh rate snapshot is available.
+    """
+    matrix = await rate_refresher.get_snapshot()
+    age = rate_refresher.age_seconds(matrix)
+    stale = age > rate_refresher.stale_after_seconds
+    entry = convert_response_cache.get(matrix, base, targets, encode_convert_response)
+    if user_id is not None:
+        await query_recorder.record_conversions(user_id, base, entry.rates)
+    if entry.matches(if_none_match, stale):
+        return entry.etag(stale), None
+    return entry.etag(stale), entry.body(age, stale)
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from project.rate_engine import RateMatrix
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONVERT_RESPONSE_CACHE_MAX_ENTRIES = int(
+    os.getenv("CONVERT_RESPONSE_CACHE_MAX_ENTRIES", "1024")
+)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encodes obj as compact JSON, with orjson when the optional package is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class EncodedConvertResponse:
+    """
+    A /convert response body encoded once per (snapshot, base, targets).
+
+    Everything but the trailing snapshot_age_seconds and stale fields is fixed for a snapshot, so the body is
+    kept as encoded bytes up to those fields and only they are formatted per request. The ETag is derived
+    from the fixed part; it is a weak validator because snapshot_age_seconds differs between responses that
+    carry the same rates.
+    """
+
+    def __init__(self, rates: Dict[str, float], document: Dict[str, Any]):
+        self.rates = rates
+        encoded = dumps(document)
+        self._prefix = encoded[:-1] + b',"snapshot_age_seconds":'
+        digest = hashlib.blake2b(encoded, digest_size=12).hexdigest()
+        self._etags = (f'W/"{digest}"', f'W/"{digest}-stale"')
+
+    def etag(self, stale: bool) -> str:
+        return self._etags[stale]
+
+    def body(self, age_seconds: float, stale: bool) -> bytes:
+        return b'%s%s,"stale":%s}' % (
+            self._prefix,
+            repr(float(age_seconds)).encode(),
+            b"true" if stale else b"false",
+        )
+
+    def matches(self, if_none_match: Optional[str], stale: bool) -> bool:
+        """
+        Returns whether an If-None-Match header value lists this response's ETag, using weak comparison.
+        """
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        etag = self._etags[stale][2:]
+        return any(
+            candidate.strip().removeprefix("W/") == etag
+            for candidate in if_none_match.split(",")
+        )
+
+
+class ConvertResponseCache:
+    """
+    In-process cache of encoded /convert responses for the current rate snapshot.
+
+    Entries are keyed by (base, targets) and belong to a single snapshot: the cache is emptied whenever a new
+    snapshot is published, and the least recently used entry is evicted once the cache is full. Requests still
+    holding an older snapshot get a freshly built response that is not cached.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._snapshot_id = 0
+        self._entries: "OrderedDict[Tuple[str, str], EncodedConvertResponse]" = (
+            OrderedDict()
+        )
+
+    def get(
+        self,
+        matrix: RateMatrix,
+        base: str,
+        targets: str,
+        build: Callable[[RateMatrix, str, str], EncodedConvertResponse],
+    ) -> EncodedConvertResponse:
+        """
+        Returns the encoded response for the base and targets at the matrix's snapshot, building it on a miss.
+
+        Args:
+            matrix (RateMatrix): The snapshot the response is for.
+            base (str): The base currency code.
+            targets (str): The targets path segment, as given in the request.
+            build (Callable[[RateMatrix, str, str], EncodedConvertResponse]): Builds the response on a miss.
+
+        Returns:
+            EncodedConvertResponse: The cached or newly built response.
+        """
+        if matrix.snapshot_id != self._snapshot_id:
+            if matrix.snapshot_id < self._snapshot_id:
+                self.misses += 1
+                return build(matrix, base, targets)
+            self.invalidate(matrix)
+        key = (base, targets)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = build(matrix, base, targets)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, matrix: RateMatrix) -> None:
+        """
+        Drops every cached response. Subscribed to the rate engine so it runs for each new snapshot.
+        """
+        self._entries.clear()
+        self._snapshot_id = max(self._snapshot_id, matrix.snapshot_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+convert_response_cache = ConvertResponseCache(CONVERT_RESPONSE_CACHE_MAX_ENTRIES)
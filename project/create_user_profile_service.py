@@ -1,11 +1,13 @@
 from datetime import datetime
 
-import bcrypt
 import prisma
 import prisma.enums
 import prisma.models
 from pydantic import BaseModel
 
+from project.metrics import db_query
+from project.password_hashing import password_hasher
+
 
 class CreateUserProfileResponse(BaseModel):
     """
@@ -35,19 +37,20 @@ async def create_user_profile(
     Returns:
     CreateUserProfileResponse: The response model returning the newly created user profile's public information.
     """
-    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    hashed_password = await password_hasher.hash(password)
     user_role = (
         prisma.enums.UserRole.USER
         if role.upper() not in prisma.enums.UserRole._member_names_
         else prisma.enums.UserRole[role.upper()]
     )
-    user = await prisma.models.User.prisma().create(
-        data={
-            "email": email,
-            "password": hashed_password.decode("utf-8"),
-            "role": user_role,
-        }
-    )
+    with db_query("User", "create"):
+        user = await prisma.models.User.prisma().create(
+            data={
+                "email": email,
+                "password": hashed_password,
+                "role": user_role,
+            }
+        )
     return CreateUserProfileResponse(
         id=user.id,
         email=user.email,
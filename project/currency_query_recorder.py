@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+from project.database import database
+from project.metrics import db_query
+
+logger = logging.getLogger(__name__)
+
+QUERY_RECORDER_MAX_QUEUE = int(os.getenv("QUERY_RECORDER_MAX_QUEUE", "10000"))
+QUERY_RECORDER_BATCH_SIZE = int(os.getenv("QUERY_RECORDER_BATCH_SIZE", "500"))
+QUERY_RECORDER_FLUSH_INTERVAL_SECONDS = float(
+    os.getenv("QUERY_RECORDER_FLUSH_INTERVAL_SECONDS", "1")
+)
+QUERY_RECORDER_OVERFLOW_POLICY = os.getenv("QUERY_RECORDER_OVERFLOW_POLICY", "drop")
+
+
+class RecorderStats(BaseModel):
+    """
+    Counters describing the write-behind queue and its flushes.
+    """
+
+    queue_depth: int
+    enqueued: int
+    dropped: int
+    flushed_rows: int
+    flushes: int
+    flush_errors: int
+    last_batch_size: int
+    last_flush_seconds: float
+    max_flush_seconds: float
+    total_flush_seconds: float
+
+
+class CurrencyQueryRecorder:
+    """
+    Write-behind recorder for CurrencyQuery rows.
+
+    Conversions push rows onto a bounded in-memory queue and return immediately; a background task drains the
+    queue with create_many once a batch is full or the flush interval has passed. When the queue is full, rows
+    are either dropped (and counted) or the caller waits for room, depending on the overflow policy. Stopping
+    the recorder flushes everything still queued.
+    """
+
+    def __init__(
+        self,
+        max_queue: int,
+        batch_size: int,
+        flush_interval_seconds: float,
+        overflow_policy: str,
+    ):
+        if overflow_policy not in ("drop", "block"):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.overflow_policy = overflow_policy
+        self.queue: "asyncio.Queue[Dict]" = asyncio.Queue(maxsize=max_queue)
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.last_batch_size = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        self._subscribers: List[Callable[[List[Dict]], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._idle = True
+        self._closing = False
+
+    def subscribe(self, callback: Callable[[List[Dict]], None]) -> None:
+        """
+        Registers a callback invoked with every batch of rows once it has been written.
+        """
+        self._subscribers.append(callback)
+
+    async def record(self, rows: List[Dict]) -> None:
+        """
+        Queues CurrencyQuery rows for insertion.
+
+        Args:
+            rows (List[Dict]): CurrencyQuery create payloads.
+        """
+        for row in rows:
+            if self.overflow_policy == "block":
+                await self.queue.put(row)
+            else:
+                try:
+                    self.queue.put_nowait(row)
+                except asyncio.QueueFull:
+                    self.dropped += 1
+                    continue
+            self.enqueued += 1
+
+    async def record_conversions(
+        self, user_id: str, base: str, rates: Dict[str, float]
+    ) -> None:
+        """
+        Queues one CurrencyQuery row per target currency of a conversion.
+
+        Args:
+            user_id (str): The user who requested the conversion.
+            base (str): The base currency code.
+            rates (Dict[str, float]): Target currency codes mapped to the rates returned.
+        """
+        timestamp = datetime.now(timezone.utc)
+        await self.record(
+            [
+                {
+                    "userId": user_id,
+                    "baseCurrency": base,
+                    "targetCurrency": target,
+                    "exchangeRate": rate,
+                    "timestamp": timestamp,
+                }
+                for target, rate in rates.items()
+            ]
+        )
+
+    async def _flush(self, batch: List[Dict]) -> None:
+        started = time.perf_counter()
+        try:
+            await database.ensure_connected()
+            with db_query("CurrencyQuery", "create_many"):
+                await prisma.models.CurrencyQuery.prisma().create_many(data=batch)
+        except Exception:
+            self.flush_errors += 1
+            logger.exception("Failed to write %d currency queries", len(batch))
+            return
+        finally:
+            elapsed = time.perf_counter() - started
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self.total_flush_seconds += elapsed
+            self.last_batch_size = len(batch)
+            self.flushes += 1
+        self.flushed_rows += len(batch)
+        for callback in self._subscribers:
+            try:
+                callback(batch)
+            except Exception:
+                logger.exception("Currency query subscriber failed")
+
+    def _drain(self, batch: List[Dict]) -> None:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _run(self) -> None:
+        while not self._closing:
+            self._idle = True
+            batch = [await self.queue.get()]
+            self._idle = False
+            deadline = time.monotonic() + self.flush_interval_seconds
+            self._drain(batch)
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+                self._drain(batch)
+            await self._flush(batch)
+
+    async def start(self) -> None:
+        """
+        Starts the background flusher.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the background flusher and writes every row still queued.
+        """
+        self._closing = True
+        if self._task is not None:
+            # Only interrupt the flusher while it waits for work, so a batch already taken off the queue is not lost.
+            if self._idle:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._closing = False
+        while not self.queue.empty():
+            batch: List[Dict] = []
+            self._drain(batch)
+            await self._flush(batch)
+
+    def stats(self) -> RecorderStats:
+        return RecorderStats(
+            queue_depth=self.queue.qsize(),
+            enqueued=self.enqueued,
+            dropped=self.dropped,
+            flushed_rows=self.flushed_rows,
+            flushes=self.flushes,
+            flush_errors=self.flush_errors,
+            last_batch_size=self.last_batch_size,
+            last_flush_seconds=self.last_flush_seconds,
+            max_flush_seconds=self.max_flush_seconds,
+            total_flush_seconds=self.total_flush_seconds,
+        )
+
+
+query_recorder = CurrencyQueryRecorder(
+    max_queue=QUERY_RECORDER_MAX_QUEUE,
+    batch_size=QUERY_RECORDER_BATCH_SIZE,
+    flush_interval_seconds=QUERY_RECORDER_FLUSH_INTERVAL_SECONDS,
+    overflow_policy=QUERY_RECORDER_OVERFLOW_POLICY,
+)
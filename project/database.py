@@ -0,0 +1,59 @@
+import asyncio
+from typing import Optional
+
+import prisma
+
+from project.startup import startup_report
+
+
+class Database:
+    """
+    Owns the application's Prisma client.
+
+    The client is created on first use, so that in fast-start mode the generated Prisma package is only imported
+    once something needs the database, and ensure_connected() connects it on demand for callers that run
+    before or without the application lifespan having connected it.
+    """
+
+    def __init__(self):
+        self._client: Optional[prisma.Prisma] = None
+        self._connected = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def client(self) -> "prisma.Prisma":
+        if self._client is None:
+            self._client = prisma.Prisma(auto_register=True)
+        return self._client
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    async def ensure_connected(self) -> None:
+        """
+        Connects the client unless it already is. Concurrent callers share one connect.
+        """
+        if self._connected:
+            return
+        async with self._lock:
+            if self._connected:
+                return
+            with startup_report.stage("db_connect"):
+                await self.client.connect()
+            self._connected = True
+
+    async def disconnect(self) -> None:
+        if self._connected:
+            await self.client.disconnect()
+            self._connected = False
+
+
+async def require_database() -> None:
+    """
+    Route dependency connecting the database before a route that uses it runs.
+    """
+    await database.ensure_connected()
+
+
+database = Database()
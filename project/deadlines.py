@@ -0,0 +1,83 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Dict, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+# Monotonic time by which the current request must be answered, set by the admission control middleware.
+# Background tasks started from the lifespan run without one.
+request_deadline: ContextVar[Optional[float]] = ContextVar(
+    "request_deadline", default=None
+)
+
+
+def remaining() -> Optional[float]:
+    """
+    Returns the seconds left before the current request's deadline, or None if it has none. May be negative.
+    """
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def bounded(seconds: float) -> float:
+    """
+    Caps a wait or timeout at the time left before the current request's deadline.
+    """
+    left = remaining()
+    if left is None:
+        return seconds
+    return max(0.0, min(seconds, left))
+
+
+def clear() -> None:
+    """
+    Detaches the current task from the request's deadline, e.g. for work shared with other requests.
+    """
+    request_deadline.set(None)
+
+
+async def _detached(load: Awaitable[T]) -> T:
+    clear()
+    return await load
+
+
+class SharedLoad(Generic[T]):
+    """
+    A load shared by the concurrent requests that need the same result.
+
+    It runs detached from the deadline of the request that started it, since other requests wait for it too, and
+    a request giving up does not cancel it for the others; once every waiting request has given up (timed out or
+    disconnected) it is cancelled, along with the upstream call or query it is awaiting.
+
+    The load registers itself under its key in the owner's map of loads in flight, and leaves it when it finishes
+    or is cancelled, so the next request for the key starts a new load rather than joining a cancelled one.
+    """
+
+    def __init__(self, in_flight: Dict[K, "SharedLoad[T]"], key: K, load: Awaitable[T]):
+        self.in_flight = in_flight
+        self.key = key
+        self.task = asyncio.ensure_future(_detached(load))
+        self.task.add_done_callback(self._forget)
+        self.waiters = 0
+        in_flight[key] = self
+
+    def _forget(self, task: Optional[asyncio.Future] = None) -> None:
+        if self.in_flight.get(self.key) is self:
+            del self.in_flight[self.key]
+
+    async def join(self) -> T:
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        except asyncio.CancelledError:
+            if self.waiters == 1:
+                self.task.cancel()
+                # The task may take a while to unwind, or never start if it was just created.
+                self._forget()
+            raise
+        finally:
+            self.waiters -= 1
@@ -0,0 +1,189 @@
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# ISO 4217 currencies whose minor unit is not 1/100 of the major unit.
+ISO_MINOR_UNITS = {
+    **dict.fromkeys(
+        "BIF CLP DJF GNF ISK JPY KMF KRW PYG RWF UGX UYI VND VUV XAF XOF XPF".split(), 0
+    ),
+    **dict.fromkeys("BHD IQD JOD KWD LYD OMR TND".split(), 3),
+    **dict.fromkeys("CLF UYW".split(), 4),
+}
+DEFAULT_MINOR_UNITS = 2
+# Extra or overriding exponents, e.g. "BTC:8,XAU:0".
+CURRENCY_MINOR_UNITS = {
+    **ISO_MINOR_UNITS,
+    **{
+        code.strip(): int(exponent)
+        for code, exponent in (
+            item.split(":")
+            for item in os.getenv("CURRENCY_MINOR_UNITS", "").split(",")
+            if item.strip()
+        )
+    },
+}
+
+# Rates are scaled to integers with this many significant digits.
+RATE_SIGNIFICANT_DIGITS = 15
+# Largest power of ten a quotient is divided by; keeps remainders and their doubles within int64.
+MAX_DIVISOR_DIGITS = 18
+ROUNDING_MODES = ("half_even", "half_up", "down")
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+_SHIFT32 = np.uint64(32)
+_POWERS_OF_TEN = np.array([10**k for k in range(19)], dtype=np.uint64)
+
+
+def minor_units(code: str) -> int:
+    """
+    Returns the number of decimal places of the currency's minor unit, e.g. 2 for USD and 0 for JPY.
+    """
+    return CURRENCY_MINOR_UNITS.get(code, DEFAULT_MINOR_UNITS)
+
+
+def exponents(codes: Iterable[str]) -> np.ndarray:
+    return np.fromiter((minor_units(code) for code in codes), dtype=np.int64)
+
+
+def scale_rates(
+    rates: np.ndarray, base_exponents: np.ndarray, target_exponents: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Represents each rate as an integer R and a scale s, with rate ≈ R / 10**s.
+
+    R has RATE_SIGNIFICANT_DIGITS significant digits (rounded half to even from the float64 rate), fewer only where
+    more would make the division in convert_minor exceed 10**MAX_DIVISOR_DIGITS. The same rate always yields the
+    same R and s.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: R as int64, and s as int64.
+    """
+    rates = np.asarray(rates, dtype=np.float64)
+    positive = rates > 0
+    digits = np.floor(np.log10(np.where(positive, rates, 1.0))).astype(np.int64) + 1
+    scale = RATE_SIGNIFICANT_DIGITS - digits
+    # The conversion divides by 10**(s + e_base - e_target); keep that power within bounds.
+    scale = np.minimum(scale, MAX_DIVISOR_DIGITS - base_exponents + target_exponents)
+    scale = np.maximum(scale, target_exponents - base_exponents)
+    scaled = np.rint(rates * np.power(10.0, scale))
+    return np.where(positive, scaled, 0).astype(np.int64), scale
+
+
+def _multiply(a: np.ndarray, r: np.ndarray) -> List[np.ndarray]:
+    """
+    Multiplies unsigned 64-bit arrays (a < 2**63, r < 2**52) into four 32-bit limbs, least significant first.
+    """
+    a_lo, a_hi = a & _MASK32, a >> _SHIFT32
+    r_lo, r_hi = r & _MASK32, r >> _SHIFT32
+    lo_lo = a_lo * r_lo
+    lo_hi = a_lo * r_hi
+    hi_lo = a_hi * r_lo
+    hi_hi = a_hi * r_hi
+    carry = (lo_lo >> _SHIFT32) + (lo_hi & _MASK32) + (hi_lo & _MASK32)
+    limb1 = carry & _MASK32
+    carry = (carry >> _SHIFT32) + (lo_hi >> _SHIFT32) + (hi_lo >> _SHIFT32)
+    carry = carry + (hi_hi & _MASK32)
+    limb2 = carry & _MASK32
+    limb3 = (carry >> _SHIFT32) + (hi_hi >> _SHIFT32)
+    return [lo_lo & _MASK32, limb1, limb2, limb3]
+
+
+def _divide(limbs: List[np.ndarray], divisor: np.ndarray) -> np.ndarray:
+    """
+    Divides 32-bit limbs in place by divisors of at most 10**9 and returns the remainders.
+    """
+    remainder = np.zeros_like(divisor)
+    for i in range(len(limbs) - 1, -1, -1):
+        current = (remainder << _SHIFT32) | limbs[i]
+        limbs[i] = current // divisor
+        remainder = current - limbs[i] * divisor
+    return remainder
+
+
+def convert_minor(
+    amounts: np.ndarray,
+    rates: np.ndarray,
+    scales: np.ndarray,
+    base_exponents: np.ndarray,
+    target_exponents: np.ndarray,
+    rounding: str = "half_even",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts amounts in base minor units to target minor units using integer arithmetic only.
+
+    Each result is amount * R * 10**(e_target - e_base) / 10**s, rounded once with the given mode: the product is
+    kept exactly in 128 bits and divided by 10**(s + e_base - e_target) in two steps, so the result is the same as
+    exact decimal arithmetic with the scaled rate.
+
+    Args:
+        amounts (np.ndarray): Amounts in minor units of the base currencies, int64.
+        rates (np.ndarray): Scaled rates R from scale_rates, int64.
+        scales (np.ndarray): Rate scales s from scale_rates, int64.
+        base_exponents (np.ndarray): Minor unit exponents of the base currencies.
+        target_exponents (np.ndarray): Minor unit exponents of the target currencies.
+        rounding (str): 'half_even' (banker's rounding), 'half_up' (half away from zero) or 'down' (toward zero).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The converted amounts as int64, and a mask of the results that fit in int64.
+        Results outside the mask are 0.
+    """
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f"rounding must be one of {', '.join(ROUNDING_MODES)}")
+    amounts = np.asarray(amounts, dtype=np.int64)
+    negative = amounts < 0
+    # |INT64_MIN| does not fit in int64 but does in uint64.
+    magnitude = np.where(negative, -(amounts + 1), amounts).astype(np.uint64)
+    magnitude = magnitude + negative.astype(np.uint64)
+    limbs = _multiply(magnitude, np.asarray(rates, dtype=np.int64).astype(np.uint64))
+
+    divisor_digits = scales + base_exponents - target_exponents
+    first_digits = np.minimum(divisor_digits, 9)
+    first_divisor = _POWERS_OF_TEN[first_digits]
+    second_divisor = _POWERS_OF_TEN[divisor_digits - first_digits]
+    first_remainder = _divide(limbs, first_divisor)
+    second_remainder = _divide(limbs, second_divisor)
+    # floor(x / d1 / d2) == floor(x / (d1 * d2)), with remainder r1 + d1 * r2 < d1 * d2 <= 10**18.
+    remainder = first_remainder + first_divisor * second_remainder
+    divisor = _POWERS_OF_TEN[divisor_digits]
+
+    quotient = (limbs[1] << _SHIFT32) | limbs[0]
+    fits = (limbs[3] == 0) & (limbs[2] == 0) & (limbs[1] < np.uint64(2**31))
+    if rounding == "half_up":
+        round_up = 2 * remainder >= divisor
+    elif rounding == "half_even":
+        twice = 2 * remainder
+        round_up = (twice > divisor) | (
+            (twice == divisor) & (quotient & np.uint64(1) == 1)
+        )
+    else:
+        round_up = np.zeros(len(quotient), dtype=bool)
+    quotient = quotient + round_up.astype(np.uint64)
+    fits &= quotient < np.uint64(2**63)
+    result = np.where(fits, quotient, 0).astype(np.int64)
+    return np.where(negative, -result, result), fits
+
+
+def format_minor(amount: int, exponent: int) -> str:
+    """
+    Formats an amount in minor units as a decimal string, e.g. (-1234, 2) -> '-12.34'.
+    """
+    sign = "-" if amount < 0 else ""
+    digits = str(abs(amount)).rjust(exponent + 1, "0")
+    if exponent == 0:
+        return sign + digits
+    return f"{sign}{digits[:-exponent]}.{digits[-exponent:]}"
+
+
+def format_rate(rate: int, scale: int) -> str:
+    """
+    Formats a scaled rate R, s as the exact decimal R / 10**s, without trailing zeros.
+    """
+    if scale <= 0:
+        return str(rate * 10**-scale)
+    return format_minor(rate, scale).rstrip("0").rstrip(".")
+
+
+def minor_unit_table(codes: Iterable[str]) -> Dict[str, int]:
+    return {code: minor_units(code) for code in codes}
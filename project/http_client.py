@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import logging
+import os
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+UPSTREAM_KEEPALIVE_EXPIRY_SECONDS = float(
+    os.getenv("UPSTREAM_KEEPALIVE_EXPIRY_SECONDS", "30")
+)
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = float(
+    os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "2")
+)
+UPSTREAM_READ_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_READ_TIMEOUT_SECONDS", "5"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Builds a pooled HTTP client configured from the UPSTREAM_* environment variables.
+
+    HTTP/2 is only enabled when requested and the optional 'h2' package is installed.
+
+    Returns:
+        httpx.AsyncClient: A new client with connection limits, keep-alive and timeouts applied.
+    """
+    http2 = UPSTREAM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("UPSTREAM_HTTP2 is set but 'h2' is not installed")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            UPSTREAM_READ_TIMEOUT_SECONDS, connect=UPSTREAM_CONNECT_TIMEOUT_SECONDS
+        ),
+    )
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """
+    Creates the shared upstream client. Called once from the application lifespan.
+
+    Returns:
+        httpx.AsyncClient: The shared client.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    """
+    Closes the shared upstream client and its pooled connections.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared upstream client, creating it on first use when running outside the application lifespan.
+
+    Returns:
+        httpx.AsyncClient: The shared client.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
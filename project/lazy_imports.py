@@ -0,0 +1,93 @@
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import sys
+import threading
+import types
+from typing import Iterable, Optional
+
+_load_lock = threading.RLock()
+
+
+class _LazyModule(types.ModuleType):
+    """
+    A module whose code runs the first time an attribute it does not have yet is read.
+
+    Unlike importlib.util.LazyLoader, the attributes the import system sets up (__spec__, __path__, ...) are real,
+    so reading them does not load the module and submodules can be imported without loading their package.
+    """
+
+    def __getattr__(self, name: str):
+        # The import system probes for attributes while setting the module up; only later reads load it.
+        if not self.__dict__.get("_lazy_armed"):
+            raise AttributeError(name)
+        _load(self)
+        return getattr(self, name)
+
+
+def _load(module: types.ModuleType) -> None:
+    with _load_lock:
+        if not isinstance(module, _LazyModule):
+            return
+        parent = sys.modules.get(module.__spec__.parent)
+        if parent is not module and isinstance(parent, _LazyModule):
+            # Load the package first, as a normal import would. It may import this module itself.
+            _load(parent)
+            if not isinstance(module, _LazyModule):
+                return
+        spec = module.__spec__
+        spec.loader = spec.loader_state
+        spec.loader_state = None
+        module.__loader__ = spec.loader
+        module.__class__ = types.ModuleType
+        del module._lazy_armed
+        spec.loader.exec_module(module)
+
+
+class _DeferredLoader(importlib.abc.Loader):
+    def create_module(self, spec: importlib.machinery.ModuleSpec) -> types.ModuleType:
+        return _LazyModule(spec.name)
+
+    def exec_module(self, module: types.ModuleType) -> None:
+        module._lazy_armed = True
+
+
+class LazyImportFinder(importlib.abc.MetaPathFinder):
+    """
+    Defers running the code of the given pure-Python packages, and of their submodules imported before the package
+    is used, until an attribute of them is first read.
+    """
+
+    def __init__(self, packages: Iterable[str]):
+        self.packages = set(packages)
+
+    def find_spec(
+        self, fullname: str, path=None, target=None
+    ) -> Optional[importlib.machinery.ModuleSpec]:
+        root = fullname.partition(".")[0]
+        if root not in self.packages:
+            return None
+        # Once the package has been loaded, it imports its submodules normally.
+        if root in sys.modules and not isinstance(sys.modules[root], _LazyModule):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if not isinstance(spec.loader, importlib.machinery.SourceFileLoader):
+            return spec
+        spec.loader_state = spec.loader
+        spec.loader = _DeferredLoader()
+        return spec
+
+
+def install_lazy_imports(packages: Iterable[str]) -> None:
+    """
+    Makes the packages load on first use. Must run before anything imports them.
+    """
+    if not any(isinstance(finder, LazyImportFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0, LazyImportFinder(packages))
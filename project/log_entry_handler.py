@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+
+from project.database import database
+from project.metrics import db_query
+from project.rate_limiter import Limit, RateLimiter
+
+# Failures to write log entries go to this module's logger, which the handler does not persist.
+logger = logging.getLogger(__name__)
+
+LOG_ENTRY_ENABLED = os.getenv("LOG_ENTRY_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+LOG_ENTRY_LEVEL = os.getenv("LOG_ENTRY_LEVEL", "WARNING")
+LOG_ENTRY_MAX_QUEUE = int(os.getenv("LOG_ENTRY_MAX_QUEUE", "5000"))
+LOG_ENTRY_BATCH_SIZE = int(os.getenv("LOG_ENTRY_BATCH_SIZE", "200"))
+LOG_ENTRY_FLUSH_INTERVAL_SECONDS = float(
+    os.getenv("LOG_ENTRY_FLUSH_INTERVAL_SECONDS", "2")
+)
+LOG_ENTRY_MAX_MESSAGE_LENGTH = int(os.getenv("LOG_ENTRY_MAX_MESSAGE_LENGTH", "8000"))
+# Records per minute and burst per level; records over the cap are counted and summarized instead of written.
+LOG_ENTRY_RATE_PER_MINUTE = {
+    level.strip(): int(limit)
+    for level, limit in (
+        item.split(":")
+        for item in os.getenv(
+            "LOG_ENTRY_RATE_PER_MINUTE", "ERROR:600,WARNING:300,INFO:60,DEBUG:60"
+        ).split(",")
+        if item.strip()
+    )
+}
+LOG_ENTRY_BURST = int(os.getenv("LOG_ENTRY_BURST", "50"))
+# Loggers whose records are never persisted: this module's own, and the database client's.
+LOG_ENTRY_EXCLUDED_LOGGERS = (__name__, "prisma")
+
+
+def level_name(levelno: int) -> str:
+    """
+    Maps a logging level to a LogLevel member; CRITICAL is stored as ERROR.
+    """
+    if levelno >= logging.ERROR:
+        return "ERROR"
+    if levelno >= logging.WARNING:
+        return "WARNING"
+    if levelno >= logging.INFO:
+        return "INFO"
+    return "DEBUG"
+
+
+def level_limits(level: str) -> List[Limit]:
+    per_minute = LOG_ENTRY_RATE_PER_MINUTE.get(level, 0)
+    if per_minute <= 0:
+        return []
+    return [Limit("rate", 60.0 / per_minute, LOG_ENTRY_BURST)]
+
+
+class LogEntryHandler(logging.Handler):
+    """
+    Logging handler persisting records to the LogEntry table without blocking the code that logs.
+
+    emit() formats the record and appends it to a bounded deque, from any thread and without awaiting; a
+    background task batch-inserts the queued entries with create_many once a batch is full or the flush interval
+    has passed. Each level is capped by a GCRA limiter, so an error storm writes at most the configured rate;
+    records over the cap, or arriving while the queue is full, are counted and written as one WARNING summary
+    entry per flush. Stopping the handler writes everything still queued.
+    """
+
+    def __init__(
+        self,
+        level: str,
+        max_queue: int,
+        batch_size: int,
+        flush_interval_seconds: float,
+        max_message_length: int,
+    ):
+        super().__init__(logging.getLevelName(level))
+        self.setFormatter(logging.Formatter("%(name)s: %(message)s"))
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_message_length = max_message_length
+        self.limiter = RateLimiter(max_keys=4, sweep_seconds=60.0, limits=level_limits)
+        self.queue: Deque[Dict] = deque()
+        self.enqueued = 0
+        self.written = 0
+        self.flush_errors = 0
+        self.suppressed: Dict[str, int] = {}
+        self._unreported: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def _suppress(self, level: str) -> None:
+        self.suppressed[level] = self.suppressed.get(level, 0) + 1
+        self._unreported[level] = self._unreported.get(level, 0) + 1
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.name.startswith(LOG_ENTRY_EXCLUDED_LOGGERS):
+            return
+        level = level_name(record.levelno)
+        if (
+            len(self.queue) >= self.max_queue
+            or not self.limiter.check(level, level).allowed
+        ):
+            self._suppress(level)
+            return
+        try:
+            message = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self.queue.append(
+            {
+                "level": level,
+                "message": message[: self.max_message_length],
+                "timestamp": datetime.fromtimestamp(record.created, timezone.utc),
+            }
+        )
+        self.enqueued += 1
+        if len(self.queue) == self.batch_size and self._loop is not None:
+            # emit() may run on another thread, e.g. the password hashing pool.
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _take(self) -> List[Dict]:
+        batch = []
+        while self.queue and len(batch) < self.batch_size:
+            batch.append(self.queue.popleft())
+        if self._unreported:
+            counts, self._unreported = self._unreported, {}
+            batch.append(
+                {
+                    "level": "WARNING",
+                    "message": "Suppressed log records over the rate cap or queue limit: "
+                    + ", ".join(f"{level} {count}" for level, count in counts.items()),
+                    "timestamp": datetime.now(timezone.utc),
+                }
+            )
+        return batch
+
+    async def _flush(self, batch: List[Dict]) -> None:
+        for entry in batch:
+            entry["level"] = prisma.enums.LogLevel[entry["level"]]
+        try:
+            await database.ensure_connected()
+            with db_query("LogEntry", "create_many"):
+                await prisma.models.LogEntry.prisma().create_many(data=batch)
+        except Exception:
+            self.flush_errors += 1
+            logger.exception("Failed to write %d log entries", len(batch))
+            return
+        self.written += len(batch)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self.queue or self._unreported:
+                await self._flush(self._take())
+                if len(self.queue) < self.batch_size:
+                    break
+
+    async def start(self) -> None:
+        """
+        Starts the background writer and attaches the handler to the root logger.
+        """
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logging.getLogger().addHandler(self)
+
+    async def stop(self) -> None:
+        """
+        Detaches the handler, stops the background writer and writes every entry still queued.
+        """
+        if self._task is None:
+            return
+        logging.getLogger().removeHandler(self)
+        # Let a flush in progress finish rather than cancelling it, so its batch is not lost.
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        self._loop = None
+        self._closing = False
+        while self.queue or self._unreported:
+            await self._flush(self._take())
+
+
+log_entry_handler = LogEntryHandler(
+    level=LOG_ENTRY_LEVEL,
+    max_queue=LOG_ENTRY_MAX_QUEUE,
+    batch_size=LOG_ENTRY_BATCH_SIZE,
+    flush_interval_seconds=LOG_ENTRY_FLUSH_INTERVAL_SECONDS,
+    max_message_length=LOG_ENTRY_MAX_MESSAGE_LENGTH,
+)
@@ -0,0 +1,30 @@
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+from project.auth_token_cache import auth_token_cache
+from project.metrics import db_query
+
+
+class LogoutResponse(BaseModel):
+    """
+    Confirms that the session token has been revoked.
+    """
+
+    success: bool
+
+
+async def logout_user(token: str) -> LogoutResponse:
+    """
+    Revokes a session token and drops it from the token cache.
+
+    Args:
+    token (str): The bearer token of the session to end.
+
+    Returns:
+    LogoutResponse: Confirms that the session token has been revoked.
+    """
+    with db_query("AuthToken", "delete_many"):
+        await prisma.models.AuthToken.prisma().delete_many(where={"token": token})
+    auth_token_cache.invalidate_token(token)
+    return LogoutResponse(success=True)
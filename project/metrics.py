@@ -0,0 +1,347 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.routing import Match
+
+from project.startup import startup_report
+
+METRICS_LOOP_LAG_INTERVAL_SECONDS = float(
+    os.getenv("METRICS_LOOP_LAG_INTERVAL_SECONDS", "0.5")
+)
+
+# Routes are labelled by their path template, and unmatched paths share one label, so label cardinality is
+# bounded by the number of routes.
+UNMATCHED_ROUTE = "unmatched"
+# The method is whatever the client sent, so methods outside this set share one label as well.
+HTTP_METHODS = frozenset(("GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"))
+OTHER_METHOD = "other"
+
+# "METHOD route" of the request each task is serving, read by the profiler from its own thread.
+request_routes: Dict[asyncio.Task, str] = {}
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status code.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response. Includes the full lifetime of "
+    "streaming responses.",
+    ["method", "route"],
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served.",
+    ["method", "route"],
+)
+UPSTREAM_FETCH_DURATION = Histogram(
+    "upstream_fetch_duration_seconds",
+    "Latency of rate fetches from upstream providers.",
+    ["provider"],
+)
+UPSTREAM_FETCH_ERRORS = Counter(
+    "upstream_fetch_errors_total",
+    "Failed rate fetches from upstream providers.",
+    ["provider", "reason"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Latency of Prisma queries.",
+    ["model", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total",
+    "Prisma queries that raised.",
+    ["model", "operation"],
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Time to hash or verify a password, including time queued for a worker.",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a timer scheduled by the lag sampler.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+def route_label(routes, scope) -> str:
+    """
+    Returns the path template of the route matching a request, or UNMATCHED_ROUTE.
+    """
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request count, latency and in-flight requests per route.
+
+    Paths of routes without path parameters are looked up in a dict; only the remaining routes are matched one by
+    one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._static_paths: Optional[Dict[str, str]] = None
+        self._dynamic_routes: List = []
+
+    def _route(self, scope) -> str:
+        if self._static_paths is None:
+            routes = scope["app"].router.routes
+            self._static_paths = {
+                route.path: route.path
+                for route in routes
+                if "{" not in getattr(route, "path", "{")
+            }
+            self._dynamic_routes = [
+                route
+                for route in routes
+                if getattr(route, "path", None) not in self._static_paths
+            ]
+        label = self._static_paths.get(scope["path"])
+        if label is not None:
+            return label
+        return route_label(self._dynamic_routes, scope)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        if method not in HTTP_METHODS:
+            method = OTHER_METHOD
+        route = self._route(scope)
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method, route)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        task = asyncio.current_task()
+        request_routes[task] = f"{method} {route}"
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            request_routes.pop(task, None)
+            duration = time.perf_counter() - started
+            HTTP_REQUEST_DURATION.labels(method, route).observe(duration)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            if startup_report.first_route is None:
+                startup_report.request_done(f"{method} {route}", duration)
+
+
+@contextmanager
+def db_query(model: str, operation: str) -> Iterator[None]:
+    """
+    Times the Prisma query awaited inside the block.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_QUERY_ERRORS.labels(model, operation).inc()
+        raise
+    finally:
+        DB_QUERY_DURATION.labels(model, operation).observe(
+            time.perf_counter() - started
+        )
+
+
+class EventLoopLagMonitor:
+    """
+    Measures event loop lag by sleeping for a fixed interval and recording how late the wakeup was.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.last_lag_seconds = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            self.last_lag_seconds = max(0.0, time.perf_counter() - expected)
+            EVENT_LOOP_LAG.observe(self.last_lag_seconds)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class ServiceStateCollector:
+    """
+    Exposes the counters kept by the service's own components, read at scrape time.
+    """
+
+    def describe(self):
+        # Registering a collector without describe() makes the registry call collect() right away, which would
+        # import the modules below while they are still importing this one.
+        return []
+
+    def collect(self):
+        # Imported here: these modules import this one.
+        from project.admission_control import admission_gates
+        from project.conversion_rollups import conversion_rollups
+        from project.convert_currency_service import rate_refresher
+        from project.convert_response_cache import convert_response_cache
+        from project.currency_query_recorder import query_recorder
+        from project.log_entry_handler import log_entry_handler
+        from project.password_hashing import password_hasher
+        from project.rate_broadcaster import rate_broadcaster
+        from project.rate_limiter import rate_limiter
+
+        stats = query_recorder.stats()
+        counters: Dict[str, Tuple[str, float]] = {
+            "query_recorder_enqueued": ("Rows queued.", stats.enqueued),
+            "query_recorder_dropped": ("Rows dropped on overflow.", stats.dropped),
+            "query_recorder_flushed_rows": ("Rows written.", stats.flushed_rows),
+            "query_recorder_flushes": ("Batches written.", stats.flushes),
+            "query_recorder_flush_errors": ("Failed batches.", stats.flush_errors),
+            "convert_response_cache_hits": (
+                "Conversions served from an encoded response.",
+                convert_response_cache.hits,
+            ),
+            "convert_response_cache_misses": (
+                "Conversions that encoded a new response.",
+                convert_response_cache.misses,
+            ),
+            "conversion_rollup_checkpoints": (
+                "Conversion rollup checkpoints written.",
+                conversion_rollups.checkpoints,
+            ),
+            "conversion_rollup_checkpoint_errors": (
+                "Failed conversion rollup checkpoints.",
+                conversion_rollups.checkpoint_errors,
+            ),
+            "log_entries_written": (
+                "Log records written to the LogEntry table.",
+                log_entry_handler.written,
+            ),
+            "log_entry_flush_errors": (
+                "Failed LogEntry batches.",
+                log_entry_handler.flush_errors,
+            ),
+        }
+        for name, (documentation, value) in counters.items():
+            yield CounterMetricFamily(name, documentation, value=value)
+        gauges: Dict[str, Tuple[str, float]] = {
+            "query_recorder_queue_depth": (
+                "Rows waiting to be written.",
+                stats.queue_depth,
+            ),
+            "conversion_rollup_pending_pairs": (
+                "User currency pairs with conversions not yet checkpointed.",
+                conversion_rollups.pending,
+            ),
+            "password_hash_pending": (
+                "Password operations running or queued.",
+                password_hasher.pending,
+            ),
+            "convert_response_cache_entries": (
+                "Encoded responses cached for the current snapshot.",
+                len(convert_response_cache),
+            ),
+            "rate_stream_subscribers": (
+                "Open rate stream connections.",
+                rate_broadcaster.subscriber_count,
+            ),
+            "rate_limiter_keys": (
+                "Users and client IPs with requests still counted against a limit.",
+                len(rate_limiter),
+            ),
+            "event_loop_lag_last_seconds": (
+                "Most recent event loop lag sample.",
+                loop_lag_monitor.last_lag_seconds,
+            ),
+        }
+        if rate_refresher.shared is not None:
+            gauges["rate_snapshot_leader"] = (
+                "1 if this worker polls the upstream for the shared rate snapshot.",
+                float(rate_refresher.shared.leader),
+            )
+        matrix = rate_refresher.engine.current
+        if matrix is not None:
+            gauges["rate_snapshot_age_seconds"] = (
+                "Age of the rate snapshot being served.",
+                rate_refresher.age_seconds(matrix),
+            )
+        for name, (documentation, value) in gauges.items():
+            yield GaugeMetricFamily(name, documentation, value=value)
+        suppressed = CounterMetricFamily(
+            "log_entries_suppressed",
+            "Log records not written because of the per-level rate cap or a full queue.",
+            labels=["level"],
+        )
+        for level, count in log_entry_handler.suppressed.items():
+            suppressed.add_metric([level], count)
+        yield suppressed
+        in_flight = GaugeMetricFamily(
+            "admission_in_flight",
+            "Requests holding an admission slot, by route class.",
+            labels=["route_class"],
+        )
+        queued = GaugeMetricFamily(
+            "admission_queued",
+            "Requests waiting for an admission slot, by route class.",
+            labels=["route_class"],
+        )
+        for name, gate in admission_gates.items():
+            in_flight.add_metric([name], gate.in_flight)
+            queued.add_metric([name], gate.queued)
+        yield in_flight
+        yield queued
+        startup = GaugeMetricFamily(
+            "startup_stage_seconds",
+            "Duration of each startup stage; see project/startup.py.",
+            labels=["stage"],
+        )
+        for stage, seconds in startup_report.stages.items():
+            startup.add_metric([stage], seconds)
+        yield startup
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Returns the Prometheus text exposition of every registered metric, and its content type.
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+loop_lag_monitor = EventLoopLagMonitor(METRICS_LOOP_LAG_INTERVAL_SECONDS)
+REGISTRY.register(ServiceStateCollector())
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+from project.metrics import PASSWORD_HASH_DURATION
+
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1))
+)
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+
+class PasswordHasherBusyError(Exception):
+    """
+    Raised when the password hashing queue is full and the request should be rejected immediately.
+    """
+
+
+def _hash_password(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check_password(password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a bounded thread or process pool instead of the event loop.
+
+    At most `workers` operations run at once. Up to `max_queue` further operations may wait for a worker; beyond
+    that, calls fail fast with PasswordHasherBusyError so a login burst cannot build an unbounded backlog.
+    """
+
+    def __init__(self, executor_kind: str, workers: int, max_queue: int, rounds: int):
+        if executor_kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {executor_kind}")
+        self.executor_kind = executor_kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="bcrypt"
+                )
+        return self._executor
+
+    async def _submit(self, operation: str, fn, *args):
+        if self.pending >= self.workers + self.max_queue:
+            raise PasswordHasherBusyError("Too many pending password operations")
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(fn, *args)
+        self.pending += 1
+        # The slot is held until the job is done or dropped from the queue, not until the caller stops waiting:
+        # a request cancelled at its deadline leaves its bcrypt job running or queued.
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        started = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            PASSWORD_HASH_DURATION.labels(operation).observe(
+                time.perf_counter() - started
+            )
+
+    def _release(self) -> None:
+        self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """
+        Hashes a password with the configured bcrypt cost factor.
+
+        Args:
+            password (str): The plain text password.
+
+        Returns:
+            str: The bcrypt hash, including its salt and cost factor.
+
+        Raises:
+            PasswordHasherBusyError: If the hashing queue is full.
+        """
+        hashed = await self._submit(
+            "hash", _hash_password, password.encode("utf-8"), self.rounds
+        )
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        Checks a plain text password against a bcrypt hash.
+
+        Args:
+            password (str): The plain text password.
+            hashed_password (str): The stored bcrypt hash.
+
+        Returns:
+            bool: True if the password matches, False otherwise.
+
+        Raises:
+            PasswordHasherBusyError: If the hashing queue is full.
+        """
+        return await self._submit(
+            "verify",
+            _check_password,
+            password.encode("utf-8"),
+            hashed_password.encode("utf-8"),
+        )
+
+    def shutdown(self) -> None:
+        """
+        Shuts the worker pool down, waiting for running operations to finish.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    executor_kind=PASSWORD_HASH_EXECUTOR,
+    workers=PASSWORD_HASH_WORKERS,
+    max_queue=PASSWORD_HASH_MAX_QUEUE,
+    rounds=BCRYPT_ROUNDS,
+)
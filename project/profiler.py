@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from types import CodeType, FrameType
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from prometheus_client import Counter
+
+from project.metrics import request_routes
+
+logger = logging.getLogger(__name__)
+
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_INTERVAL_SECONDS = float(os.getenv("PROFILER_INTERVAL_SECONDS", "0.01"))
+PROFILER_MIN_INTERVAL_SECONDS = 0.001
+# Event loop steps longer than this are logged; 0 turns the detector off.
+SLOW_CALLBACK_SECONDS = float(os.getenv("SLOW_CALLBACK_SECONDS", "0.1"))
+
+SLOW_CALLBACKS = Counter(
+    "event_loop_slow_callbacks_total",
+    "Event loop steps longer than SLOW_CALLBACK_SECONDS, by the route being served.",
+    ["route"],
+)
+
+LOOP_THREAD = "event loop"
+BACKGROUND = "background"
+
+
+class ProfilerBusyError(Exception):
+    """
+    Raised when a profile is requested while another one is being taken in the same worker.
+    """
+
+
+def _code_label(frame: FrameType) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+
+def _frames(frame: Optional[FrameType]) -> List[FrameType]:
+    """
+    Returns the frames of a thread's stack, outermost first.
+    """
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _running_task(loop: asyncio.AbstractEventLoop) -> Tuple[Optional[str], str]:
+    """
+    Returns the route the loop is serving, if any, and a label for the task it is running. Safe to call from
+    another thread.
+    """
+    task = asyncio.current_task(loop)
+    if task is None:
+        return None, "no task"
+    route = request_routes.get(task)
+    return route, route or f"task {task.get_name()}"
+
+
+class Profile:
+    """
+    Stack samples aggregated by stack, each stack a tuple of labels from the thread (and, on the event loop, the
+    route or task being run) down to the innermost function.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.samples = 0
+        self.duration_seconds = 0.0
+        self.stacks: Dict[Tuple[str, ...], int] = {}
+        # Source file and first line of every function seen, for the speedscope export.
+        self.functions: Dict[str, Tuple[str, int]] = {}
+        self._labels: Dict[CodeType, str] = {}
+
+    def add(self, root: List[str], top: FrameType) -> None:
+        stack = root
+        for frame in _frames(top):
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = _code_label(frame)
+                self.functions[label] = (code.co_filename, code.co_firstlineno)
+            stack.append(label)
+        key = tuple(stack)
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def collapsed(self) -> str:
+        """
+        Returns the profile in the collapsed stack format read by flamegraph.pl, speedscope and most other
+        flame graph tools: one line per distinct stack, frames separated by semicolons, then the sample count.
+        """
+        lines = [
+            f"{';'.join(stack)} {count}"
+            for stack, count in sorted(
+                self.stacks.items(), key=lambda item: item[1], reverse=True
+            )
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> dict:
+        """
+        Returns the profile as a speedscope file, with one sampled profile per thread, weighted in seconds.
+        """
+        frames: List[dict] = []
+        index: Dict[str, int] = {}
+        profiles: Dict[str, dict] = {}
+        for stack, count in self.stacks.items():
+            thread, *labels = stack
+            profile = profiles.get(thread)
+            if profile is None:
+                profile = profiles[thread] = {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": 0,
+                    "samples": [],
+                    "weights": [],
+                }
+            sample = []
+            for label in labels:
+                i = index.get(label)
+                if i is None:
+                    i = index[label] = len(frames)
+                    frame = {"name": label}
+                    if label in self.functions:
+                        frame["file"], frame["line"] = self.functions[label]
+                    frames.append(frame)
+                sample.append(i)
+            weight = count * self.interval_seconds
+            profile["samples"].append(sample)
+            profile["weights"].append(weight)
+            profile["endValue"] += weight
+        ordered = sorted(profiles.values(), key=lambda p: p["name"] != LOOP_THREAD)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "aarushi-currency-exchange-1",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": ordered,
+        }
+
+
+class SamplingProfiler:
+    """
+    Time-boxed sampling profiler running inside the worker.
+
+    A separate thread wakes every interval and records the Python stack of the event loop thread (or of every
+    thread), so the profiled code is not instrumented and the overhead is one stack walk per interval. Samples
+    taken on the event loop are grouped under the route or task being run, and the coroutines it is stepping are
+    on the stack, so time spent in project code shows under the request that caused it. The loop thread waiting
+    in select() is idle time.
+    """
+
+    def __init__(self):
+        self.running = False
+
+    async def profile(
+        self,
+        seconds: float,
+        interval_seconds: float = PROFILER_INTERVAL_SECONDS,
+        all_threads: bool = False,
+    ) -> Profile:
+        """
+        Samples the worker for the given number of seconds.
+
+        Args:
+            seconds (float): Profiling time, capped at PROFILER_MAX_SECONDS.
+            interval_seconds (float): Time between samples, at least PROFILER_MIN_INTERVAL_SECONDS.
+            all_threads (bool): Whether to sample every thread rather than only the event loop's.
+
+        Returns:
+            Profile: The aggregated samples.
+
+        Raises:
+            ProfilerBusyError: If another profile is being taken in this worker.
+        """
+        if self.running:
+            raise ProfilerBusyError("A profile is already being taken in this worker")
+        self.running = True
+        loop = asyncio.get_running_loop()
+        seconds = min(seconds, PROFILER_MAX_SECONDS)
+        profile = Profile(max(interval_seconds, PROFILER_MIN_INTERVAL_SECONDS))
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._sample,
+            args=(profile, loop, threading.get_ident(), all_threads, stop),
+            name="profiler",
+            daemon=True,
+        )
+        started = time.perf_counter()
+        thread.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await loop.run_in_executor(None, thread.join)
+            self.running = False
+        profile.duration_seconds = time.perf_counter() - started
+        return profile
+
+    @staticmethod
+    def _sample(
+        profile: Profile,
+        loop: asyncio.AbstractEventLoop,
+        loop_thread: int,
+        all_threads: bool,
+        stop: threading.Event,
+    ) -> None:
+        own_thread = threading.get_ident()
+        names = {}
+        next_sample = time.perf_counter()
+        while not stop.is_set():
+            _, task = _running_task(loop)
+            for ident, frame in sys._current_frames().items():
+                if ident == loop_thread:
+                    profile.add([LOOP_THREAD, task], frame)
+                elif all_threads and ident != own_thread:
+                    if ident not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    profile.add([names.get(ident, f"thread {ident}")], frame)
+            profile.samples += 1
+            next_sample += profile.interval_seconds
+            stop.wait(max(0.0, next_sample - time.perf_counter()))
+
+
+class Stall(NamedTuple):
+    """
+    What the event loop was running when a heartbeat was found overdue.
+    """
+
+    beat: float
+    route: Optional[str]
+    task: str
+    stack: List[str]
+
+
+class SlowCallbackDetector:
+    """
+    Logs event loop steps that run longer than a threshold, with the route and the project function responsible.
+
+    The loop schedules a heartbeat every quarter of the threshold, and a watchdog thread checks it at the same
+    rate. When the heartbeat is overdue by more than the threshold, a callback is holding the loop: the watchdog
+    captures the loop thread's stack and the task it is running while it is still blocked, and the heartbeat logs
+    the report once the loop is free again, with the time it was blocked. Unlike asyncio debug mode this adds no
+    work to each callback.
+    """
+
+    def __init__(self, threshold_seconds: float):
+        self.threshold_seconds = threshold_seconds
+        self.stalls = 0
+        self._period = threshold_seconds / 4
+        self._beat = 0.0
+        self._stall: Optional[Stall] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = 0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _heartbeat(self) -> None:
+        now = time.perf_counter()
+        stall = self._stall
+        if stall is not None and stall.beat == self._beat:
+            self._stall = None
+            self._report(stall, now - stall.beat - self._period)
+        self._beat = now
+        self._handle = self._loop.call_later(self._period, self._heartbeat)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self._period):
+            beat = self._beat
+            if time.perf_counter() - beat < self._period + self.threshold_seconds:
+                continue
+            stall = self._stall
+            if stall is not None and stall.beat == beat:
+                continue
+            route, task = _running_task(self._loop)
+            frame = sys._current_frames().get(self._loop_thread)
+            self._stall = Stall(
+                beat, route, task, [_code_label(f) for f in _frames(frame)]
+            )
+
+    def _report(self, stall: Stall, blocked_seconds: float) -> None:
+        self.stalls += 1
+        SLOW_CALLBACKS.labels(stall.route or BACKGROUND).inc()
+        culprit = next(
+            (label for label in reversed(stall.stack) if label.startswith("project.")),
+            "no project code",
+        )
+        logger.warning(
+            "Event loop blocked for %.0f ms by %s in %s; innermost frames: %s",
+            blocked_seconds * 1000,
+            stall.task,
+            culprit,
+            " > ".join(stall.stack[-8:]),
+        )
+
+    async def start(self) -> None:
+        if self.threshold_seconds <= 0 or self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._handle = self._loop.call_later(self._period, self._heartbeat)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name="slow-callback-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._handle.cancel()
+        await self._loop.run_in_executor(None, self._thread.join)
+        self._thread = None
+
+
+profiler = SamplingProfiler()
+slow_callback_detector = SlowCallbackDetector(SLOW_CALLBACK_SECONDS)
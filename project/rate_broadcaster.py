@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+from collections import deque
+from itertools import repeat
+from typing import AsyncIterator, Deque, Dict, Optional, Set, Tuple
+
+from project.rate_engine import RateMatrix
+
+RATE_STREAM_MAX_QUEUE = int(os.getenv("RATE_STREAM_MAX_QUEUE", "16"))
+RATE_STREAM_HEARTBEAT_SECONDS = float(os.getenv("RATE_STREAM_HEARTBEAT_SECONDS", "15"))
+
+TopicKey = Tuple[str, Optional[Tuple[str, ...]]]
+# An event type ("snapshot" or "delta") and its encoded JSON payload.
+RateMessage = Tuple[str, str]
+
+
+class RateTopic:
+    """
+    The subscribers sharing one (base, targets) subscription, and the messages encoded for them.
+
+    A target set of None means every currency in the snapshot.
+    """
+
+    def __init__(self, base: str, targets: Optional[Tuple[str, ...]]):
+        self.base = base
+        self.targets = targets
+        self.subscribers: Set["RateSubscription"] = set()
+        self._snapshot: Optional[Tuple[int, RateMessage]] = None
+
+    def _codes(self, *matrices: RateMatrix) -> list:
+        if self.targets is not None:
+            return list(self.targets)
+        codes = set()
+        for matrix in matrices:
+            codes.update(matrix.codes)
+        codes.discard(self.base)
+        return sorted(codes)
+
+    def _encode(self, kind: str, matrix: RateMatrix, rates: Dict) -> str:
+        return json.dumps(
+            {
+                "type": kind,
+                "base_currency": self.base,
+                "snapshot_id": matrix.snapshot_id,
+                "timestamp": matrix.fetched_at.isoformat(),
+                "rates": rates,
+            }
+        )
+
+    def snapshot(self, matrix: RateMatrix) -> RateMessage:
+        """
+        Returns the full-state message for the matrix, encoded once per snapshot.
+        """
+        if self._snapshot is None or self._snapshot[0] != matrix.snapshot_id:
+            codes = self._codes(matrix)
+            rates, known = matrix.cross_rates(repeat(self.base, len(codes)), codes)
+            payload = self._encode(
+                "snapshot",
+                matrix,
+                {
+                    code: rate
+                    for code, rate, ok in zip(codes, rates.tolist(), known.tolist())
+                    if ok
+                },
+            )
+            self._snapshot = (matrix.snapshot_id, ("snapshot", payload))
+        return self._snapshot[1]
+
+    def delta(self, previous: RateMatrix, matrix: RateMatrix) -> Optional[RateMessage]:
+        """
+        Encodes the rates that changed between two snapshots, or returns None if none did.
+
+        Currencies that disappeared from the snapshot are sent with a null rate.
+        """
+        codes = self._codes(previous, matrix)
+        new, new_known = matrix.cross_rates(repeat(self.base, len(codes)), codes)
+        old, old_known = previous.cross_rates(repeat(self.base, len(codes)), codes)
+        changed = (new_known & (~old_known | (new != old))) | (old_known & ~new_known)
+        if not changed.any():
+            return None
+        return "delta", self._encode(
+            "delta",
+            matrix,
+            {
+                code: rate if ok else None
+                for code, rate, ok, flag in zip(
+                    codes, new.tolist(), new_known.tolist(), changed.tolist()
+                )
+                if flag
+            },
+        )
+
+
+class RateSubscription:
+    """
+    One client's bounded queue of encoded rate messages.
+
+    When a slow client falls max_queue messages behind, its queued deltas are discarded and replaced by a single
+    full snapshot of the latest rates, so memory per client stays bounded and the client still converges.
+    """
+
+    def __init__(
+        self, broadcaster: "RateBroadcaster", topic: RateTopic, max_queue: int
+    ):
+        self.broadcaster = broadcaster
+        self.topic = topic
+        self.max_queue = max_queue
+        self.queue: Deque[RateMessage] = deque()
+        self.resync = True
+        self.coalesced = 0
+        self._ready = asyncio.Event()
+
+    def offer(self, message: RateMessage) -> None:
+        if self.resync:
+            # A snapshot is already owed, which supersedes any delta.
+            return
+        if len(self.queue) >= self.max_queue:
+            self.queue.clear()
+            self.resync = True
+            self.coalesced += 1
+        else:
+            self.queue.append(message)
+        self._ready.set()
+
+    def wake(self) -> None:
+        self._ready.set()
+
+    async def next(self) -> RateMessage:
+        """
+        Waits for and returns the next message for this client.
+        """
+        while True:
+            matrix = self.broadcaster.current
+            if self.resync and matrix is not None:
+                self.resync = False
+                self.queue.clear()
+                return self.topic.snapshot(matrix)
+            if self.queue:
+                return self.queue.popleft()
+            self._ready.clear()
+            await self._ready.wait()
+
+
+class RateBroadcaster:
+    """
+    Fans rate snapshots out to streaming subscribers.
+
+    Registered as a RateEngine subscriber. On every new snapshot the delta against the previous one is computed
+    and encoded once per distinct (base, targets) topic, and the same encoded message is queued to every
+    subscriber of that topic.
+    """
+
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self.current: Optional[RateMatrix] = None
+        self.topics: Dict[TopicKey, RateTopic] = {}
+        self.messages_encoded = 0
+
+    def publish(self, matrix: RateMatrix) -> None:
+        """
+        Queues the changes in a new snapshot to every subscriber.
+        """
+        previous, self.current = self.current, matrix
+        if previous is None:
+            for topic in self.topics.values():
+                for subscription in topic.subscribers:
+                    subscription.wake()
+            return
+        for topic in self.topics.values():
+            message = topic.delta(previous, matrix)
+            if message is None:
+                continue
+            self.messages_encoded += 1
+            for subscription in topic.subscribers:
+                subscription.offer(message)
+
+    def subscribe(
+        self, base: str, targets: Optional[Tuple[str, ...]]
+    ) -> RateSubscription:
+        """
+        Registers a subscriber. Its first message is a full snapshot of the current rates.
+
+        Args:
+            base (str): The base currency code.
+            targets (Optional[Tuple[str, ...]]): The target currency codes, or None for all currencies.
+        """
+        key = (base, tuple(sorted(set(targets))) if targets is not None else None)
+        topic = self.topics.get(key)
+        if topic is None:
+            topic = self.topics[key] = RateTopic(*key)
+        subscription = RateSubscription(self, topic, self.max_queue)
+        topic.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: RateSubscription) -> None:
+        topic = subscription.topic
+        topic.subscribers.discard(subscription)
+        if not topic.subscribers:
+            self.topics.pop((topic.base, topic.targets), None)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(topic.subscribers) for topic in self.topics.values())
+
+
+async def stream_rate_events(
+    base: str,
+    targets: Optional[Tuple[str, ...]] = None,
+    heartbeat_seconds: float = RATE_STREAM_HEARTBEAT_SECONDS,
+) -> AsyncIterator[bytes]:
+    """
+    Streams rate updates for a base currency as Server-Sent Events.
+
+    The first event is a 'snapshot' with every requested rate; each later event is a 'delta' carrying only the
+    rates that changed in a new snapshot. A comment line is sent when no event was sent for heartbeat_seconds,
+    to keep idle connections open through proxies.
+
+    Args:
+        base (str): The base currency code.
+        targets (Optional[Tuple[str, ...]]): The target currency codes, or None for all currencies.
+        heartbeat_seconds (float): The maximum time between two writes to the client.
+
+    Returns:
+        AsyncIterator[bytes]: The event stream.
+    """
+    subscription = rate_broadcaster.subscribe(base, targets)
+    try:
+        while True:
+            try:
+                kind, payload = await asyncio.wait_for(
+                    subscription.next(), heartbeat_seconds
+                )
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield f"event: {kind}\ndata: {payload}\n\n".encode()
+    finally:
+        rate_broadcaster.unsubscribe(subscription)
+
+
+rate_broadcaster = RateBroadcaster(max_queue=RATE_STREAM_MAX_QUEUE)
@@ -0,0 +1,88 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, NamedTuple
+
+from project.deadlines import SharedLoad
+
+RATE_CACHE_TTL_SECONDS = float(os.getenv("RATE_CACHE_TTL_SECONDS", "60"))
+RATE_CACHE_MAX_ENTRIES = int(os.getenv("RATE_CACHE_MAX_ENTRIES", "256"))
+
+
+class CachedRates(NamedTuple):
+    """
+    The full rate table fetched for one base currency and the monotonic time after which it is considered expired.
+    """
+
+    rates: Dict[str, float]
+    expires_at: float
+
+
+class RateCache:
+    """
+    In-process cache of upstream rate tables keyed by base currency.
+
+    Entries expire after a fixed TTL and the least recently used entry is evicted once the cache is full.
+    Concurrent misses for the same base are coalesced so that only one upstream call is in flight per base;
+    every waiter receives the result of that single call.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedRates]" = OrderedDict()
+        self._in_flight: Dict[str, SharedLoad] = {}
+
+    async def get(
+        self, base: str, loader: Callable[[str], Awaitable[Dict[str, float]]]
+    ) -> Dict[str, float]:
+        """
+        Returns the cached rate table for the base currency, loading it through the loader on a miss.
+
+        Args:
+            base (str): The base currency code used as the cache key.
+            loader (Callable[[str], Awaitable[Dict[str, float]]]): Coroutine function fetching the full rate table for a base.
+
+        Returns:
+            Dict[str, float]: The rate table for the base currency. Callers must not mutate it.
+        """
+        entry = self._entries.get(base)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                self._entries.move_to_end(base)
+                return entry.rates
+            del self._entries[base]
+        load = self._in_flight.get(base)
+        if load is None:
+            load = SharedLoad(self._in_flight, base, self._load(base, loader))
+        return await load.join()
+
+    async def _load(
+        self, base: str, loader: Callable[[str], Awaitable[Dict[str, float]]]
+    ) -> Dict[str, float]:
+        rates = await loader(base)
+        if rates:
+            self._entries[base] = CachedRates(
+                rates=rates, expires_at=time.monotonic() + self.ttl_seconds
+            )
+            self._entries.move_to_end(base)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rates
+
+    def invalidate(self, base: str | None = None) -> None:
+        """
+        Drops the cached table for one base currency, or every cached table if no base is given.
+
+        Args:
+            base (str | None): The base currency code to drop, or None to clear the whole cache.
+        """
+        if base is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(base, None)
+
+
+rate_cache = RateCache(
+    ttl_seconds=RATE_CACHE_TTL_SECONDS, max_entries=RATE_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,162 @@
+import itertools
+import logging
+import math
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_snapshot_ids = itertools.count(1)
+
+
+class RateMatrix:
+    """
+    Immutable N×N cross-rate table built from a single pivot snapshot.
+
+    Entry [i, j] holds how many units of currency j one unit of currency i buys, so any pair or a whole row
+    is answered by array lookups. Instances are never modified after construction; a new snapshot produces a
+    new matrix which replaces the old one in a single reference assignment.
+    """
+
+    def __init__(
+        self,
+        pivot: str,
+        pivot_rates: Dict[str, float],
+        fetched_at: datetime,
+        snapshot_id: Optional[int] = None,
+    ):
+        valid = {
+            code: float(rate)
+            for code, rate in pivot_rates.items()
+            if rate and math.isfinite(rate) and rate > 0
+        }
+        valid[pivot] = 1.0
+        self.pivot = pivot
+        self.source = pivot_rates
+        self.fetched_at = fetched_at
+        self.snapshot_id = (
+            snapshot_id if snapshot_id is not None else next(_snapshot_ids)
+        )
+        self.codes: List[str] = sorted(valid)
+        self.index: Dict[str, int] = {code: i for i, code in enumerate(self.codes)}
+        self.pivot_vector = np.array([valid[code] for code in self.codes])
+        self.matrix = np.outer(1.0 / self.pivot_vector, self.pivot_vector)
+        self.pivot_vector.setflags(write=False)
+        self.matrix.setflags(write=False)
+
+    def rate(self, base: str, target: str) -> Optional[float]:
+        """
+        Returns the cross rate from base to target, or None if either currency is unknown.
+        """
+        i = self.index.get(base)
+        j = self.index.get(target)
+        if i is None or j is None:
+            return None
+        return float(self.matrix[i, j])
+
+    def rates(self, base: str, targets: Iterable[str]) -> Dict[str, float]:
+        """
+        Returns the cross rates from base to each known target. Unknown targets are omitted.
+        """
+        i = self.index.get(base)
+        if i is None:
+            return {}
+        row = self.matrix[i]
+        return {
+            target: float(row[self.index[target]])
+            for target in targets
+            if target in self.index
+        }
+
+    def row(self, base: str) -> Dict[str, float]:
+        """
+        Returns the cross rates from base to every other currency in the snapshot.
+        """
+        i = self.index.get(base)
+        if i is None:
+            return {}
+        return {
+            code: rate
+            for code, rate in zip(self.codes, self.matrix[i].tolist())
+            if code != base
+        }
+
+    def indices(self, codes: Iterable[str]) -> np.ndarray:
+        """
+        Maps currency codes to matrix indices, using -1 for codes missing from the snapshot.
+        """
+        return np.fromiter((self.index.get(code, -1) for code in codes), dtype=np.intp)
+
+    def cross_rates(
+        self, bases: Iterable[str], targets: Iterable[str]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Resolves many base/target pairs in one vectorized lookup.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The rate of every pair and a mask of the pairs whose currencies are both
+            known. Rates of unknown pairs are meaningless and must be ignored.
+        """
+        base_index = self.indices(bases)
+        target_index = self.indices(targets)
+        known = (base_index >= 0) & (target_index >= 0)
+        rates = self.matrix[
+            np.where(known, base_index, 0), np.where(known, target_index, 0)
+        ]
+        return rates, known
+
+
+class RateEngine:
+    """
+    Keeps the current RateMatrix and rebuilds it whenever the pivot loader returns a new snapshot.
+
+    The loader is expected to return the same dict object for as long as a snapshot is current (as the rate
+    cache does), so a rebuild happens once per upstream snapshot rather than once per request.
+    """
+
+    def __init__(
+        self, pivot: str, loader: Callable[[str], Awaitable[Dict[str, float]]]
+    ):
+        self.pivot = pivot
+        self.loader = loader
+        self._matrix: Optional[RateMatrix] = None
+        self._subscribers: List[Callable[[RateMatrix], None]] = []
+
+    @property
+    def current(self) -> Optional[RateMatrix]:
+        return self._matrix
+
+    def subscribe(self, callback: Callable[[RateMatrix], None]) -> None:
+        """
+        Registers a callback invoked with every newly published matrix.
+        """
+        self._subscribers.append(callback)
+
+    def publish(self, matrix: RateMatrix) -> RateMatrix:
+        """
+        Atomically replaces the current matrix and notifies subscribers.
+        """
+        self._matrix = matrix
+        for callback in self._subscribers:
+            try:
+                callback(matrix)
+            except Exception:
+                logger.exception("Rate snapshot subscriber failed")
+        return matrix
+
+    async def get_matrix(self) -> RateMatrix:
+        """
+        Returns the matrix for the latest pivot snapshot, building it if the snapshot changed.
+
+        Returns:
+            RateMatrix: The cross-rate table. An empty snapshot yields a matrix holding only the pivot.
+        """
+        pivot_rates = await self.loader(self.pivot)
+        matrix = self._matrix
+        if matrix is not None and matrix.source is pivot_rates:
+            return matrix
+        if not pivot_rates and matrix is not None:
+            return matrix
+        return self.publish(RateMatrix(self.pivot, pivot_rates, datetime.now()))
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from project.rate_history_store import rate_history_store
+
+
+class RateHistoryStatsResponse(BaseModel):
+    """
+    Summary statistics of a cross rate over a time window, computed from the recorded rate snapshots.
+    """
+
+    base_currency: str
+    target_currency: str
+    start: datetime
+    end: datetime
+    samples: int
+    min_rate: float
+    max_rate: float
+    mean_rate: float
+
+
+async def get_rate_history_stats(
+    base: str, target: str, start: datetime, end: datetime
+) -> RateHistoryStatsResponse:
+    """
+    Computes the minimum, maximum and mean base/target rate over the snapshots recorded in [start, end).
+
+    Args:
+        base (str): The base currency code.
+        target (str): The target currency code.
+        start (datetime): The start of the window, inclusive.
+        end (datetime): The end of the window, exclusive.
+
+    Returns:
+        RateHistoryStatsResponse: Summary statistics of the cross rate over the window.
+
+    Raises:
+        RateHistoryUnavailableError: If no rates were recorded for the pair in the window.
+    """
+    stats = rate_history_store.window_stats(base, target, start, end)
+    return RateHistoryStatsResponse(
+        base_currency=base,
+        target_currency=target,
+        start=start,
+        end=end,
+        samples=stats.samples,
+        min_rate=stats.min,
+        max_rate=stats.max,
+        mean_rate=stats.mean,
+    )
@@ -0,0 +1,244 @@
+import bisect
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from project.rate_engine import RateMatrix
+
+logger = logging.getLogger(__name__)
+
+RATE_HISTORY_DIR = os.getenv("RATE_HISTORY_DIR", "rate_history")
+RATE_HISTORY_MAX_CURRENCIES = int(os.getenv("RATE_HISTORY_MAX_CURRENCIES", "256"))
+
+
+class RateHistoryUnavailableError(Exception):
+    """
+    Raised when the history store holds no rates for the requested time or currencies.
+    """
+
+
+class RateWindowStats(NamedTuple):
+    samples: int
+    min: float
+    max: float
+    mean: float
+
+
+class RateHistoryStore:
+    """
+    Append-only, memory-mapped time series of rate snapshots.
+
+    Each snapshot is one fixed-width row of float64 values: the snapshot time (epoch seconds) followed by the
+    pivot rate of every currency, indexed by the currency's position in an append-only code list. Currencies
+    missing from a snapshot are stored as NaN. Rows are appended in time order, so the time column is sorted and
+    as-of lookups are a binary search; window statistics run vectorized over the mapped slice.
+    """
+
+    def __init__(self, directory: str, max_currencies: int):
+        self.directory = directory
+        self.max_currencies = max_currencies
+        self.row_width = 1 + max_currencies
+        self.data_path = os.path.join(directory, "rates.f64")
+        self.meta_path = os.path.join(directory, "currencies.json")
+        self.pivot: Optional[str] = None
+        self.codes: List[str] = []
+        self.index: Dict[str, int] = {}
+        self._map: Optional[np.memmap] = None
+        self._file = None
+        self._meta_mtime: Optional[int] = None
+        self._overflow_logged = False
+
+    def open(self) -> None:
+        """
+        Opens (or creates) the store files, dropping a partial row left by a write that was cut short.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_meta()
+        self._file = open(self.data_path, "ab")
+        row_bytes = 8 * self.row_width
+        size = self._file.seek(0, os.SEEK_END)
+        if size % row_bytes:
+            # Appending after the partial row would shift every later row out of alignment.
+            logger.warning(
+                "Dropping %d bytes of a partial row from %s",
+                size % row_bytes,
+                self.data_path,
+            )
+            self._file.truncate(size - size % row_bytes)
+
+    def _load_meta(self) -> None:
+        """
+        Reads the currency list if it changed on disk since it was last read or written, e.g. by the worker
+        leading a shared rate snapshot.
+        """
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._meta_mtime:
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta["max_currencies"] != self.max_currencies:
+            raise ValueError(
+                f"{self.meta_path} was written with max_currencies={meta['max_currencies']}"
+            )
+        self.pivot = meta["pivot"]
+        self.codes = meta["codes"]
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self._meta_mtime = mtime
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._map = None
+
+    def _write_meta(self) -> None:
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "pivot": self.pivot,
+                    "max_currencies": self.max_currencies,
+                    "codes": self.codes,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.meta_path)
+        self._meta_mtime = os.stat(self.meta_path).st_mtime_ns
+
+    def _rows(self) -> np.ndarray:
+        """
+        Returns the mapped rows, remapping if rows were appended since the last call.
+        """
+        self._load_meta()
+        size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        count = size // (8 * self.row_width)
+        if count == 0:
+            return np.empty((0, self.row_width))
+        if self._map is None or self._map.shape[0] != count:
+            self._map = np.memmap(
+                self.data_path,
+                dtype=np.float64,
+                mode="r",
+                shape=(count, self.row_width),
+            )
+        return self._map
+
+    def append(self, matrix: RateMatrix) -> None:
+        """
+        Appends a snapshot as one row. Snapshots not newer than the last row are ignored.
+        """
+        if self._file is None:
+            return
+        if self.pivot is None:
+            self.pivot = matrix.pivot
+        elif self.pivot != matrix.pivot:
+            logger.warning("Not recording snapshot with pivot %s", matrix.pivot)
+            return
+        timestamp = matrix.fetched_at.timestamp()
+        rows = self._rows()
+        if len(rows) and rows[-1, 0] >= timestamp:
+            return
+        new_codes = [code for code in matrix.codes if code not in self.index]
+        if new_codes:
+            room = self.max_currencies - len(self.codes)
+            if len(new_codes) > room and not self._overflow_logged:
+                logger.warning(
+                    "Rate history is full, not recording %s", new_codes[room:]
+                )
+                self._overflow_logged = True
+            for code in new_codes[:room]:
+                self.index[code] = len(self.codes)
+                self.codes.append(code)
+            self._write_meta()
+        row = np.full(self.row_width, np.nan)
+        row[0] = timestamp
+        for code, rate in zip(matrix.codes, matrix.pivot_vector.tolist()):
+            position = self.index.get(code)
+            if position is not None:
+                row[1 + position] = rate
+        self._file.write(row.tobytes())
+        self._file.flush()
+
+    def _column(self, code: str) -> int:
+        position = self.index.get(code)
+        if position is None:
+            raise RateHistoryUnavailableError(f"No rate history for {code}")
+        return 1 + position
+
+    def as_of(self, timestamp: datetime) -> RateMatrix:
+        """
+        Returns the snapshot in effect at the given time, i.e. the last one taken at or before it.
+
+        Args:
+            timestamp (datetime): The point in time to look up.
+
+        Returns:
+            RateMatrix: The cross-rate table of that snapshot.
+
+        Raises:
+            RateHistoryUnavailableError: If no snapshot was taken at or before the given time.
+        """
+        rows = self._rows()
+        position = bisect.bisect_right(rows[:, 0], timestamp.timestamp()) - 1
+        if position < 0:
+            raise RateHistoryUnavailableError(
+                f"No rates recorded at or before {timestamp}"
+            )
+        return self._matrix(rows[position])
+
+    def latest(self) -> Optional[RateMatrix]:
+        """
+        Returns the most recently recorded snapshot, or None if nothing was recorded yet.
+        """
+        rows = self._rows()
+        return self._matrix(rows[-1]) if len(rows) else None
+
+    def _matrix(self, row: np.ndarray) -> RateMatrix:
+        row = np.asarray(row)
+        pivot_rates = {
+            code: rate
+            for code, rate in zip(self.codes, row[1 : 1 + len(self.codes)].tolist())
+            if rate == rate
+        }
+        return RateMatrix(self.pivot, pivot_rates, datetime.fromtimestamp(row[0]))
+
+    def window_stats(
+        self, base: str, target: str, start: datetime, end: datetime
+    ) -> RateWindowStats:
+        """
+        Computes min, max and mean of the base/target cross rate over snapshots in [start, end).
+
+        Raises:
+            RateHistoryUnavailableError: If either currency or the window has no recorded rates.
+        """
+        rows = self._rows()
+        base_column = self._column(base)
+        target_column = self._column(target)
+        times = rows[:, 0]
+        lo = bisect.bisect_left(times, start.timestamp())
+        hi = bisect.bisect_left(times, end.timestamp())
+        window = rows[lo:hi]
+        rates = window[:, target_column] / window[:, base_column]
+        rates = rates[~np.isnan(rates)]
+        if rates.size == 0:
+            raise RateHistoryUnavailableError(
+                f"No {base}/{target} rates recorded between {start} and {end}"
+            )
+        return RateWindowStats(
+            samples=int(rates.size),
+            min=float(rates.min()),
+            max=float(rates.max()),
+            mean=float(rates.mean()),
+        )
+
+
+rate_history_store = RateHistoryStore(
+    directory=RATE_HISTORY_DIR, max_currencies=RATE_HISTORY_MAX_CURRENCIES
+)
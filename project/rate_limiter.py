@@ -0,0 +1,274 @@
+import asyncio
+import json
+import math
+import os
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from prometheus_client import Counter
+
+from project.auth_token_cache import auth_token_cache
+
+
+def _per_role(value: str) -> Dict[str, int]:
+    return {
+        role.strip(): int(limit)
+        for role, limit in (
+            item.split(":") for item in value.split(",") if item.strip()
+        )
+    }
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Requests per minute and burst size per role; anonymous clients are limited per IP address. 0 means unlimited.
+RATE_LIMIT_PER_MINUTE = _per_role(
+    os.getenv("RATE_LIMIT_PER_MINUTE", "ANONYMOUS:60,USER:120,PREMIUM:600,ADMIN:0")
+)
+RATE_LIMIT_BURST = _per_role(
+    os.getenv("RATE_LIMIT_BURST", "ANONYMOUS:10,USER:20,PREMIUM:100,ADMIN:0")
+)
+# Requests per rolling day per role. 0 means no quota.
+RATE_LIMIT_DAILY_QUOTA = _per_role(
+    os.getenv("RATE_LIMIT_DAILY_QUOTA", "ANONYMOUS:5000,USER:20000,PREMIUM:0,ADMIN:0")
+)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_SWEEP_SECONDS = float(os.getenv("RATE_LIMIT_SWEEP_SECONDS", "60"))
+# Use the first X-Forwarded-For address as the client IP; only enable behind a proxy that sets it.
+RATE_LIMIT_TRUST_FORWARDED = os.getenv(
+    "RATE_LIMIT_TRUST_FORWARDED", "false"
+).lower() in ("1", "true", "yes")
+RATE_LIMIT_EXEMPT_PATHS = frozenset(
+    os.getenv("RATE_LIMIT_EXEMPT_PATHS", "/metrics,/docs,/redoc,/openapi.json").split(
+        ","
+    )
+)
+
+ANONYMOUS = "ANONYMOUS"
+
+RATE_LIMITED_REQUESTS = Counter(
+    "rate_limited_requests_total",
+    "Requests rejected with 429 by role and limit.",
+    ["role", "limit"],
+)
+
+
+class Limit(NamedTuple):
+    """
+    One GCRA limit: a request is let through every interval seconds on average, with up to burst at once.
+    """
+
+    name: str
+    interval: float
+    burst: int
+
+    @property
+    def tolerance(self) -> float:
+        return (self.burst - 1) * self.interval
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    retry_after: float
+    limit: Optional[Limit]
+
+
+def role_limits(role: str) -> List[Limit]:
+    """
+    Returns the limits configured for a role; roles without configuration get the USER limits.
+    """
+    limits = []
+    per_minute = RATE_LIMIT_PER_MINUTE.get(role, RATE_LIMIT_PER_MINUTE.get("USER", 0))
+    if per_minute > 0:
+        burst = RATE_LIMIT_BURST.get(role, RATE_LIMIT_BURST.get("USER", 1))
+        limits.append(Limit("rate", 60.0 / per_minute, max(1, burst)))
+    quota = RATE_LIMIT_DAILY_QUOTA.get(role, RATE_LIMIT_DAILY_QUOTA.get("USER", 0))
+    if quota > 0:
+        limits.append(Limit("daily_quota", 86400.0 / quota, quota))
+    return limits
+
+
+class RateLimiter:
+    """
+    In-memory GCRA (generic cell rate algorithm) limiter keyed by user or client IP, with the limits of each role
+    given by limits (role_limits by default).
+
+    Each key holds one theoretical arrival time per limit, so memory is constant per active key and a check is a
+    dict lookup and a few float comparisons. A request is allowed when it would not push any arrival time more
+    than the limit's burst ahead of now, and is then charged to every limit; a rejected request is not charged.
+    A daily quota is a limit whose burst is the whole quota, i.e. a day-long sliding window.
+
+    Keys whose arrival times have all passed are in the same state as a new key and are dropped by a periodic
+    sweep. If more than max_keys are active at once, the keys seen first are dropped, which resets their limits.
+    """
+
+    def __init__(
+        self,
+        max_keys: int,
+        sweep_seconds: float,
+        limits: Callable[[str], List[Limit]] = role_limits,
+    ):
+        self.max_keys = max_keys
+        self.sweep_seconds = sweep_seconds
+        self._role_limits = limits
+        self._limits: Dict[str, List[Limit]] = {}
+        self._arrivals: Dict[str, Tuple[float, ...]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._arrivals)
+
+    def limits(self, role: str) -> List[Limit]:
+        limits = self._limits.get(role)
+        if limits is None:
+            limits = self._limits[role] = self._role_limits(role)
+        return limits
+
+    def check(self, key: str, role: str, now: Optional[float] = None) -> Decision:
+        """
+        Charges one request to a key if every limit of its role allows it.
+
+        Args:
+            key (str): The user or client the request is counted against.
+            role (str): The user role, or ANONYMOUS, whose limits apply.
+            now (Optional[float]): The current monotonic time, for testing.
+
+        Returns:
+            Decision: Whether the request is allowed and, if not, the seconds until it would be and the limit hit.
+        """
+        limits = self.limits(role)
+        if not limits:
+            return Decision(True, 0.0, None)
+        if now is None:
+            now = time.monotonic()
+        arrivals = self._arrivals.get(key)
+        if arrivals is not None and len(arrivals) != len(limits):
+            # The user's role changed to one with other limits; start over.
+            arrivals = None
+        updated = []
+        for i, limit in enumerate(limits):
+            arrival = max(arrivals[i], now) if arrivals is not None else now
+            wait = arrival - now - limit.tolerance
+            if wait > 0:
+                return Decision(False, wait, limit)
+            updated.append(arrival + limit.interval)
+        if arrivals is None and len(self._arrivals) >= self.max_keys:
+            self._evict_oldest()
+        self._arrivals[key] = tuple(updated)
+        return Decision(True, 0.0, None)
+
+    def _evict_oldest(self) -> None:
+        while len(self._arrivals) >= self.max_keys:
+            del self._arrivals[next(iter(self._arrivals))]
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Drops the keys that have no outstanding charge left.
+
+        Returns:
+            int: The number of keys dropped.
+        """
+        if now is None:
+            now = time.monotonic()
+        idle = [key for key, arrivals in self._arrivals.items() if max(arrivals) <= now]
+        for key in idle:
+            del self._arrivals[key]
+        return len(idle)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_seconds)
+            self.sweep()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_identity(scope) -> Tuple[str, str]:
+    """
+    Returns the rate limit key and role of a request, using only the auth token cache.
+
+    A cached valid token counts against its user and role. Everything else counts against the client IP with the
+    ANONYMOUS limits: anonymous requests, requests with a token known to be invalid, and requests with a token
+    that is not cached yet, so that sending a new made-up token with every request does not escape the limits.
+    """
+    authorization = _header(scope, b"authorization")
+    if authorization is not None:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() == "bearer" and token:
+            entry = auth_token_cache.peek(token)
+            if entry is not None and entry.user is not None:
+                return f"user:{entry.user.user_id}", entry.user.role
+    forwarded = (
+        _header(scope, b"x-forwarded-for") if RATE_LIMIT_TRUST_FORWARDED else None
+    )
+    if forwarded:
+        address = forwarded.split(",")[0].strip()
+    else:
+        address = scope["client"][0] if scope.get("client") else "unknown"
+    return f"ip:{address}", ANONYMOUS
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware answering 429 with a Retry-After header once a client exceeds its role's limits.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not RATE_LIMIT_ENABLED
+            or scope["type"] != "http"
+            or scope["path"] in RATE_LIMIT_EXEMPT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+        key, role = client_identity(scope)
+        decision = rate_limiter.check(key, role)
+        if decision.allowed:
+            await self.app(scope, receive, send)
+            return
+        RATE_LIMITED_REQUESTS.labels(role, decision.limit.name).inc()
+        retry_after = max(1, math.ceil(decision.retry_after))
+        body = json.dumps(
+            {
+                "error": f"Rate limit exceeded ({decision.limit.name}); retry in {retry_after} s"
+            }
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+rate_limiter = RateLimiter(RATE_LIMIT_MAX_KEYS, RATE_LIMIT_SWEEP_SECONDS)
@@ -0,0 +1,350 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import httpx
+import prisma
+import prisma.models
+
+from project.database import database
+from project.http_client import get_http_client
+from project.metrics import (
+    UPSTREAM_FETCH_DURATION,
+    UPSTREAM_FETCH_ERRORS,
+    db_query,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ProvidersUnavailableError(Exception):
+    """
+    Raised when every configured rate provider is out of quota, cooling down or failing.
+    """
+
+
+class TokenBucket:
+    """
+    Tracks the remaining upstream quota of one provider in memory.
+
+    The bucket refills continuously at capacity / window_seconds and is topped up to full capacity when the
+    provider's reset time passes, mirroring the limit/remaining/resetTimestamp columns of ExternalAPIRateLimit.
+    A capacity of None means the provider has no known quota.
+    """
+
+    def __init__(
+        self,
+        capacity: Optional[float],
+        tokens: float,
+        window_seconds: float,
+        reset_at: Optional[datetime] = None,
+    ):
+        self.capacity = capacity
+        self.tokens = tokens if capacity is None else min(tokens, capacity)
+        self.window_seconds = window_seconds
+        self.reset_at = reset_at
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        if self.capacity is None:
+            return
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self._updated) * self.capacity / self.window_seconds,
+        )
+        self._updated = now
+        if self.reset_at is not None and datetime.now(timezone.utc) >= self.reset_at:
+            self.tokens = self.capacity
+            while self.reset_at <= datetime.now(timezone.utc):
+                self.reset_at += timedelta(seconds=self.window_seconds)
+
+    @property
+    def headroom(self) -> float:
+        if self.capacity is None:
+            return 1.0
+        self._refill()
+        return self.tokens / self.capacity if self.capacity else 0.0
+
+    def try_acquire(self) -> bool:
+        if self.capacity is None:
+            return True
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def drain(self) -> None:
+        if self.capacity is not None:
+            self._refill()
+            self.tokens = 0.0
+
+    def observe_remaining(self, remaining: float) -> None:
+        if self.capacity is not None:
+            self._refill()
+            self.tokens = min(self.capacity, remaining)
+
+
+@dataclass
+class ProviderState:
+    """
+    In-memory view of one ExternalAPI row together with its quota bucket and observed health.
+    """
+
+    id: Optional[str]
+    name: str
+    base_url: str
+    api_key: str
+    bucket: TokenBucket
+    rate_limit_id: Optional[str] = None
+    latency_ewma: Optional[float] = None
+    failures: int = 0
+    cooldown_until: float = 0.0
+    dirty: bool = False
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until and self.bucket.headroom > 0
+
+    def score(self) -> float:
+        # Prefer providers with more of their quota left, discounted by how slow they have been.
+        latency = self.latency_ewma if self.latency_ewma is not None else 0.0
+        return self.bucket.headroom / (latency + 0.05)
+
+
+class ProviderScheduler:
+    """
+    Routes upstream rate fetches across the providers configured in ExternalAPI.
+
+    Each fetch goes to the available provider with the best headroom/latency score and fails over to the next one
+    on errors or HTTP 429. Quota is tracked in memory and written back to ExternalAPIRateLimit only periodically.
+    When no providers are configured, a single provider built from the default URL and key is used.
+    """
+
+    def __init__(
+        self,
+        default_base_url: str,
+        default_api_key: str,
+        quota_window_seconds: float,
+        sync_interval_seconds: float,
+        failure_cooldown_seconds: float,
+        latency_smoothing: float = 0.2,
+    ):
+        self.default_base_url = default_base_url
+        self.default_api_key = default_api_key
+        self.quota_window_seconds = quota_window_seconds
+        self.sync_interval_seconds = sync_interval_seconds
+        self.failure_cooldown_seconds = failure_cooldown_seconds
+        self.latency_smoothing = latency_smoothing
+        self.providers: List[ProviderState] = [self._default_provider()]
+        self.loaded = False
+        self._sync_task: Optional[asyncio.Task] = None
+
+    def _default_provider(self) -> ProviderState:
+        return ProviderState(
+            id=None,
+            name="default",
+            base_url=self.default_base_url,
+            api_key=self.default_api_key,
+            bucket=TokenBucket(None, 0.0, self.quota_window_seconds),
+        )
+
+    async def load(self) -> None:
+        """
+        Loads the configured providers and their latest quota rows from the database.
+        """
+        await database.ensure_connected()
+        with db_query("ExternalAPI", "find_many"):
+            apis = await prisma.models.ExternalAPI.prisma().find_many(
+                include={"RateLimits": True}
+            )
+        providers = []
+        for api in apis:
+            limits = sorted(api.RateLimits or [], key=lambda r: r.updatedAt)
+            if limits:
+                latest = limits[-1]
+                bucket = TokenBucket(
+                    latest.limit,
+                    latest.remaining,
+                    self.quota_window_seconds,
+                    reset_at=latest.resetTimestamp,
+                )
+                rate_limit_id = latest.id
+            else:
+                bucket = TokenBucket(None, 0.0, self.quota_window_seconds)
+                rate_limit_id = None
+            providers.append(
+                ProviderState(
+                    id=api.id,
+                    name=api.name,
+                    base_url=api.baseUrl.rstrip("/"),
+                    api_key=api.apiKey,
+                    bucket=bucket,
+                    rate_limit_id=rate_limit_id,
+                )
+            )
+        self.providers = providers or [self._default_provider()]
+        self.loaded = True
+        logger.info(
+            "Loaded rate providers: %s", ", ".join(p.name for p in self.providers)
+        )
+
+    def ranked(self) -> List[ProviderState]:
+        """
+        Returns the currently available providers, best candidate first.
+        """
+        return sorted(
+            (p for p in self.providers if p.available),
+            key=ProviderState.score,
+            reverse=True,
+        )
+
+    def _record_latency(self, provider: ProviderState, elapsed: float) -> None:
+        if provider.latency_ewma is None:
+            provider.latency_ewma = elapsed
+        else:
+            provider.latency_ewma += self.latency_smoothing * (
+                elapsed - provider.latency_ewma
+            )
+
+    def _record_failure(
+        self, provider: ProviderState, cooldown: Optional[float] = None
+    ) -> None:
+        provider.failures += 1
+        if cooldown is None:
+            cooldown = self.failure_cooldown_seconds * 2 ** min(
+                provider.failures - 1, 6
+            )
+        provider.cooldown_until = time.monotonic() + cooldown
+
+    async def fetch_rates(self, base: str) -> Dict[str, float]:
+        """
+        Fetches the full rate table for the base currency from the best available provider, failing over on errors.
+
+        If every provider with quota left is cooling down after failures, they are retried anyway, soonest first.
+
+        Args:
+            base (str): The base currency code.
+
+        Returns:
+            Dict[str, float]: Currency codes mapped to exchange rates.
+
+        Raises:
+            ProvidersUnavailableError: If no provider could serve the request.
+        """
+        if not self.loaded:
+            await self.load()
+        errors = []
+        candidates = self.ranked() or sorted(
+            (p for p in self.providers if p.bucket.headroom > 0),
+            key=lambda p: p.cooldown_until,
+        )
+        for provider in candidates:
+            if not provider.bucket.try_acquire():
+                continue
+            provider.dirty = True
+            started = time.perf_counter()
+            try:
+                response = await get_http_client().get(
+                    f"{provider.base_url}/latest",
+                    params={"access_key": provider.api_key, "base": base},
+                )
+            except httpx.HTTPError as e:
+                self._record_failure(provider)
+                UPSTREAM_FETCH_ERRORS.labels(provider.name, "transport").inc()
+                errors.append(f"{provider.name}: {e!r}")
+                continue
+            elapsed = time.perf_counter() - started
+            self._record_latency(provider, elapsed)
+            UPSTREAM_FETCH_DURATION.labels(provider.name).observe(elapsed)
+            if response.status_code == 429:
+                UPSTREAM_FETCH_ERRORS.labels(provider.name, "rate_limited").inc()
+                provider.bucket.drain()
+                retry_after = response.headers.get("Retry-After", "")
+                self._record_failure(
+                    provider,
+                    float(retry_after) if retry_after.isdigit() else None,
+                )
+                errors.append(f"{provider.name}: quota exhausted")
+                continue
+            if response.status_code != 200:
+                self._record_failure(provider)
+                UPSTREAM_FETCH_ERRORS.labels(provider.name, "status").inc()
+                errors.append(f"{provider.name}: HTTP {response.status_code}")
+                continue
+            remaining = response.headers.get("X-RateLimit-Remaining", "")
+            if remaining.isdigit():
+                provider.bucket.observe_remaining(float(remaining))
+            try:
+                rates = response.json()["rates"]
+            except (ValueError, KeyError, TypeError):
+                # e.g. {"success": false, "error": {...}} with HTTP 200, or a body that is not JSON.
+                self._record_failure(provider)
+                UPSTREAM_FETCH_ERRORS.labels(provider.name, "body").inc()
+                errors.append(f"{provider.name}: no rates in response")
+                continue
+            provider.failures = 0
+            return rates
+        raise ProvidersUnavailableError(
+            "No rate provider available" + (f" ({'; '.join(errors)})" if errors else "")
+        )
+
+    async def sync(self) -> None:
+        """
+        Writes the in-memory quota of every provider used since the last sync back to ExternalAPIRateLimit.
+        """
+        for provider in self.providers:
+            if not provider.dirty or provider.rate_limit_id is None:
+                continue
+            # Cleared before the write so that quota used during it marks the provider again, and restored if
+            # the write fails.
+            provider.dirty = False
+            bucket = provider.bucket
+            data = {"remaining": int(bucket.headroom * bucket.capacity)}
+            if bucket.reset_at is not None:
+                data["resetTimestamp"] = bucket.reset_at
+            try:
+                with db_query("ExternalAPIRateLimit", "update"):
+                    await prisma.models.ExternalAPIRateLimit.prisma().update(
+                        where={"id": provider.rate_limit_id}, data=data
+                    )
+            except BaseException:
+                provider.dirty = True
+                raise
+
+    async def _run_sync(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval_seconds)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Rate provider quota sync failed")
+
+    async def start(self, load: bool = True) -> None:
+        """
+        Loads the providers and starts the periodic quota sync task.
+
+        Args:
+            load (bool): Load the providers now rather than on the first fetch.
+        """
+        if load:
+            await self.load()
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._run_sync())
+
+    async def stop(self) -> None:
+        """
+        Stops the periodic sync task and writes the final quota state.
+        """
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+        await self.sync()
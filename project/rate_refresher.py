@@ -0,0 +1,214 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from project.deadlines import bounded
+from project.rate_engine import RateEngine, RateMatrix
+from project.shared_rate_snapshot import SharedRateSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class StaleRatesError(Exception):
+    """
+    Raised when no rate snapshot younger than the hard staleness limit is available.
+    """
+
+
+class RateRefresher:
+    """
+    Polls the upstream on a fixed schedule in a background task and publishes each snapshot to the rate engine.
+
+    Requests read only the published snapshot, so a slow or failing upstream never blocks them. While the upstream
+    is failing the last good snapshot keeps being served, with its age reported, until it is older than the hard
+    staleness limit.
+
+    With a shared snapshot, only the worker leading it polls the upstream; the other workers publish what the
+    leader writes there, so the upstream is polled once per interval however many workers run.
+
+    On start, the last snapshot kept on disk (the shared snapshot, or else the one returned by warm_start) is
+    published right away if it is within the hard staleness limit, and the first refresh waits until it is due.
+    """
+
+    def __init__(
+        self,
+        engine: RateEngine,
+        loader: Callable[[str], Awaitable[Dict[str, float]]],
+        interval_seconds: float,
+        retry_seconds: float,
+        stale_after_seconds: float,
+        max_staleness_seconds: float,
+        shared: Optional[SharedRateSnapshot] = None,
+        warm_start: Optional[Callable[[], Optional[RateMatrix]]] = None,
+    ):
+        self.engine = engine
+        self.loader = loader
+        self.interval_seconds = interval_seconds
+        self.retry_seconds = retry_seconds
+        self.stale_after_seconds = stale_after_seconds
+        self.max_staleness_seconds = max_staleness_seconds
+        self.shared = shared
+        self.warm_start = warm_start
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def leading(self) -> bool:
+        """
+        Whether this process polls the upstream, i.e. there is no shared snapshot or this process leads it.
+        """
+        return self.shared is None or self.shared.leader
+
+    async def refresh_once(self) -> RateMatrix:
+        """
+        Fetches a fresh pivot table and publishes it as the current snapshot.
+
+        Returns:
+            RateMatrix: The newly published snapshot.
+        """
+        pivot_rates = await self.loader(self.engine.pivot)
+        if not pivot_rates:
+            raise ValueError("Upstream returned an empty rate table")
+        if self.shared is not None and self.shared.leader:
+            matrix = self.engine.publish(
+                RateMatrix(
+                    self.engine.pivot,
+                    pivot_rates,
+                    datetime.now(),
+                    snapshot_id=self.shared.next_snapshot_id(),
+                )
+            )
+            self.shared.write(matrix)
+            return matrix
+        return self.engine.publish(
+            RateMatrix(self.engine.pivot, pivot_rates, datetime.now())
+        )
+
+    def _adopt_shared(self) -> None:
+        """
+        Publishes the shared snapshot if another worker wrote a newer one.
+        """
+        matrix = self.shared.read()
+        current = self.engine.current
+        if matrix is not None and (
+            current is None or matrix.snapshot_id > current.snapshot_id
+        ):
+            self.engine.publish(matrix)
+
+    async def _lead(self) -> float:
+        """
+        Refreshes if the current snapshot is due, and returns the time until the next refresh is due.
+        """
+        if self.shared is not None:
+            self._adopt_shared()
+        # A snapshot written by the previous leader, or before a restart, counts as the last refresh.
+        matrix = self.engine.current
+        if matrix is not None:
+            due_in = self.interval_seconds - self.age_seconds(matrix)
+            if due_in > 0:
+                return due_in
+        await self.refresh_once()
+        return self.interval_seconds
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self.shared is None or self.shared.acquire_leadership():
+                    delay = await self._lead()
+                else:
+                    self._adopt_shared()
+                    delay = self.shared.poll_seconds
+                self.last_error = None
+                if self.engine.current is not None:
+                    self._ready.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Rate refresh failed")
+                self.last_error = str(e)
+                delay = self.retry_seconds
+            await asyncio.sleep(delay)
+
+    async def start(self) -> None:
+        """
+        Starts the background polling task. The first refresh runs immediately, unless the shared snapshot holds
+        one that is not yet due.
+        """
+        if not self.running:
+            if self.shared is not None:
+                self.shared.open()
+                self._adopt_shared()
+            elif self.warm_start is not None and self.engine.current is None:
+                matrix = self.warm_start()
+                if (
+                    matrix is not None
+                    and self.age_seconds(matrix) <= self.max_staleness_seconds
+                ):
+                    self.engine.publish(matrix)
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Cancels the background polling task and waits for it to finish.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self.shared is not None:
+                self.shared.close()
+
+    def describe_snapshot(self) -> str:
+        """
+        Describes the snapshot currently served, for the startup report.
+        """
+        matrix = self.engine.current
+        if matrix is None:
+            return "none"
+        return f"{len(matrix.codes)} currencies, {self.age_seconds(matrix):.0f} s old"
+
+    def age_seconds(self, matrix: RateMatrix) -> float:
+        return (datetime.now() - matrix.fetched_at).total_seconds()
+
+    async def get_snapshot(self) -> RateMatrix:
+        """
+        Returns the current snapshot without touching the upstream while the background task is running.
+
+        Requests arriving while the first refresh is in flight wait for it, for up to the retry delay or until the
+        request's deadline. When the refresher is not running (e.g. outside the application lifespan) the snapshot
+        is loaded on demand through the rate engine instead.
+
+        Returns:
+            RateMatrix: The current snapshot.
+
+        Raises:
+            StaleRatesError: If there is no snapshot yet or it is older than the hard staleness limit.
+        """
+        matrix = self.engine.current
+        if matrix is None and not self.running:
+            matrix = await self.engine.get_matrix()
+        elif matrix is None:
+            try:
+                await asyncio.wait_for(self._ready.wait(), bounded(self.retry_seconds))
+            except asyncio.TimeoutError:
+                pass
+            matrix = self.engine.current
+        if matrix is None:
+            raise StaleRatesError(
+                f"No exchange rates available yet: {self.last_error or 'first refresh pending'}"
+            )
+        if self.age_seconds(matrix) > self.max_staleness_seconds:
+            raise StaleRatesError(
+                f"Exchange rates are older than {self.max_staleness_seconds:g} seconds"
+            )
+        return matrix
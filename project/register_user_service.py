@@ -1,8 +1,10 @@
-import bcrypt
 import prisma
 import prisma.models
 from pydantic import BaseModel
 
+from project.metrics import db_query
+from project.password_hashing import password_hasher
+
 
 class UserRole(BaseModel):
     """
@@ -39,17 +41,17 @@ async def register_user(
     Raises:
         ValidationError: If the email is already taken or the role is not valid.
     """
-    existing_user = await prisma.models.User.prisma().find_unique(
-        where={"email": email}
-    )
+    with db_query("User", "find_unique"):
+        existing_user = await prisma.models.User.prisma().find_unique(
+            where={"email": email}
+        )
     if existing_user:
         raise ValueError("Email already in use")
-    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode(
-        "utf-8"
-    )
-    new_user = await prisma.models.User.prisma().create(
-        data={"email": email, "password": hashed_password, "role": role}
-    )
+    hashed_password = await password_hasher.hash(password)
+    with db_query("User", "create"):
+        new_user = await prisma.models.User.prisma().create(
+            data={"email": email, "password": hashed_password, "role": role}
+        )
     return UserRegistrationResponse(
         user_id=new_user.id, email=new_user.email, role=new_user.role
     )
@@ -1,29 +1,85 @@
+import json
 import logging
 from contextlib import asynccontextmanager
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Literal, Optional, Union
 
+import project.admission_control
+import project.auth_token_cache
 import project.authenticate_user_service
 import project.batch_convert_currency_service
+import project.bulk_convert_service
+import project.conversion_rollups
+import project.convert_amounts_service
 import project.convert_currency_service
 import project.create_user_profile_service
+import project.currency_query_recorder
+import project.database
+import project.http_client
+import project.log_entry_handler
+import project.logout_user_service
+import project.metrics
+import project.password_hashing
+import project.profiler
+import project.rate_broadcaster
+import project.rate_history_service
+import project.rate_history_store
+import project.rate_limiter
+import project.rate_refresher
 import project.register_user_service
+import project.startup
 import project.update_user_profile_service
+import project.user_history_summary_service
 import project.view_user_history_service
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Header, Request
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import Response
-from prisma import Prisma
+from fastapi.responses import Response, StreamingResponse
 
 logger = logging.getLogger(__name__)
 
-db_client = Prisma(auto_register=True)
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await db_client.connect()
+    """
+    Starts the background components. In fast-start mode the database and the upstream client are left to connect
+    on first use, and /convert is served from the last rate snapshot recorded on local disk while the first
+    refresh is pending.
+    """
+    fast_start = project.startup.FAST_START
+    with project.startup.startup_report.stage("lifespan"):
+        if not fast_start:
+            await project.database.database.ensure_connected()
+            await project.http_client.start_http_client()
+        project.rate_history_store.rate_history_store.open()
+        await project.convert_currency_service.provider_scheduler.start(
+            load=not fast_start
+        )
+        await project.convert_currency_service.rate_refresher.start()
+        await project.currency_query_recorder.query_recorder.start()
+        await project.conversion_rollups.conversion_rollups.start()
+        if project.log_entry_handler.LOG_ENTRY_ENABLED:
+            await project.log_entry_handler.log_entry_handler.start()
+        await project.metrics.loop_lag_monitor.start()
+        await project.profiler.slow_callback_detector.start()
+        await project.rate_limiter.rate_limiter.start()
+    project.startup.startup_report.snapshot = (
+        project.convert_currency_service.rate_refresher.describe_snapshot()
+    )
     yield
-    await db_client.disconnect()
+    await project.rate_limiter.rate_limiter.stop()
+    await project.metrics.loop_lag_monitor.stop()
+    await project.profiler.slow_callback_detector.stop()
+    await project.currency_query_recorder.query_recorder.stop()
+    # After the recorder, whose final rows it still has to checkpoint.
+    await project.conversion_rollups.conversion_rollups.stop()
+    await project.convert_currency_service.rate_refresher.stop()
+    await project.convert_currency_service.provider_scheduler.stop()
+    await project.http_client.close_http_client()
+    project.rate_history_store.rate_history_store.close()
+    project.password_hashing.password_hasher.shutdown()
+    # Last, so that records logged while the other components shut down are written too.
+    await project.log_entry_handler.log_entry_handler.stop()
+    await project.database.database.disconnect()
 
 
 app = FastAPI(
@@ -32,10 +88,27 @@ app = FastAPI(
     description="The endpoint design is focused on performing currency conversions by accepting a base currency and optionally one or more target currency codes. Leveraging the Python programming language with the FastAPI framework, the application will provide fast, asynchronous API responses. The backend will interact with PostgreSQL through Prisma, an ORM that offers robust data management and ease of use for Python developers.\n\nTo fulfill the task requirements, the API will perform the following steps:\n1. Accept a GET request with query parameters for the base currency (e.g., 'GBP') and target currency/currencies.\n2. Use the provided financial data APIs, such as Open Exchange Rates or CurrencyLayer, as the reliable sources for real-time exchange rate data. This choice is based on the search results for reliable sources.\n3. Implement an async function that fetches the latest exchange rates from the chosen API. This function will handle converting the base currency to the target currencies specified by the user. If 'all of them' is specified as the target, the function will fetch the exchange rates for the base currency against every available currency provided by the API.\n4. Calculate the exchange rate between the base and the target currencies using the data retrieved. This involves a straightforward calculation if direct rates are available, or a conversion path if direct rates are not provided.\n5. Format the response to include the exchange rate(s), the base currency, and target currencies, alongside a timestamp marking the exact time of the currency rate retrieval.\n\nThis setup ensures scalability for supporting multiple currencies, efficiency in fetching and calculating real-time exchange rates, and reliability by utilizing trusted financial data sources. The endpoint will be well-documented to guide users on how to specify base and target currencies correctly.",
 )
 
+# FastAPI 0.70 keeps unknown keyword arguments such as lifespan as metadata; the router is what runs it.
+app.router.lifespan_context = lifespan
+# Added first so that the middleware wrapping it, metrics outermost, also sees rejected and shed requests.
+app.add_middleware(project.admission_control.AdmissionControlMiddleware)
+app.add_middleware(project.rate_limiter.RateLimitMiddleware)
+app.add_middleware(project.metrics.MetricsMiddleware)
+
+
+@app.get("/metrics")
+async def api_get_metrics() -> Response:
+    """
+    Exposes request, upstream, database, password hashing and event loop metrics in the Prometheus text format
+    """
+    content, content_type = project.metrics.render_metrics()
+    return Response(content=content, headers={"Content-Type": content_type})
+
 
 @app.post(
     "/auth/login",
     response_model=project.authenticate_user_service.AuthenticateUserResponse,
+    dependencies=[Depends(project.database.require_database)],
 )
 async def api_post_authenticate_user(
     email: str, password: str
@@ -46,12 +119,48 @@ async def api_post_authenticate_user(
     try:
         res = await project.authenticate_user_service.authenticate_user(email, password)
         return res
+    except project.password_hashing.PasswordHasherBusyError as e:
+        logger.warning("Rejecting request: %s", e)
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=503,
+            media_type="application/json",
+        )
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/auth/logout",
+    response_model=project.logout_user_service.LogoutResponse,
+    dependencies=[Depends(project.database.require_database)],
+)
+async def api_post_logout_user(
+    user: project.auth_token_cache.AuthenticatedUser = Depends(
+        project.auth_token_cache.require_auth
+    ),
+) -> project.logout_user_service.LogoutResponse | Response:
+    """
+    Revokes the bearer token used to make the request
+    """
+    try:
+        res = await project.logout_user_service.logout_user(user.token)
+        return res
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
         res["error"] = str(e)
         return Response(
-            content=jsonable_encoder(res),
+            content=json.dumps(jsonable_encoder(res)),
             status_code=500,
             media_type="application/json",
         )
@@ -62,22 +171,146 @@ async def api_post_authenticate_user(
     response_model=project.batch_convert_currency_service.BatchConversionResponse,
 )
 async def api_post_batch_convert_currency(
-    base_currency: str, target_currencies: List[str]
+    base_currency: str,
+    target_currencies: Union[
+        project.batch_convert_currency_service.BatchConversionRequest, List[str]
+    ],
+    user: Optional[project.auth_token_cache.AuthenticatedUser] = Depends(
+        project.auth_token_cache.optional_auth
+    ),
 ) -> project.batch_convert_currency_service.BatchConversionResponse | Response:
     """
-    Performs batch conversion from a base currency to multiple targets
+    Performs batch conversion from a base currency to multiple targets, optionally converting amounts across several bases
     """
     try:
         res = await project.batch_convert_currency_service.batch_convert_currency(
-            base_currency, target_currencies
+            base_currency, target_currencies, user.user_id if user else None
+        )
+        return res
+    except project.batch_convert_currency_service.BatchLengthMismatchError as e:
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=422,
+            media_type="application/json",
+        )
+    except project.rate_refresher.StaleRatesError as e:
+        logger.warning("Serving no rates: %s", e)
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=503,
+            media_type="application/json",
+        )
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/convert_amounts",
+    response_model=project.convert_amounts_service.AmountConversionResponse,
+)
+async def api_post_convert_amounts(
+    base_currency: str,
+    request: project.convert_amounts_service.AmountConversionRequest,
+    user: Optional[project.auth_token_cache.AuthenticatedUser] = Depends(
+        project.auth_token_cache.optional_auth
+    ),
+) -> project.convert_amounts_service.AmountConversionResponse | Response:
+    """
+    Converts amounts given in integer minor units with exact fixed-point arithmetic and deterministic rounding
+    """
+    try:
+        res = await project.convert_amounts_service.convert_amounts(
+            base_currency, request, user.user_id if user else None
         )
         return res
+    except project.convert_amounts_service.AmountListLengthError as e:
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=422,
+            media_type="application/json",
+        )
+    except project.rate_refresher.StaleRatesError as e:
+        logger.warning("Serving no rates: %s", e)
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=503,
+            media_type="application/json",
+        )
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post("/bulk_convert")
+async def api_post_bulk_convert(
+    request: Request,
+    base_currency: Optional[str] = None,
+    format: Optional[str] = None,
+) -> StreamingResponse | Response:
+    """
+    Converts an uploaded CSV or NDJSON file of (amount, base, target) rows, streaming the results back
+    """
+    try:
+        input_format = format
+        if input_format is None:
+            content_type = request.headers.get("content-type", "")
+            input_format = "ndjson" if "ndjson" in content_type else "csv"
+        matrix = await project.convert_currency_service.rate_refresher.get_snapshot()
+        body = await project.bulk_convert_service.bulk_convert(
+            request.stream(), input_format, matrix, base_currency
+        )
+        return project.bulk_convert_service.BulkConvertResponse(
+            body,
+            media_type="text/csv" if input_format == "csv" else "application/x-ndjson",
+            headers={
+                "X-Rate-Snapshot-Id": str(matrix.snapshot_id),
+                "X-Rate-Snapshot-Timestamp": matrix.fetched_at.isoformat(),
+            },
+        )
+    except project.bulk_convert_service.BulkConvertFormatError as e:
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=400,
+            media_type="application/json",
+        )
+    except project.rate_refresher.StaleRatesError as e:
+        logger.warning("Serving no rates: %s", e)
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=503,
+            media_type="application/json",
+        )
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
         res["error"] = str(e)
         return Response(
-            content=jsonable_encoder(res),
+            content=json.dumps(jsonable_encoder(res)),
             status_code=500,
             media_type="application/json",
         )
@@ -86,54 +319,207 @@ async def api_post_batch_convert_currency(
 @app.get(
     "/user/history",
     response_model=project.view_user_history_service.ViewUserHistoryResponse,
+    dependencies=[Depends(project.database.require_database)],
 )
 async def api_get_view_user_history(
     user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = project.view_user_history_service.HISTORY_PAGE_SIZE,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    base_currency: Optional[str] = None,
+    target_currency: Optional[str] = None,
 ) -> project.view_user_history_service.ViewUserHistoryResponse | Response:
     """
-    Retrieves the conversion history for a user
+    Retrieves one page of the conversion history for a user
+    """
+    try:
+        res = await project.view_user_history_service.view_user_history(
+            user_id, cursor, limit, start, end, base_currency, target_currency
+        )
+        return res
+    except project.view_user_history_service.InvalidCursorError as e:
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=400,
+            media_type="application/json",
+        )
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/user/history/summary",
+    response_model=project.user_history_summary_service.UserHistorySummaryResponse,
+    dependencies=[Depends(project.database.require_database)],
+)
+async def api_get_user_history_summary(
+    user_id: str,
+) -> project.user_history_summary_service.UserHistorySummaryResponse | Response:
+    """
+    Summarizes the conversion history of a user per currency pair
     """
     try:
-        res = await project.view_user_history_service.view_user_history(user_id)
+        res = await project.user_history_summary_service.view_user_history_summary(
+            user_id
+        )
         return res
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
         res["error"] = str(e)
         return Response(
-            content=jsonable_encoder(res),
+            content=json.dumps(jsonable_encoder(res)),
             status_code=500,
             media_type="application/json",
         )
 
 
+@app.get(
+    "/user/history/stream",
+    dependencies=[Depends(project.database.require_database)],
+)
+async def api_get_stream_user_history(
+    user_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    base_currency: Optional[str] = None,
+    target_currency: Optional[str] = None,
+) -> StreamingResponse:
+    """
+    Streams the full conversion history for a user as newline-delimited JSON
+    """
+    return StreamingResponse(
+        project.view_user_history_service.stream_user_history(
+            user_id, start, end, base_currency, target_currency
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
 @app.get(
     "/convert/{base}/{targets}",
     response_model=project.convert_currency_service.ConvertCurrencyResponse,
 )
 async def api_get_convert_currency(
-    base: str, targets: str
+    base: str,
+    targets: str,
+    as_of: Optional[datetime] = None,
+    user: Optional[project.auth_token_cache.AuthenticatedUser] = Depends(
+        project.auth_token_cache.optional_auth
+    ),
+    if_none_match: Optional[str] = Header(None),
 ) -> project.convert_currency_service.ConvertCurrencyResponse | Response:
     """
-    Converts base currency to target currencies using real-time exchange rates
+    Converts base currency to target currencies using real-time exchange rates, or the rates in effect at as_of
+
+    Live conversions carry an ETag and answer a matching If-None-Match with 304 Not Modified.
+    """
+    try:
+        if as_of is not None:
+            res = await project.convert_currency_service.convert_currency(
+                base, targets, user.user_id if user else None, as_of
+            )
+            return res
+        etag, body = await project.convert_currency_service.convert_currency_encoded(
+            base, targets, user.user_id if user else None, if_none_match
+        )
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if body is None:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+    except project.rate_history_store.RateHistoryUnavailableError as e:
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=404,
+            media_type="application/json",
+        )
+    except project.rate_refresher.StaleRatesError as e:
+        logger.warning("Serving no rates: %s", e)
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=503,
+            media_type="application/json",
+        )
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/rates/history/{base}/{target}",
+    response_model=project.rate_history_service.RateHistoryStatsResponse,
+)
+async def api_get_rate_history_stats(
+    base: str, target: str, start: datetime, end: datetime
+) -> project.rate_history_service.RateHistoryStatsResponse | Response:
+    """
+    Summarizes the recorded base/target rate over a time window
     """
     try:
-        res = await project.convert_currency_service.convert_currency(base, targets)
+        res = await project.rate_history_service.get_rate_history_stats(
+            base, target, start, end
+        )
         return res
+    except project.rate_history_store.RateHistoryUnavailableError as e:
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=404,
+            media_type="application/json",
+        )
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
         res["error"] = str(e)
         return Response(
-            content=jsonable_encoder(res),
+            content=json.dumps(jsonable_encoder(res)),
             status_code=500,
             media_type="application/json",
         )
 
 
+@app.get("/rates/stream/{base}")
+async def api_get_stream_rates(
+    base: str, targets: Optional[str] = None
+) -> StreamingResponse:
+    """
+    Pushes rate updates for a base currency as Server-Sent Events: a full snapshot, then only the changed rates
+    """
+    return StreamingResponse(
+        project.rate_broadcaster.stream_rate_events(
+            base,
+            tuple(targets.split(",")) if targets and targets != "all" else None,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post(
     "/auth/register",
     response_model=project.register_user_service.UserRegistrationResponse,
+    dependencies=[Depends(project.database.require_database)],
 )
 async def api_post_register_user(
     email: str, password: str, role: project.register_user_service.UserRole
@@ -144,12 +530,21 @@ async def api_post_register_user(
     try:
         res = await project.register_user_service.register_user(email, password, role)
         return res
+    except project.password_hashing.PasswordHasherBusyError as e:
+        logger.warning("Rejecting request: %s", e)
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=503,
+            media_type="application/json",
+        )
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
         res["error"] = str(e)
         return Response(
-            content=jsonable_encoder(res),
+            content=json.dumps(jsonable_encoder(res)),
             status_code=500,
             media_type="application/json",
         )
@@ -158,6 +553,7 @@ async def api_post_register_user(
 @app.post(
     "/user",
     response_model=project.create_user_profile_service.CreateUserProfileResponse,
+    dependencies=[Depends(project.database.require_database)],
 )
 async def api_post_create_user_profile(
     email: str, password: str, username: str, role: str
@@ -170,12 +566,21 @@ async def api_post_create_user_profile(
             email, password, username, role
         )
         return res
+    except project.password_hashing.PasswordHasherBusyError as e:
+        logger.warning("Rejecting request: %s", e)
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=503,
+            media_type="application/json",
+        )
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
         res["error"] = str(e)
         return Response(
-            content=jsonable_encoder(res),
+            content=json.dumps(jsonable_encoder(res)),
             status_code=500,
             media_type="application/json",
         )
@@ -184,6 +589,7 @@ async def api_post_create_user_profile(
 @app.put(
     "/user/{id}",
     response_model=project.update_user_profile_service.UpdateUserProfileResponse,
+    dependencies=[Depends(project.database.require_database)],
 )
 async def api_put_update_user_profile(
     id: str,
@@ -204,7 +610,81 @@ async def api_put_update_user_profile(
         res = dict()
         res["error"] = str(e)
         return Response(
-            content=jsonable_encoder(res),
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/admin/query_recorder",
+    response_model=project.currency_query_recorder.RecorderStats,
+)
+async def api_get_query_recorder_stats(
+    user: project.auth_token_cache.AuthenticatedUser = Depends(
+        project.auth_token_cache.require_admin
+    ),
+) -> project.currency_query_recorder.RecorderStats:
+    """
+    Reports queue depth, batch sizes and flush latency of the conversion history recorder
+    """
+    return project.currency_query_recorder.query_recorder.stats()
+
+
+@app.post("/admin/profile")
+async def api_post_profile(
+    seconds: float = 10,
+    interval: float = project.profiler.PROFILER_INTERVAL_SECONDS,
+    format: Literal["speedscope", "collapsed"] = "speedscope",
+    threads: Literal["loop", "all"] = "loop",
+    user: project.auth_token_cache.AuthenticatedUser = Depends(
+        project.auth_token_cache.require_admin
+    ),
+) -> Response:
+    """
+    Samples the Python stacks of this worker for a few seconds and returns them as a speedscope or collapsed stack file
+    """
+    try:
+        if not 0 < seconds <= project.profiler.PROFILER_MAX_SECONDS:
+            raise ValueError(
+                f"seconds must be between 0 and {project.profiler.PROFILER_MAX_SECONDS:g}"
+            )
+        profile = await project.profiler.profiler.profile(
+            seconds, interval, all_threads=threads == "all"
+        )
+        name = f"profile-{datetime.now():%Y%m%dT%H%M%S}"
+        if format == "collapsed":
+            return Response(
+                content=profile.collapsed(),
+                media_type="text/plain",
+                headers={
+                    "Content-Disposition": f'attachment; filename="{name}.collapsed.txt"'
+                },
+            )
+        return Response(
+            content=json.dumps(profile.speedscope(name)),
+            media_type="application/json",
+            headers={
+                "Content-Disposition": f'attachment; filename="{name}.speedscope.json"'
+            },
+        )
+    except (ValueError, project.profiler.ProfilerBusyError) as e:
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
+            status_code=400 if isinstance(e, ValueError) else 409,
+            media_type="application/json",
+        )
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=json.dumps(jsonable_encoder(res)),
             status_code=500,
             media_type="application/json",
         )
+
+
+project.startup.startup_report.imported()
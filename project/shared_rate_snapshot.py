@@ -0,0 +1,207 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from project.rate_engine import RateMatrix
+
+logger = logging.getLogger(__name__)
+
+RATE_SHARED_SNAPSHOT_PATH = os.getenv("RATE_SHARED_SNAPSHOT_PATH", "")
+RATE_SHARED_SNAPSHOT_CAPACITY = int(os.getenv("RATE_SHARED_SNAPSHOT_CAPACITY", "512"))
+RATE_SHARED_SNAPSHOT_POLL_SECONDS = float(
+    os.getenv("RATE_SHARED_SNAPSHOT_POLL_SECONDS", "1")
+)
+
+MAGIC = b"RATESNAP"
+LAYOUT_VERSION = 1
+CODE_WIDTH = 8
+# Header fields: magic, layout version and capacity; then the sequence number; then snapshot id, fetch time,
+# currency count and pivot.
+HEADER = struct.Struct("<8sII")
+SEQUENCE = struct.Struct("<Q")
+SNAPSHOT = struct.Struct(f"<QdI{CODE_WIDTH}s")
+SEQUENCE_OFFSET = 16
+SNAPSHOT_OFFSET = 24
+TABLE_OFFSET = 64
+READ_ATTEMPTS = 1000
+
+
+class SharedRateSnapshot:
+    """
+    Fixed-layout rate snapshot in a memory-mapped file, shared by every worker process on a host.
+
+    One worker at a time holds an exclusive flock on the companion .lock file and is the leader: it polls the
+    upstream and writes each snapshot here. The others read it without locks, seqlock style. The writer makes
+    the sequence number odd before changing the table and even again after, and a reader retries until it
+    copied the table between two reads of the same even sequence number. The lock is released when the leader
+    exits, so another worker takes over.
+
+    The file holds a 64-byte header (magic, layout version, capacity, sequence, snapshot id, fetch time,
+    currency count, pivot), then capacity 8-byte currency codes, then capacity float64 pivot rates.
+    """
+
+    def __init__(self, path: str, capacity: int, poll_seconds: float):
+        self.path = path
+        self.capacity = capacity
+        self.poll_seconds = poll_seconds
+        self.size = TABLE_OFFSET + capacity * (CODE_WIDTH + 8)
+        self.leader = False
+        self.last_sequence = 0
+        self._fd: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._codes: Optional[np.ndarray] = None
+        self._rates: Optional[np.ndarray] = None
+        self._overflow_logged = False
+
+    def open(self) -> None:
+        """
+        Maps the file, creating or resetting it if it is missing or was written with another layout or capacity.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        # Held briefly so that only one of several starting workers initializes the file.
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, HEADER.size, 0)
+            if (
+                os.fstat(self._fd).st_size != self.size
+                or len(header) != HEADER.size
+                or HEADER.unpack(header) != (MAGIC, LAYOUT_VERSION, self.capacity)
+            ):
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(
+                    self._fd, HEADER.pack(MAGIC, LAYOUT_VERSION, self.capacity), 0
+                )
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, self.size)
+        self._codes = np.frombuffer(
+            self._map, dtype=f"S{CODE_WIDTH}", count=self.capacity, offset=TABLE_OFFSET
+        )
+        self._rates = np.frombuffer(
+            self._map,
+            dtype=np.float64,
+            count=self.capacity,
+            offset=TABLE_OFFSET + self.capacity * CODE_WIDTH,
+        )
+        self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+
+    def close(self) -> None:
+        self._codes = None
+        self._rates = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        for fd in (self._lock_fd, self._fd):
+            if fd is not None:
+                os.close(fd)
+        self._fd = None
+        self._lock_fd = None
+        self.leader = False
+
+    def acquire_leadership(self) -> bool:
+        """
+        Becomes the leader if no other process is. Never blocks.
+
+        Returns:
+            bool: Whether this process is the leader.
+        """
+        if not self.leader and self._lock_fd is not None:
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            self.leader = True
+            logger.info("Leading rate refreshes for %s", self.path)
+        return self.leader
+
+    def _sequence(self) -> int:
+        return SEQUENCE.unpack_from(self._map, SEQUENCE_OFFSET)[0]
+
+    def next_snapshot_id(self) -> int:
+        """
+        Returns an id above every snapshot id written so far, so ids keep increasing across leader changes.
+        """
+        return SNAPSHOT.unpack_from(self._map, SNAPSHOT_OFFSET)[0] + 1
+
+    def write(self, matrix: RateMatrix) -> None:
+        """
+        Publishes a snapshot to the other workers. Only called by the leader.
+        """
+        codes = [code for code in matrix.codes if len(code.encode()) <= CODE_WIDTH]
+        if len(codes) > self.capacity or len(codes) < len(matrix.codes):
+            if not self._overflow_logged:
+                logger.warning(
+                    "Shared rate snapshot holds %d currencies of 8 bytes or less; %d were dropped",
+                    self.capacity,
+                    len(matrix.codes) - min(len(codes), self.capacity),
+                )
+                self._overflow_logged = True
+            codes = codes[: self.capacity]
+        rates = matrix.pivot_vector[[matrix.index[code] for code in codes]]
+        # A leader that died mid-write leaves the sequence odd; writing continues from there.
+        sequence = self._sequence() | 1
+        SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, sequence)
+        SNAPSHOT.pack_into(
+            self._map,
+            SNAPSHOT_OFFSET,
+            matrix.snapshot_id,
+            matrix.fetched_at.timestamp(),
+            len(codes),
+            matrix.pivot.encode(),
+        )
+        self._codes[: len(codes)] = codes
+        self._rates[: len(codes)] = rates
+        SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, sequence + 1)
+        self.last_sequence = sequence + 1
+
+    def read(self) -> Optional[RateMatrix]:
+        """
+        Returns the shared snapshot if it changed since the last read or write by this process.
+
+        Returns:
+            Optional[RateMatrix]: The new snapshot, or None if nothing new was written.
+        """
+        for _ in range(READ_ATTEMPTS):
+            sequence = self._sequence()
+            if sequence == self.last_sequence:
+                return None
+            if sequence & 1:
+                continue
+            snapshot_id, fetched_at, count, pivot = SNAPSHOT.unpack_from(
+                self._map, SNAPSHOT_OFFSET
+            )
+            codes = self._codes[:count].tolist()
+            rates = self._rates[:count].tolist()
+            if self._sequence() != sequence:
+                continue
+            self.last_sequence = sequence
+            return RateMatrix(
+                pivot.rstrip(b"\0").decode(),
+                {code.decode(): rate for code, rate in zip(codes, rates)},
+                datetime.fromtimestamp(fetched_at),
+                snapshot_id=snapshot_id,
+            )
+        logger.warning("Shared rate snapshot kept changing while being read")
+        return None
+
+
+shared_rate_snapshot = (
+    SharedRateSnapshot(
+        RATE_SHARED_SNAPSHOT_PATH,
+        RATE_SHARED_SNAPSHOT_CAPACITY,
+        RATE_SHARED_SNAPSHOT_POLL_SECONDS,
+    )
+    if RATE_SHARED_SNAPSHOT_PATH
+    else None
+)
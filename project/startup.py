@@ -0,0 +1,66 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from project.lazy_imports import install_lazy_imports
+
+logger = logging.getLogger(__name__)
+
+FAST_START = os.getenv("FAST_START", "false").lower() in ("1", "true", "yes")
+# Packages that only some routes or the background refresh need.
+FAST_START_LAZY_PACKAGES = ("prisma", "httpx")
+
+
+class StartupReport:
+    """
+    Times the stages between the project package being imported and the first response being sent.
+
+    Stages: "import" (project modules, up to the app being defined), "lifespan" (application startup),
+    "db_connect" (whenever the database is first connected, which in fast-start mode is the first request that
+    needs it) and "first_request" (the first request's own duration). "ready" is the time from the start of the
+    import to the end of the first response.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.first_route: Optional[str] = None
+        self.snapshot: str = "none"
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.setdefault(name, time.perf_counter() - started)
+
+    def imported(self) -> None:
+        self.stages["import"] = time.perf_counter() - self.started
+
+    def request_done(self, route: str, duration: float) -> None:
+        """
+        Records the first request and logs the report. Later calls do nothing.
+        """
+        if self.first_route is not None:
+            return
+        self.first_route = route
+        self.stages["first_request"] = duration
+        self.stages["ready"] = time.perf_counter() - self.started
+        logger.info("%s", self.summary())
+
+    def summary(self) -> str:
+        stages = ", ".join(
+            f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.stages.items()
+        )
+        return (
+            f"Startup ({'fast' if FAST_START else 'standard'} mode): {stages}; "
+            f"first request {self.first_route}; rate snapshot at startup: {self.snapshot}"
+        )
+
+
+startup_report = StartupReport()
+if FAST_START:
+    install_lazy_imports(FAST_START_LAZY_PACKAGES)
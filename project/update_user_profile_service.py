@@ -4,6 +4,9 @@ import prisma
 import prisma.models
 from pydantic import BaseModel
 
+from project.auth_token_cache import auth_token_cache
+from project.metrics import db_query
+
 
 class UserRole(BaseModel):
     """
@@ -55,7 +58,10 @@ async def update_user_profile(
         update_data["username"] = username
     if role:
         update_data["role"] = role
-    updated_user = await prisma.models.User.prisma().update(
-        where={"id": id}, data=update_data
-    )
+    with db_query("User", "update"):
+        updated_user = await prisma.models.User.prisma().update(
+            where={"id": id}, data=update_data
+        )
+    # Cached tokens carry the user's role, so drop them to pick up the change on next use.
+    auth_token_cache.invalidate_user(id)
     return UpdateUserProfileResponse(success=True, updatedUser=updated_user)
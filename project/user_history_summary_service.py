@@ -0,0 +1,70 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from project.conversion_rollups import conversion_rollups
+from project.view_user_history_service import format_timestamp
+
+
+class CurrencyPairSummary(BaseModel):
+    """
+    A user's conversion totals for one currency pair.
+    """
+
+    base_currency: str
+    target_currency: str
+    count: int
+    first_used: str
+    last_used: str
+    min_rate: float
+    max_rate: float
+    avg_rate: float
+
+
+class UserHistorySummaryResponse(BaseModel):
+    """
+    Totals of a user's conversion history, per currency pair, most used pair first.
+    """
+
+    user_id: str
+    total_conversions: int
+    pairs: List[CurrencyPairSummary]
+
+
+async def view_user_history_summary(user_id: str) -> UserHistorySummaryResponse:
+    """
+    Summarizes the conversion history of a user from the incrementally maintained rollups
+
+    Args:
+    user_id (str): The unique identifier for the user whose conversion history is being summarized.
+
+    Returns:
+    UserHistorySummaryResponse: Conversion count, first and last use, and minimum, maximum and average exchange rate
+    per currency pair, computed from one rollup row per pair rather than from the history rows.
+    """
+    pairs = await conversion_rollups.user_pairs(user_id)
+    summaries = [
+        CurrencyPairSummary.construct(
+            base_currency=base,
+            target_currency=target,
+            count=rollup.count,
+            first_used=format_timestamp(rollup.first_used_at),
+            last_used=format_timestamp(rollup.last_used_at),
+            min_rate=rollup.min_rate,
+            max_rate=rollup.max_rate,
+            avg_rate=rollup.sum_rate / rollup.count,
+        )
+        for (base, target), rollup in pairs.items()
+    ]
+    summaries.sort(
+        key=lambda summary: (
+            -summary.count,
+            summary.base_currency,
+            summary.target_currency,
+        )
+    )
+    return UserHistorySummaryResponse.construct(
+        user_id=user_id,
+        total_conversions=sum(rollup.count for rollup in pairs.values()),
+        pairs=summaries,
+    )
@@ -0,0 +1,258 @@
+"""
+Failover and quota accounting of the provider scheduler, against local stub providers.
+
+The providers are set on the scheduler directly, so no database is needed.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import prisma.models
+import pytest
+
+from benchmarks.stub_upstream import (
+    STUB_RATES,
+    StubRateProvider,
+    free_port,
+    start_stub_server,
+)
+from project.http_client import close_http_client
+from project.rate_provider_scheduler import (
+    ProviderScheduler,
+    ProviderState,
+    ProvidersUnavailableError,
+    TokenBucket,
+)
+
+WINDOW_SECONDS = 60.0
+COOLDOWN_SECONDS = 30.0
+
+
+def provider(
+    name: str, base_url: str, capacity: Optional[float] = None, tokens: float = 0.0
+) -> ProviderState:
+    return ProviderState(
+        id=name,
+        name=name,
+        base_url=base_url,
+        api_key="key",
+        bucket=TokenBucket(capacity, tokens, WINDOW_SECONDS),
+    )
+
+
+def scheduler(*providers: ProviderState) -> ProviderScheduler:
+    scheduler = ProviderScheduler(
+        "http://127.0.0.1:1",
+        "",
+        quota_window_seconds=WINDOW_SECONDS,
+        sync_interval_seconds=60,
+        failure_cooldown_seconds=COOLDOWN_SECONDS,
+    )
+    scheduler.providers = list(providers)
+    scheduler.loaded = True
+    return scheduler
+
+
+@asynccontextmanager
+async def serving(*apps):
+    """
+    Serves each stub on its own port and yields their base URLs.
+    """
+    servers, urls = [], []
+    for app in apps:
+        port = free_port()
+        servers.append(await start_stub_server(app, port))
+        urls.append(f"http://127.0.0.1:{port}")
+    try:
+        yield urls
+    finally:
+        await close_http_client()
+        for server in servers:
+            server.should_exit = True
+        # The stub servers' serve() tasks are the only other tasks left.
+        await asyncio.gather(
+            *(
+                task
+                for task in asyncio.all_tasks()
+                if task is not asyncio.current_task()
+            )
+        )
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def assert_cooling_down(state: ProviderState, at_least: float) -> None:
+    assert state.failures == 1
+    assert state.cooldown_until - time.monotonic() > at_least - 1
+
+
+def test_fails_over_on_transport_error():
+    async def scenario():
+        backup = StubRateProvider()
+        async with serving(backup) as (backup_url,):
+            # Nothing listens on this port, so connecting fails.
+            primary = provider("primary", f"http://127.0.0.1:{free_port()}")
+            secondary = provider("secondary", backup_url, capacity=100, tokens=50)
+            rates = await scheduler(primary, secondary).fetch_rates("USD")
+        assert rates["EUR"] == STUB_RATES["EUR"]
+        assert backup.requests == 1
+        assert_cooling_down(primary, COOLDOWN_SECONDS)
+        assert secondary.failures == 0
+
+    run(scenario())
+
+
+def test_fails_over_on_error_status():
+    async def scenario():
+        failing, backup = StubRateProvider(error_rate=1.0), StubRateProvider()
+        async with serving(failing, backup) as (failing_url, backup_url):
+            primary = provider("primary", failing_url)
+            secondary = provider("secondary", backup_url, capacity=100, tokens=50)
+            rates = await scheduler(primary, secondary).fetch_rates("EUR")
+        assert rates["EUR"] == 1.0
+        assert (failing.requests, backup.requests) == (1, 1)
+        assert_cooling_down(primary, COOLDOWN_SECONDS)
+
+    run(scenario())
+
+
+def test_fails_over_on_rate_limit_and_drains_quota():
+    async def scenario():
+        limited = StubRateProvider(
+            error_rate=1.0,
+            error_status=429,
+            error_headers={"Retry-After": "120"},
+        )
+        backup = StubRateProvider()
+        async with serving(limited, backup) as (limited_url, backup_url):
+            primary = provider("primary", limited_url, capacity=10, tokens=10)
+            secondary = provider("secondary", backup_url)
+            await scheduler(primary, secondary).fetch_rates("USD")
+        assert backup.requests == 1
+        assert primary.bucket.tokens < 1
+        # Retry-After is used as the cooldown instead of the default backoff.
+        assert_cooling_down(primary, 120)
+
+    run(scenario())
+
+
+def test_fails_over_on_error_body_with_status_200():
+    async def scenario():
+        broken = StubRateProvider(
+            error_rate=1.0,
+            error_status=200,
+            error_body={"success": False, "error": {"code": 101}},
+        )
+        backup = StubRateProvider()
+        async with serving(broken, backup) as (broken_url, backup_url):
+            primary = provider("primary", broken_url)
+            secondary = provider("secondary", backup_url, capacity=100, tokens=50)
+            rates = await scheduler(primary, secondary).fetch_rates("USD")
+        assert rates == STUB_RATES
+        assert_cooling_down(primary, COOLDOWN_SECONDS)
+
+    run(scenario())
+
+
+def test_raises_when_every_provider_fails():
+    async def scenario():
+        first, second = StubRateProvider(error_rate=1.0), StubRateProvider(
+            error_rate=1.0, error_status=503
+        )
+        async with serving(first, second) as (first_url, second_url):
+            with pytest.raises(ProvidersUnavailableError) as error:
+                await scheduler(
+                    provider("first", first_url), provider("second", second_url)
+                ).fetch_rates("USD")
+        assert "first: HTTP 500" in str(error.value)
+        assert "second: HTTP 503" in str(error.value)
+
+    run(scenario())
+
+
+def test_skips_provider_cooling_down():
+    async def scenario():
+        failing, backup = StubRateProvider(error_rate=1.0), StubRateProvider()
+        async with serving(failing, backup) as (failing_url, backup_url):
+            rate_scheduler = scheduler(
+                provider("primary", failing_url),
+                provider("secondary", backup_url, capacity=100, tokens=50),
+            )
+            await rate_scheduler.fetch_rates("USD")
+            await rate_scheduler.fetch_rates("USD")
+        assert (failing.requests, backup.requests) == (1, 2)
+
+    run(scenario())
+
+
+def test_skips_provider_without_quota():
+    async def scenario():
+        exhausted, backup = StubRateProvider(), StubRateProvider()
+        async with serving(exhausted, backup) as (exhausted_url, backup_url):
+            primary = provider("primary", exhausted_url, capacity=10, tokens=0)
+            secondary = provider("secondary", backup_url, capacity=10, tokens=10)
+            await scheduler(primary, secondary).fetch_rates("USD")
+        assert (exhausted.requests, backup.requests) == (0, 1)
+        assert secondary.bucket.tokens == pytest.approx(9, abs=0.01)
+        assert secondary.dirty
+
+    run(scenario())
+
+
+def test_bucket_acquire_and_refill():
+    bucket = TokenBucket(2, 2, WINDOW_SECONDS)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert bucket.headroom == pytest.approx(0, abs=0.01)
+    # Half a window later, half the capacity is back.
+    bucket._updated -= WINDOW_SECONDS / 2
+    assert bucket.headroom == pytest.approx(0.5, abs=0.01)
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_bucket_drain_and_observe_remaining():
+    bucket = TokenBucket(100, 80, WINDOW_SECONDS)
+    bucket.observe_remaining(40)
+    assert bucket.tokens == pytest.approx(40, abs=0.01)
+    bucket.observe_remaining(500)
+    assert bucket.tokens == 100
+    bucket.drain()
+    assert not bucket.try_acquire()
+
+
+def test_bucket_tops_up_at_reset():
+    reset_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    bucket = TokenBucket(10, 0, WINDOW_SECONDS, reset_at=reset_at)
+    assert bucket.headroom == 1.0
+    assert bucket.reset_at > datetime.now(timezone.utc)
+
+
+def test_unlimited_bucket_always_acquires():
+    bucket = TokenBucket(None, 0, WINDOW_SECONDS)
+    assert all(bucket.try_acquire() for _ in range(1000))
+    assert bucket.headroom == 1.0
+
+
+def test_sync_keeps_provider_dirty_when_write_fails(monkeypatch):
+    class FailingTable:
+        async def update(self, where, data):
+            raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(
+        prisma.models.ExternalAPIRateLimit,
+        "prisma",
+        classmethod(lambda cls: FailingTable()),
+    )
+    state = provider("primary", "http://127.0.0.1:1", capacity=10, tokens=5)
+    state.rate_limit_id = "limit"
+    state.dirty = True
+    with pytest.raises(ConnectionError):
+        run(scheduler(state).sync())
+    assert state.dirty